@@ -4,22 +4,127 @@ import pandas as pd
 import json
 from pathlib import Path
 from datetime import datetime
+from data.ot2_cloning.tip_inventory import commit_run, free_tips, load_inventory
+from data.ot2_cloning.well_allocator import allocate
+from data.ot2_cloning import catalog
+from data.ot2_cloning.plate_layout import DECK_FORMAT, from_wells, to_wells
+from data.ot2_cloning.workflow_schema import encode_columns
+from data.ot2_cloning.importer import import_plate, import_workflow, read_chunks
+from data.ot2_cloning.protocol_loader import ARCHIVE_DIR, index_archive, load_protocol, read_protocol
+from data.ot2_cloning.workflow_store import (FIXED_COLUMNS, add_column, apply_edits, column_order, drop_column,
+                                             fill_column, filter_rows, page_frame, row_count, used_columns)
+from data.ot2_cloning.export import DEFAULT_PARAMETER, DEFAULT_VOLUMES, tables_export
+from data.ot2_cloning.render import cached_protocol, render
+from data.ot2_cloning.simulation_pool import pending, submit, status as simulation_status_of
+from data.ot2_cloning.duration_model import workflow_seconds
+from data.ot2_cloning.validation import error
+
+# Title in the sidebar of MultiApp
+TITLE = "OT-2 Cloning"
+# Rows of a workflow table in its editor at once
+PAGE_ROWS = 50
+# Protocol parameters with a widget, by their state keys (see export.DEFAULT_PARAMETER)
+PARAMETER_KEYS = ["stop_reaction", "annealing", "pcr_extension", "tf_recovery", "tf_recovery_module",
+                  "tf_multichannel", "tf_dilution", "notify_lead_time"]
+
+# Tables of new workflows, copied into the session
+INITIAL_TABLES = {
+    "PCR": pd.DataFrame({
+                "Name": [None],
+                "0": [None],
+                "1": [None],
+                "2": [None],
+                "A_enzyme": ["[E]PCRmix"],
+                "DW": ["[E]DW"],
+            }),
+    "Gibson": pd.DataFrame({
+                "Name": [None],
+                "0": [None],
+                "1": [None],
+                "A_enzyme": ["[E]Gibsonmix"],
+                "DW": ["[E]DW"],
+            }),
+    "GGA": pd.DataFrame({
+                "Name": [None],
+                "0": [None],
+                "1": [None],
+                "2": [None],
+                "3": ["[E]BsaI"],
+                "4": ["[E]T4_ligase"],
+                "A_enzyme": ["[E]Buffer"],
+                "DW": ["[E]DW"],
+            })
+    }
+
+
+# Inputs of fragments, cached on loaded projects and their mtime so reruns do not read projects again
+def project_versions(projects):
+    return tuple((name, (catalog.PROJECT_DIR / f"{name}.json").stat().st_mtime_ns) for name in projects)
+
+
+@st.cache_data
+def loaded_build(versions):
+    build = {}
+    for project, _ in versions:
+        js = catalog.load_project(project)
+        for key in js['Build'].keys():
+            build.setdefault(key, {}).update(js['Build'][key])
+    return build
+
+
+@st.cache_data
+def loaded_plates(versions, tf):
+    # {well: value} of Source plates and Destination plate
+    # Products fill whole columns, right column free for CP cells (see well_allocator.py)
+    layout = allocate(loaded_build(versions), tf=tf)
+    return layout["Source"] or [{}], layout["Destination"]
+
+
+@st.cache_data
+def loaded_workflow_table(versions, task):
+    # Load table by workflow
+    df = pd.DataFrame()
+    for project, _ in versions:
+        js = catalog.load_project(project)
+        if not task in js['Build'].keys():
+            continue
+        new_df = pd.DataFrame(js['Build'][task]).T.reset_index(names=["Name"])
+        df = pd.concat([df, new_df], axis=0, ignore_index=True)
+    return df
+
+
+@st.cache_data
+def volume_table(task, columns, volumes=()):
+    # `volumes` (column, uL) of a loaded protocol are kept over default volumes
+    df = pd.DataFrame({column: [None] for column in columns}, dtype=object)
+    for column, volume in [*DEFAULT_VOLUMES.get(task, {}).items(), *volumes]:
+        df.loc[0, column] = volume
+    df.index.name = 'Index'
+    return df[column_order(df.columns)]
+
+@st.cache_data
+def archive_index(mtime_ns):
+    # Index of the protocol archive, read again when protocols are added or removed
+    # (`mtime_ns` of the folder), not on every rerun
+    return index_archive(ARCHIVE_DIR, workers=1)
+
+
+def archive_mtime():
+    return ARCHIVE_DIR.stat().st_mtime_ns if ARCHIVE_DIR.is_dir() else 0
 
 # def
 def main():    
     def check_project():
-        return list(Path("data/project").glob('*.json'))
+        # Indexed project catalog, filtered by the search text
+        return catalog.search(state.get('project_search', ''))
 
     def load_project(value: Path):
-        with open(value, 'r') as f:
-            project_json = json.load(f)
-        
         # Duplicate check
         if str(value.stem) in state.loaded_project['Project'].values:
             return
         
         state.loaded_project = \
-            pd.concat([state.loaded_project, pd.DataFrame({'Project':[str(value.stem)], 'Task': ', '.join(project_json['Build'].keys()) + ', Transformation'})], axis=0)
+            pd.concat([state.loaded_project, pd.DataFrame({'Project':[str(value.stem)], 'Task': catalog.tasks(value.stem)})], axis=0)
 
     def add_workflow(value):
         tmp = [i.startswith(value) for i in state.new_workflow]
@@ -37,43 +142,36 @@ def main():
         if key not in state:
             state[key] = value
 
-    def empty_plate_df(plate_type='96well'):
-        if plate_type == '96well':
-            rows = ["A", "B", "C", "D", "E", "F", "G", "H"]
-            columns = [str(i) for i in range(1, 13)]     
-            
-            long_columns = ['Value']
-            long_rows = [i+j for j in columns for i in rows]
-            
-            plate_df = pd.DataFrame(index=long_rows, columns=long_columns)
-            plate_df.index.name = 'well'
-            return plate_df
-
-    def toggle_change(key):
-        state_toggle = state[f'{key}_toggle']
-        state_edit = state[f'{key}_edit_plate']
-        
-        if state_toggle:
-            state[f'{key}_plate'] = plate_transformation(state_edit, 'wide')
-        else:
-            state[f'{key}_plate'] = plate_transformation(state_edit, 'long')
+    def toggle_change(key, editor):
+        # Edits become the plate, the editor starts again in the other form
+        state[f'{key}_wells'] = state[f'{key}_values']
+        state.pop(editor, None)
 
-    def plate_table(plate_type, use_name=True, loaded_table=False, TF=False):
+    # Tables are fragments, editing one reruns only its fragment
+    @st.fragment
+    def plate_table(plate_type, use_name=True, loaded_table=False, TF=False, max_plates=3):
         with st.expander(f"{plate_type}", expanded=True):
             st.number_input(f"Number of {plate_type} plate",
-                            min_value=1, step=1, max_value=3,
-                            key=f"{plate_type}_num")
+                            min_value=1, step=1, max_value=max_plates,
+                            key=f"{plate_type}_num",
+                            help="Plates more than free deck slots are swapped during the run" if max_plates > 3 else None)
             
             plates = st.tabs([f"{plate_type}_Plate_{i+1}" for i in range(state[f"{plate_type}_num"])])
             
             for n in range(len(plates)):
-                if n > 0:
-                    state_initiation(f'{plate_type}_{n+1}_plate', empty_plate_df())
+                # Plates are kept as {well: value} of filled wells (see plate_layout.py)
+                # _wells: table of the editor, _values: with edits
+                if type(loaded_table) == list:
+                    # Allocated plates, one table for each
+                    state_initiation(f'{plate_type}_{n+1}_wells',
+                                     loaded_table[n] if n < len(loaded_table) else {})
+                elif n > 0:
+                    state_initiation(f'{plate_type}_{n+1}_wells', {})
                 elif type(loaded_table) != bool:
-                    state_initiation(f'{plate_type}_{n+1}_plate', loaded_table)
+                    state_initiation(f'{plate_type}_{n+1}_wells', loaded_table)
                 else:
-                    state_initiation(f'{plate_type}_{n+1}_plate', empty_plate_df())
-                state_initiation(f'{plate_type}_{n+1}_edit_plate', None)
+                    state_initiation(f'{plate_type}_{n+1}_wells', {})
+                state_initiation(f'{plate_type}_{n+1}_values', state[f'{plate_type}_{n+1}_wells'])
                 state_initiation(f'{plate_type}_{n+1}_toggle', False)
                 
                 with plates[n]:
@@ -86,107 +184,240 @@ def main():
                             st.text_input("Name",
                                         key=f"{plate_type}_plate_{n+1}_name",
                                         value=f'{datetime.now().strftime("%y%m%d")}_{plate_type}_{n+1}')
-                    if st.toggle("Wide form", value=False, key=f'{plate_type}_{n+1}_toggle',
-                                on_change=toggle_change,
-                                kwargs={'key':f'{plate_type}_{n+1}'}):
-                        state[f'{plate_type}_{n+1}_edit_plate'] = st.data_editor(state[f'{plate_type}_{n+1}_plate'], key=f"{plate_type}_plate_{n+1}_editor",
-                                                                                num_rows='fixed')
-                    else:
-                        state[f'{plate_type}_{n+1}_edit_plate'] = st.data_editor(state[f'{plate_type}_{n+1}_plate'], key=f"{plate_type}_plate_{n+1}_editor",
-                                                                                num_rows='fixed')
+                            st.selectbox("Agar",
+                                        options=["96well", "omnitray", "24well", "12well", "6well"],
+                                        key=f"{plate_type}_plate_{n+1}_agar",
+                                        help='Spots are packed into each well of multi-well agar plates and omnitrays')
+                    wide = st.toggle("Wide form", value=False, key=f'{plate_type}_{n+1}_toggle',
+                                     on_change=toggle_change,
+                                     kwargs={'key': f'{plate_type}_{n+1}', 'editor': f"{plate_type}_plate_{n+1}_editor"})
+                    # DataFrame only for the editor shown
+                    edited = st.data_editor(from_wells(state[f'{plate_type}_{n+1}_wells'], wide=wide),
+                                            key=f"{plate_type}_plate_{n+1}_editor",
+                                            num_rows='fixed')
+                    state[f'{plate_type}_{n+1}_values'] = to_wells(edited)
+
+    def apply_page_edits(workflow, editor, rows):
+        # Changes of the page editor go to the table, a new editor shows the page again
+        apply_edits(state[f'{workflow}_data'], rows, state[editor])
+        state[f'{workflow}_version'] += 1
+
+    def searched_rows(workflow):
+        # Rows of the table matching the search widgets of the workflow
+        column = state.get(f'{workflow}_search_column', "All")
+        return filter_rows(state[f'{workflow}_data'], state.get(f'{workflow}_search', ""),
+                           None if column == "All" else column)
+
+    def column_operation(workflow, operation):
+        # Bulk operation of workflow_store on the table, then a new editor
+        # Column, value and search are read from their widgets when the button is clicked,
+        # args of the button were bound when the page was drawn
+        data = state[f'{workflow}_data']
+        target = state.get(f'{workflow}_bulk_column')
+        if operation is add_column:
+            add_column(data)
+        elif target not in data:
+            return
+        elif operation is fill_column:
+            fill_column(data, target, state.get(f'{workflow}_bulk_value', ""), searched_rows(workflow))
+        elif target not in FIXED_COLUMNS:
+            drop_column(data, target)
+        state[f'{workflow}_version'] += 1
 
+    @st.fragment
     def workflow_table(workflow, loaded_table=False):
         with st.expander(f'{workflow}', expanded=True):        
+            # Tables are kept as {column: [values]} (see workflow_store.py),
+            # the editor gets one page of rows and its edits are applied to them
             if type(loaded_table) != bool:
-                state_initiation(key=f'{workflow}_table', value=loaded_table)
+                state_initiation(key=f'{workflow}_data', value=encode_columns(loaded_table))
             else:
-                state_initiation(key=f'{workflow}_table', value=initial_tables[f'{workflow.split("_")[0]}'])
-            
-            state[f'{workflow}_edit_table'] = st.data_editor(state[f'{workflow}_table'], key=f'{workflow}_editor',
+                state_initiation(key=f'{workflow}_data', value=encode_columns(INITIAL_TABLES[f'{workflow.split("_")[0]}']))
+            state_initiation(key=f'{workflow}_version', value=0)
+            data = state[f'{workflow}_data']
+
+            search = st.columns([3, 2, 1])
+            search[0].text_input("Search", key=f'{workflow}_search', help='Name or material')
+            search[1].selectbox("In", ["All"] + column_order(data), key=f'{workflow}_search_column')
+            matched = searched_rows(workflow)
+            pages = max(1, -(-len(matched) // PAGE_ROWS))
+            if state.get(f'{workflow}_page', 1) > pages:
+                state[f'{workflow}_page'] = pages
+            page = search[2].number_input("Page", min_value=1, max_value=pages, step=1, key=f'{workflow}_page')
+            rows = matched[(page - 1) * PAGE_ROWS:page * PAGE_ROWS]
+
+            editor = f"{workflow}_editor_{state[f'{workflow}_version']}"
+            st.data_editor(page_frame(data, rows), key=editor,
                         use_container_width=True,
                         hide_index=True,
-                        num_rows='dynamic')
-            
-            if st.button("Add Column", key=f"{workflow}_plate_addcolumn"):
-                # state[f'{workflow}_table'] = state[f'{workflow}_edit_table']
-                # dataframe add column
-                df = state[f'{workflow}_edit_table']
-                assert len(df.columns) < 10, "ERROR1: Not allowed more than 10 columns"
-                
-                df.loc[:, str(len(df.columns)-3)] = [None for _ in range(len(df.index))]
-                df.set_index('Name', inplace=True)
-                df = df[sorted(df.columns)]
-                df.reset_index(inplace=True)
-                state[f'{workflow}_table'] = df                
+                        num_rows='dynamic',
+                        on_change=apply_page_edits,
+                        kwargs={'workflow': workflow, 'editor': editor, 'rows': rows})
+            st.caption(f"{len(matched)} of {row_count(data)} reactions, page {page} of {pages}")
+
+            # Bulk operations on columns, fill is for all rows of the search
+            bulk = st.columns([2, 2, 1, 1, 1])
+            target = bulk[0].selectbox("Column", column_order(data)[1:], key=f'{workflow}_bulk_column')
+            bulk[1].text_input("Value", key=f'{workflow}_bulk_value', help='Empty value clears the cells')
+            bulk[2].button("Fill", key=f"{workflow}_fill", help='Fill the column of all searched rows',
+                           on_click=column_operation, args=(workflow, fill_column))
+            bulk[3].button("Add Column", key=f"{workflow}_plate_addcolumn",
+                           on_click=column_operation, args=(workflow, add_column))
+            bulk[4].button("Remove", key=f"{workflow}_removecolumn", disabled=target in FIXED_COLUMNS,
+                           on_click=column_operation, args=(workflow, drop_column))
+
+            # Volume table follows used columns, rerun the page when they change
+            columns = used_columns(data)
+            if state.get(f'{workflow}_columns', columns) != columns:
+                state[f'{workflow}_columns'] = columns
                 st.rerun()
+            state[f'{workflow}_columns'] = columns
 
-    def plate_transformation(df, data_form):
-        # Change data form to [long or wide]
-        assert data_form in ["wide", "long"], "Plate_transformation: data_form Error"
-        if data_form == "long":
-            new_df = (
-                df.reset_index()
-                .melt(id_vars=["index"], value_name="Value")
-                .rename(columns={"index": "Row", "variable": "Column"})
-            )
-            new_df["well"] = new_df["Row"] + new_df["Column"].astype(str)
-            new_df = new_df.set_index("well")["Value"].to_frame()
-
-            return new_df
-
-        elif data_form == "wide":
-            new_df = df.reset_index()
-            new_df[["Row", "Column"]] = new_df["well"].str.extract(r"([A-Z]+)(\d+)")
-            new_df["Column"] = new_df["Column"].astype(int)
-            new_df = new_df[["Row", "Column", "Value"]]
-
-            new_df = new_df.pivot(index="Row", columns="Column", values="Value").sort_index(
-                axis=1
-            )
-            new_df.columns.name = None
-            new_df.index.name = None
-
-            return new_df
-
-    def enzyme_position(enzyme_list):
-        # 24-well position
-        enzyme_list = enzyme_list
-        well_position = ["A1", "A2", "A3", "A4", "A5", "A6", "B1", "B2", "B3", "B4", "B5", "B6", "C1", "C2", "C3", "C4", "C5", "C6", "D1", "D2", "D3", "D4", "D5", "D6"]
-        return_dict = {}
-        for enzyme, well in zip(enzyme_list, well_position):
-            return_dict[enzyme] = well
-        return return_dict
-
-    def deck_position(plates, additional_plate: list):
-        position = [1,2,3,4,5,6,9]
-        
-        deck_dict = {}
-        deck_dict["Enzyme_tube"] = position.pop(0)
-        deck_dict["p20_tip"] = position.pop(0)
-        deck_dict["p300_tip"] = position.pop(0)
-        
-        for key in plates.keys():
-            # OT-2
-            if plates[key]["type"] == "Destination":
-                deck_dict[key] = 7
+    def open_protocol(export_json):
+        # Session of a loaded protocol: New Task with its workflows, plates, tables, volumes and parameters
+        workflows = export_json["Meta"]["workflow"]
+        state.loaded_project = pd.DataFrame({'Project':[], 'Task':[]}, index=None)
+        state.new_workflow = list(workflows)
+        # Multiselect starts again with the new workflows
+        state.pop('select_workflow', None)
+        state.make_workflows = True
+        for workflow in workflows:
+            if workflow.startswith('Transformation'):
                 continue
-            try:
-                deck_dict[key] = position.pop(0)
-            except:
-                raise "Deck is already Full. Reduce Plates"
-        
-        if additional_plate:
-            for key in additional_plate:
-                try:
-                    deck_dict[key] = position.pop(0)
-                except:
-                    raise "Deck is already Full. Reduce Plates"
-        
-        return deck_dict
+            state[f'{workflow}_data'] = dict(export_json["Workflow"][workflow]["data"])
+            state[f'{workflow}_version'] = state.get(f'{workflow}_version', 0) + 1
+            state[f'{workflow}_loaded_volume'] = {column: f"{volume:g}" for column, volume
+                                                  in export_json["Workflow_volume"].get(workflow, {}).items()}
+            state.pop(f'{workflow}_volume', None)
+            state.pop(f'{workflow}_page', None)
+            state.pop(f'{workflow}_columns', None)
+
+        counts = {}
+        for key, plate in export_json["Plate"].items():
+            plate_type, _, n = key.rpartition('_')
+            counts[plate_type] = max(counts.get(plate_type, 0), int(n))
+            # Same dict for both, like a plate which was not edited yet
+            state[f'{key}_wells'] = state[f'{key}_values'] = dict(plate["data"])
+            state.pop(f"{plate_type}_plate_{n}_editor", None)
+            if plate.get("agar"):
+                state[f"{plate_type}_plate_{n}_agar"] = plate["agar"]
+        for plate_type, count in counts.items():
+            state[f"{plate_type}_num"] = count
+
+        parameter = export_json.get("Parameter", {})
+        for key in PARAMETER_KEYS:
+            state[key] = parameter.get(key, DEFAULT_PARAMETER[key])
+        state.cold_module = bool(export_json.get("Deck", {}).get("Cold_position"))
+
+    def load_uploaded_protocol():
+        state.load_error = None
+        if state.load is None:
+            return
+        try:
+            open_protocol(load_protocol(state.load.getvalue().decode("utf-8"), state.load.name))
+        except (UnicodeDecodeError, ValueError) as e:
+            state.load_error = f"{state.load.name}: {e}"
+
+    def load_archived_protocol():
+        state.load_error = None
+        try:
+            open_protocol(read_protocol(ARCHIVE_DIR / state.archive_protocol))
+        except (OSError, ValueError) as e:
+            state.load_error = f"{state.archive_protocol}: {e}"
+
+    def record_tip_usage():
+        # Tips picked up by a run, from the trace it left in the user storage of the robot
+        state.tip_message = None
+        if state.tip_trace is None:
+            return
+        try:
+            commit_run(json.loads(state.tip_trace.getvalue()))
+            state.tip_message = f"{state.tip_trace.name}: tip inventory updated"
+        except (UnicodeDecodeError, ValueError, KeyError) as e:
+            state.tip_message = f"{state.tip_trace.name}: {e}"
+
+    def import_targets():
+        # Workflow tables and plates of the session, by their state keys
+        workflows = [workflow for workflow in state.workflow if not workflow.startswith('Transformation')]
+        return workflows + sorted(key[:-len('_wells')] for key in state.keys() if str(key).endswith('_wells'))
+
+    def import_table():
+        # Rows of the file go into the table or plate of the target, bad rows are reported
+        file, target = state.import_file, state.import_target
+        state.import_errors = []
+        if file is None or target is None:
+            return
+        file.seek(0)
+        try:
+            chunks = read_chunks(file, file.name)
+            if f'{target}_data' in state:
+                first = {column: values[0] for column, values in state[f'{target}_data'].items() if values}
+                data, errors = import_workflow(chunks, defaults={k: first.get(k) for k in ['A_enzyme', 'DW']})
+                state[f'{target}_data'] = data
+                state[f'{target}_version'] += 1
+            else:
+                wells, errors = import_plate(chunks, plate_type=DECK_FORMAT)
+                # Same dict for both, like a plate which was not edited yet
+                state[f'{target}_wells'] = state[f'{target}_values'] = wells
+                plate_type, _, n = target.rpartition('_')
+                state.pop(f"{plate_type}_plate_{n}_editor", None)
+        except ValueError as e:
+            code = str(e).split(':')[0] if str(e).startswith('ERROR') else 'ERROR'
+            errors = [{"code": code, "item": file.name, "message": str(e)}]
+        state.import_errors = errors
+
+    @st.fragment
+    def volume_editor(workflow):
+        st.markdown(f'### {workflow} volume')
+        df = volume_table(workflow.split('_')[0], state[f'{workflow}_columns'],
+                          tuple(state.get(f'{workflow}_loaded_volume', {}).items()))
+        state[f"{workflow}_edit_volume"] = st.data_editor(df, use_container_width=False, key=f"{workflow}_volume",
+                                                          hide_index=True,
+                                                          num_rows='fixed')
+
+    @st.fragment
+    def project_loader():
+        st.markdown("## Load Project")
+        st.text_input("Search", key='project_search',
+                      help='Project name, product or material')
+        state.project = check_project()
+        for name, message in catalog.unreadable().items():
+            st.warning(f"Project `{name}` can not be read: {message}")
+        st.selectbox("Saved Project", state.project,
+                    format_func=lambda x: x.stem,
+                    key='select_project')
+
+        if st.button("Load", key='load_project', type='secondary'):
+            load_project(state.select_project)
+            # New Task and tables depend on loaded projects
+            st.rerun()
+
+    def simulation_status(polling=False):
+        result = simulation_status_of(state.protocol_key)
+        if polling and result["status"] not in ["queued", "running"]:
+            # Done, rerun the page once to stop polling
+            st.rerun()
+        if result["status"] in ["queued", "running"]:
+            st.info(f"Simulation {result['status']}...")
+        elif result["status"] == "passed":
+            st.success(f"Simulation passed ({result['seconds']} s)")
+        elif result["status"] == "unavailable":
+            st.warning(result["log"])
+        else:
+            st.error(result["error"] or "Simulation failed")
+            with st.expander("Simulation log"):
+                st.code(result["log"])
+        # Planned run time and tips of the export, tips picked up by the simulation
+        seconds = sum(total for _, total in workflow_seconds(state.export_JSON, state.export_JSON["Calibration"]).values())
+        planned = state.export_JSON["Parameter"]["num_of_tips"]
+        st.dataframe(pd.DataFrame([
+            {"Item": "Estimated run time", "Planned": f"{int(seconds // 3600)} h {int(seconds % 3600 // 60)} min", "Simulated": ""},
+        ] + [
+            {"Item": f"{pipette} tips", "Planned": str(count), "Simulated": str(result.get("tips", {}).get(pipette, ""))}
+            for pipette, count in planned.items()
+        ]), hide_index=True)
 
     # Statics
-    if 'project' not in state:
-        state.project = check_project()
     if 'new_workflow' not in state:
         state.new_workflow = []
     if 'loaded_project' not in state:
@@ -202,47 +433,10 @@ def main():
     scenarios = ['gga-tf']
 
     workflows = ['PCR', 'Gibson', 'GGA', 'TF']
-    initial_tables = {
-        "empty": empty_plate_df(),
-        "PCR": pd.DataFrame({
-                    "Name": [None],
-                    "0": [None],
-                    "1": [None],
-                    "2": [None],
-                    "A_enzyme": ["[E]PCRmix"],
-                    "DW": ["[E]DW"],
-                }),
-        "Gibson": pd.DataFrame({
-                    "Name": [None],
-                    "0": [None],
-                    "1": [None],
-                    "A_enzyme": ["[E]Gibsonmix"],
-                    "DW": ["[E]DW"],
-                }),
-        "GGA": pd.DataFrame({
-                    "Name": [None],
-                    "0": [None],
-                    "1": [None],
-                    "2": [None],
-                    "3": ["[E]BsaI"],
-                    "4": ["[E]T4_ligase"],
-                    "A_enzyme": ["[E]Buffer"],
-                    "DW": ["[E]DW"],
-                })
-        }
-
     # Main
     col1 = st.columns([1, 2])
     with col1[0]:
-        st.markdown("## Load Project")
-        st.selectbox("Saved Project", state.project,
-                    format_func=lambda x: x.stem,
-                    key='select_project')
-
-        st.button("Load", key='load_project',
-                type='secondary',
-                on_click=load_project,
-                kwargs={'value': state.select_project})
+        project_loader()
 
     no_use_new_task = bool(len(state.loaded_project))
     with col1[1]:
@@ -279,7 +473,20 @@ def main():
                 st.error("Workflows are already loaded please Restart App.")
             state.make_workflows = True
 
-    st.file_uploader("## Load previous result", type=['py'],key="load", disabled=True, help="Load previous result to modify")
+    load_col = st.columns([1, 1])
+    load_col[0].file_uploader("## Load previous result", type=['py'], key="load",
+                              help="Load previous result to modify, the protocol is read without running it",
+                              on_change=load_uploaded_protocol)
+    with load_col[1]:
+        # Parsed in this process, the CLI indexes large archives in parallel
+        archive = archive_index(archive_mtime())
+        st.selectbox("Previous protocols", [name for name, entry in archive.items() if not entry["error"]],
+                     index=None, key='archive_protocol',
+                     format_func=lambda name: f"{name} ({', '.join(archive[name]['workflow'])})",
+                     help=f'Protocols in {ARCHIVE_DIR}')
+        st.button("Open", on_click=load_archived_protocol, disabled=state.get('archive_protocol') is None)
+    if state.get('load_error'):
+        st.error(state.load_error)
     st.dataframe(state.loaded_project, use_container_width=True, hide_index=True)
     st.markdown('---')
 
@@ -289,33 +496,18 @@ def main():
         
         # 호출 시 Project 데이터를 받아오기 위해 필요함
         if state.make_workflows:
-            source, dest = [], []
-            for project in state.loaded_project['Project']:
-                with open(f'data/project/{project}.json', 'r') as f:
-                    js = json.load(f)
-                    for key in js['Build'].keys():
-                        source += list(js['Build'][key].values())
-                        dest += list(js['Build'][key].keys())
+            versions = project_versions(state.loaded_project['Project'])
             try:
-                source = sum(source, [])
-                dest = sum(dest, [])
-            except:
-                pass
-            source = list(dict.fromkeys(source))
-            dest = list(dict.fromkeys(dest))
-            
-            source = [i for i in source if not i.startswith('[E]')]
-            source = [i for i in source if i not in dest]
-            
-            source_df = empty_plate_df()
-            source_df.iloc[:len(source), 0] = source
-            dest_df = empty_plate_df()
-            # 짝수 줄 건너뛰게 해야 함
-            dest_df.iloc[:len(dest), 0] = dest
-            
+                source_wells, dest_wells = loaded_plates(versions, tf=bool(len(state.loaded_project)))
+            except ValueError as e:
+                # Products of the projects do not fit the Destination plate (see well_allocator.py)
+                state.export_errors = [error("ERROR14", "Destination", str(e))]
+                source_wells, dest_wells = [{}], {}
+            state_initiation("Source_num", len(source_wells))
+
             # Source Plate Module
-            plate_table("Source", use_name=True, loaded_table=source_df)
-            plate_table("Destination", use_name=False, loaded_table=dest_df)
+            plate_table("Source", use_name=True, loaded_table=source_wells, max_plates=12)
+            plate_table("Destination", use_name=False, loaded_table=dest_wells)
 
     with mid_col[1]:
         st.markdown('## Workflow')
@@ -345,16 +537,35 @@ def main():
                     if workflow.split('_')[0] == 'Transformation':
                         plate_table(workflow, use_name=True)
                     else:
-                        # Load table by workflow
-                        df = pd.DataFrame()
-                        for project in state.loaded_project['Project']:
-                            with open(f'data/project/{project}.json', 'r') as f:
-                                js = json.load(f)
-                                if not workflow.split('_')[0] in js['Build'].keys():
-                                    continue
-                                new_df = pd.DataFrame(js['Build'][workflow.split('_')[0]]).T.reset_index(names=["Name"])
-                                df = pd.concat([df, new_df], axis=0, ignore_index=True)
-                        workflow_table(workflow, loaded_table=df)
+                        versions = project_versions(state.loaded_project['Project'])
+                        workflow_table(workflow, loaded_table=loaded_workflow_table(versions, workflow.split('_')[0]))
+
+    # Import
+    if state.make_workflows:
+        with st.expander("Import tables", expanded=False):
+            import_col = st.columns([2, 1, 1])
+            import_col[0].file_uploader("CSV or Excel file", type=['csv', 'xlsx'], key='import_file',
+                                        help='Reactions (Name, 0, 1, ..., A_enzyme, DW) or a plate map (long or wide form)')
+            import_col[1].selectbox("Into", import_targets(), key='import_target',
+                                    help='Rows replace the workflow table or plate')
+            import_col[2].button("Import", on_click=import_table, use_container_width=True,
+                                 disabled=state.get('import_file') is None)
+            if state.get('import_errors'):
+                st.error(f"{len(state.import_errors)} rows not imported, fix them and Import again")
+                st.dataframe(pd.DataFrame(state.import_errors)[["code", "item", "message"]], hide_index=True)
+
+    # Tips used by runs (see tip_inventory.py)
+    with st.expander("Tip inventory", expanded=False):
+        st.file_uploader("Run trace (*.trace.json)", type=['json'], key='tip_trace', on_change=record_tip_usage,
+                         help='Trace of a run from /data/user_storage of the robot, '
+                              'its tips are marked as used (also when the run stopped early)')
+        if state.get('tip_message'):
+            st.info(state.tip_message)
+        racks = load_inventory()["racks"]
+        st.dataframe(pd.DataFrame([
+            {"Rack": rack_id, "Type": rack["type"], "Free tips": len(free_tips(rack))}
+            for rack_id, rack in racks.items()
+        ], columns=["Rack", "Type", "Free tips"]), hide_index=True)
 
     # Parameters
     st.markdown('---')
@@ -362,241 +573,179 @@ def main():
     with st.expander("Parameters", expanded=True):
         if state.make_workflows:
             st.success("Please adjust here as last step")
+            # Defaults once, widgets keep values of the session (set by loaded protocols)
+            for key in PARAMETER_KEYS:
+                state_initiation(key, DEFAULT_PARAMETER[key])
+            state_initiation('cold_module', False)
             # Reaction-PCR: DNA, Enzyme, DW(up to)
             # Reaction-Assembly: DNA, Enzyme, DW(up to)
 
             for workflow in state.workflow:
                 if workflow.startswith('Transformation'):
                     continue
-                st.markdown(f'### {workflow} volume')
-                df = (state[f"{workflow}_edit_table"]
-                    .drop(["Name"], axis=1, inplace=False)
-                    .dropna(axis=1, how='all')
-                    .reset_index(drop=True, inplace=False))
-                
-                # remove all values in df
-                df = df.iloc[[0], :]
-                df.loc[:, :] = None
-                
-                if workflow.startswith('PCR'):
-                    df.loc[0, ['0', '1', '2', 'A_enzyme', 'DW']] = ['1', '0.5', '0.5', '12.5', '10.5']
-                elif workflow.startswith('Gibson'):
-                    df.loc[0, ['0', '1', 'A_enzyme', 'DW']] = ['2', '2', '5', '1']
-                elif workflow.startswith('GGA'):
-                    df.loc[0, ['0', '1', '2', '3', '4', 'A_enzyme', 'DW']] = ['1', '1', '1', '1', '0.5', '2.5', '3']
-                
-                df.index.name = 'Index'
-                df = df[sorted(df.columns)]
-                state[f"{workflow}_edit_volume"] = st.data_editor(df, use_container_width=False, key=f"{workflow}_volume",
-                                                                  hide_index=True,
-                                                                  num_rows='fixed')
+                volume_editor(workflow)
             
             
-            st.checkbox('Stop between Reactions', value=True,
+            st.checkbox('Stop between Reactions',
                         key='stop_reaction',
-                        help='If you want to stop between reactions for take enzymes, check this box')
+                        help='Stop only where enzymes must be loaded (planned by on-deck stability of enzymes)')
+            st.checkbox('Temperature module for enzymes',
+                        key='cold_module',
+                        help='Keep cold-sensitive enzymes at 4 degree on a free slot for fewer stops')
 
             advanced_column = st.columns([1,1])
             with advanced_column[0]:
                 with st.container(border=True):
-                    st.number_input("Annealing temperature", min_value=45, step=1, value=57,
+                    st.number_input("Annealing temperature", min_value=45, step=1,
                                     key='annealing')
-                    st.number_input("PCR extension time (seconds)", min_value=1, step=1, value=25,
+                    st.number_input("PCR extension time (seconds)", min_value=1, step=1,
                                     key='pcr_extension')
-                    st.number_input("TF Recovery time (minutes)", min_value=0, step=1, value=40,
+                    st.number_input("TF Recovery time (minutes)", min_value=0, step=1,
                                     key='tf_recovery')
-
-    end_col = st.columns([1,1])
-    with end_col[0]:
-        if st.button("Make Protocol", type="primary",
-                    disabled = not state.make_workflows):
-            state.make_json = True
+                    st.selectbox("TF Recovery on", ["thermocycler", "temperature", "heatershaker"],
+                                 format_func={"thermocycler": "Thermocycler",
+                                              "temperature": "Temperature module",
+                                              "heatershaker": "Heater-shaker"}.get,
+                                 key='tf_recovery_module',
+                                 help='Recovery on a module frees the thermocycler for the next workflow')
+                    st.checkbox("8-channel Transformation",
+                                key='tf_multichannel',
+                                help='Swap to 8-channel pipettes for Transformation, CP cell and SOC from the reservoir. '
+                                     'CP cells go to the right column of products, keep it empty. '
+                                     'Product columns not full of samples are done single-channel')
+                    st.number_input("TF dilution steps", min_value=0, max_value=3, step=1,
+                                    key='tf_dilution',
+                                    help='10-fold dilutions before spotting. Repeated spots of a sample on agar are its dilution steps')
+            with advanced_column[1]:
+                with st.container(border=True):
+                    st.number_input("Notification lead time (minutes)", min_value=0, step=1,
+                                    key='notify_lead_time',
+                                    help='Messenger warns this long before the next user action (ETA from running time model)')
+
+    # Export reruns alone: Make Protocol, deck setup, download and simulation
+    @st.fragment
+    def export_section():
+        end_col = st.columns([1,1])
+        with end_col[0]:
+            if st.button("Make Protocol", type="primary",
+                        disabled = not state.make_workflows):
+                state.make_json = True
         
-        if state.make_json:
-            state.export_JSON = {
-                "Meta": {},
-                "Plate": {},
-                "Workflow": {},
-                "Workflow_volume": {},
-                "Deck": {},
-                "Parameter": {},
-            }
-            
-            # Meta
-            state.export_JSON["Meta"] = {
-                "Task": "OT-2 cloning",
-                "version": "2.1",
-                "workflow": state.workflow,
-                "Messenger": "kun"
-            }
-            plate_types = ["Source", "Destination"]
-            for plate_type in plate_types:
-                for n in range(state[f"{plate_type}_num"]):
-                    if state[f'{plate_type}_{n+1}_toggle']:
-                        # Wide to Long
-                        value = plate_transformation(state[f'{plate_type}_{n+1}_edit_plate'], 'long').dropna()["Value"].to_dict()
-                    else:
-                        value = state[f'{plate_type}_{n+1}_edit_plate'].dropna()["Value"].to_dict()
-                    if f"{plate_type}_plate_{n+1}_name" in state:
-                        name = state[f"{plate_type}_plate_{n+1}_name"]
-                    else:
-                        name = f"{plate_type}_{n+1}"
-            
-                    state.export_JSON["Plate"][f"{plate_type}_{n+1}"] = {
-                        "name": name,
-                        "type": plate_type,
-                        "data": value,
-                    }
-            
-            # Workflow
-            for workflow in state.workflow:
-                if workflow.startswith("Transformation"):
-                    for n in range(state[f"{workflow}_num"]):
-                        if f"{workflow}_plate_{n+1}_name" in state:
-                            name = state[f"{workflow}_plate_{n+1}_name"]
+            if state.make_json:
+                # Tables of the session to export JSON (see export.py, same steps as generate.py)
+                # Entries are memoized on their tables, only edited ones are rebuilt
+                tables = {"workflow": state.workflow, "tables": {}, "volumes": {}, "plates": {}}
+                errors = []
+                plate_types = ["Source", "Destination"] + [i for i in state.workflow if i.startswith("Transformation")]
+                for plate_type in plate_types:
+                    for n in range(state[f"{plate_type}_num"]):
+                        if f"{plate_type}_plate_{n+1}_name" in state:
+                            name = state[f"{plate_type}_plate_{n+1}_name"]
                         else:
-                            name = f"{workflow}_{n+1}"
-                        if state[f'{workflow}_{n+1}_toggle']:
-                            value = plate_transformation(state[f'{workflow}_{n+1}_edit_plate'], 'long').dropna()["Value"].to_dict()
-                        else:
-                            value = state[f'{workflow}_{n+1}_edit_plate'].dropna()["Value"].to_dict()
+                            name = f"{plate_type}_{n+1}"
+                        key = f"{plate_type}_{n+1}"
+                        extra = {}
                         # workflow가 여러개가 들어가는 형태로 되었음.. data가 여러개가 들어가야 할 것 같은뎅
-                        state.export_JSON["Plate"][f"{workflow}_{n+1}"] = {
-                            "name": name,
-                            "type": workflow.split('_')[0],
-                            "data": value,
-                        }
-                else:
-                    value = state[f'{workflow}_edit_table'].astype(str).to_dict()
+                        if plate_type.startswith("Transformation"):
+                            extra["agar"] = state.get(f"{plate_type}_plate_{n+1}_agar", "96well")
+                        tables["plates"][key] = (from_wells(state[f'{key}_values']), name, plate_type.split('_')[0], extra)
 
+                for workflow in state.workflow:
+                    if workflow.startswith("Transformation"):
+                        continue
                     # Streamlit 자체 이슈로 변환 과정 중 sort가 걸림.
-                    state.export_JSON['Workflow'][workflow] = {
-                        "type": workflow.split('_')[0],
-                        "data": value
-                    }
-            
-            # Workflow volume
-            for workflow in state.workflow:
-                if workflow.startswith("Transformation"):
-                    continue
-                
-                name = workflow
-                value = state[f"{workflow}_edit_volume"].astype(str).to_dict()
-                # None 이 있으면 Error 발생
-                assert None not in state[f"{workflow}_edit_volume"].values, "ERROR2: Fill, all of Volume tables!"
-                assert "" not in state[f"{workflow}_edit_volume"].values, "ERROR2: Fill, all of Volume tables!"
-            
-                state.export_JSON['Workflow_volume'][name] = value
-            
-            # Parameter
-            state.export_JSON["Parameter"] = {
-                "stop_reaction": state.stop_reaction,
-                "annealing": state.annealing,
-                "pcr_extension": state.pcr_extension,
-                "tf_recovery": state.tf_recovery,
-                "num_of_tips": "NULL"
-            }
-            
-            # Deck
-            ## Materials
-            use_tf = False
-            materials, enzymes, dnas, products = [], [], [], []
-            for workflow in state.workflow:
-                if workflow.startswith("Transformation"):
-                    use_tf = True
-                    continue
-                tmp = state[f'{workflow}_edit_table']
-                products += tmp["Name"].tolist()
-                materials += tmp.drop(["Name"], axis=1).values.tolist()
-            try:
-                materials = sum(materials, [])
-                products = sum(products, [])
-            except:
-                pass
-            
-            products = [i for i in products if i != None]
-            
-            for i in list(dict.fromkeys(materials)):
-                if type(i) != str:
-                    continue
-                if i.startswith('[E]'):
-                    enzymes.append(i)
+                    # Empty columns (added, not filled) have no volume, they are left out.
+                    # A_enzyme and DW stay, protocol_v2 skips their empty cells
+                    data = state[f'{workflow}_data']
+                    columns = column_order(dict.fromkeys([*FIXED_COLUMNS, *used_columns(data)]))
+                    tables["tables"][workflow] = pd.DataFrame(data, columns=columns)
+
+                    # None 이 있으면 Error 발생
+                    volume = state[f"{workflow}_edit_volume"]
+                    if None in volume.values or "" in volume.values:
+                        errors.append(error("ERROR2", workflow, f"Fill all of the Volume table of {workflow}!"))
+                    tables["volumes"][workflow] = volume
+
+                parameter = {
+                    "stop_reaction": state.stop_reaction,
+                    "annealing": state.annealing,
+                    "pcr_extension": state.pcr_extension,
+                    "tf_recovery": state.tf_recovery,
+                    "tf_recovery_module": state.tf_recovery_module,
+                    "tf_multichannel": state.tf_multichannel,
+                    "tf_dilution": state.tf_dilution,
+                    "notify_lead_time": state.notify_lead_time,
+                }
+
+                # Deck is planned again only when tables, parameters or the tip inventory changed
+                # Check error, every rule at once (see validation.py)
+                # Plans which do not fit (deck, reservoir) are reported like table errors
+                if errors:
+                    state.export_JSON, state.export_errors = False, errors
                 else:
-                    dnas.append(i)
-            
-            if use_tf:
-                enzymes += ["[E]CPcell", "[E]SOC"]
-            
-            ## Deck position
-            tf_plate = []
-            for key in state.export_JSON["Workflow"].keys():
-                if state.export_JSON["Workflow"][key]["type"] == "Transformation":
-                    tf_plate.append(key)
-            
-            state.export_JSON["Deck"] = {
-                "Enzyme_position": enzyme_position(enzymes),
-                "Deck_position": deck_position(state.export_JSON["Plate"], tf_plate)
-            }
-            
-            # Check error
-            source_materials = []
-            dest_materials = []
-            
-            for key in state.export_JSON["Plate"].keys():
-                tmp = state.export_JSON["Plate"][key]
-                
-                if tmp["type"] == "Source":
-                    source_materials += list(tmp["data"].values())
-                elif tmp["type"] == "Destination":
-                    dest_materials += list(tmp["data"].values())
+                    try:
+                        state.export_JSON, state.export_errors = tables_export(tables, parameter, state.cold_module)
+                    except ValueError as e:
+                        state.export_JSON, state.export_errors = False, [error("ERROR14", "Deck", str(e))]
+                if state.export_errors:
+                    state.export_JSON = False
+                else:
+                    # Rendered once per (template, export JSON) and simulated in background (see simulation_pool.py)
+                    # Sessions keep the key, the protocol text is in the render cache
+                    state.protocol_key, _ = render(state.export_JSON)
+                    submit(state.protocol_key)
+                state.make_json = False
+
+        if state.get('export_errors'):
+            st.error(f"{len(state.export_errors)} errors in tables, fix them and Make Protocol again")
+            st.dataframe(pd.DataFrame(state.export_errors)[["code", "item", "message"]], hide_index=True)
+
+        if state.export_JSON:
+            with st.expander("Deck setup", expanded=True):
+                deck = state.export_JSON["Deck"]
+                st.dataframe(pd.DataFrame([
+                    {"Slot": deck["Deck_position"][key], "Rack": rack["rack_id"],
+                     "Starting tip": rack["starting_tip"], "Tips": rack["tips"]}
+                    for key, rack in deck["Tip_racks"].items()
+                ]), hide_index=True)
+                swaps = [
+                    {"Workflow": workflow, "Remove": ", ".join(f"{k} (slot {v})" for k, v in session["remove"].items()),
+                     "Place": ", ".join(f"{k} (slot {v})" for k, v in session["load"].items())}
+                    for workflow, sessions in deck["Sessions"].items()
+                    for session in sessions if session["load"]
+                ]
+                if swaps:
+                    st.warning(f"{len(swaps)} plate swaps during the run")
+                    st.dataframe(pd.DataFrame(swaps), hide_index=True)
+                reagents = pd.DataFrame(deck["Reagent_volumes"])
+                if len(reagents) and not reagents["Fits"].all():
+                    st.warning("Some reagents do not fit a 1.5 mL tube, reduce reactions")
+                st.dataframe(reagents, hide_index=True)
+                expires = {r for step in deck["Reagent_plan"].values() for r in step["expires"]}
+                if expires:
+                    st.warning(f"{', '.join(sorted(expires))} expire before their workflow is pipetted, "
+                               "use the cold module or reduce reactions")
+                st.dataframe(pd.DataFrame([
+                    {"Workflow": workflow, "Pause": step["pause"] and state.stop_reaction,
+                     "Load": ", ".join(step["load"]), "Remove": ", ".join(step["remove"]),
+                     "Expires": ", ".join(step["expires"])}
+                    for workflow, step in deck["Reagent_plan"].items()
+                ]), hide_index=True)
+            with st.expander("Converted JSON", expanded=True):
+                with st.container(height=450):
+                    st.json(state.export_JSON)
+
+        with end_col[1]:
+            protocol = cached_protocol(state.protocol_key) if state.export_JSON else ""
+            st.download_button(
+                label = "Download Protocol",
+                data = protocol,
+                file_name=f"{datetime.now().strftime('%y%m%d')}-ot2_cloning.py",
+                disabled=not protocol,
+            )
+            if protocol:
+                # Polls only while the simulation is queued or running
+                polling = pending(state.protocol_key)
+                st.fragment(simulation_status, run_every=2 if polling else None)(polling)
 
-            try:
-                source_materials.remove("")
-                dest_materials.remove("")
-            except:
-                pass
-            
-            ## DEST에 Product 검사 
-            # Product 중복 검사            
-            if len(products) != 0:
-                assert len(set(products)) == len(products), "ERROR3: Duplicated Product Exists!"
-            # DEST table에 REACTION - NAME들 있는지.
-            for element in products:
-                if element == None:
-                    continue
-                assert element in dest_materials, f"ERROR4: Product `{element}` not in Destination Plate!"
-            
-            ## Source 검사
-            # Source or dest plate에 DNA들 있는지 확인
-            for element in dnas:
-                if element == "":
-                    continue
-                assert (element in source_materials) or (element in dest_materials), f"ERROR5: source `{element}` not in Plate"
-            # Source DNA가 Product와 이름이 겹칠 때
-            
-            ## TF 검사
-            # TF 대상이 Product or Source에 없을 때
-            tf_products = []
-            for key in tf_plate:
-                tf_products += list(state.export_JSON["Workflow"][key]['data'].values())
-            
-            for element in tf_products:
-                assert element in dest_materials, f"ERROR6: TF_product `{element}` not in Destination Plate!"
-            
-            ## Overlap
-            ## 같은 이름이 존재할 때
-            ## TF 대상 Product에 없을 때
-            state.make_json = False
-
-    if state.export_JSON:
-        with st.expander("Converted JSON", expanded=True):
-            with st.container(height=450):
-                st.json(state.export_JSON)
-
-    with end_col[1]:
-        st.download_button(
-            label = "Download Protocol",
-            data = "",
-            disabled=True,
-            help="Blocked by DEMO version"
-        )
\ No newline at end of file
+    export_section()
@@ -0,0 +1,179 @@
+"""
+Project catalog of data/project.
+
+Each project file is parsed once per process and the parse is shared by all
+sessions. It is keyed by mtime and size, and by content hash when the file was
+touched without changes. A small SQLite index (`.catalog.sqlite` in the
+project folder) keeps project names, tasks, products and materials, so listing
+and searching thousands of archived projects does not open their files.
+Files which are not project JSON are left out of the lists and reported by
+`unreadable`.
+
+    from data.ot2_cloning.catalog import list_projects, load_project, search, unreadable
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+
+PROJECT_DIR = Path("data/project")
+INDEX_NAME = ".catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    name TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha1 TEXT, tasks TEXT
+);
+CREATE TABLE IF NOT EXISTS products (project TEXT, workflow TEXT, product TEXT);
+CREATE TABLE IF NOT EXISTS materials (project TEXT, product TEXT, material TEXT);
+CREATE TABLE IF NOT EXISTS errors (project TEXT PRIMARY KEY, message TEXT);
+CREATE INDEX IF NOT EXISTS products_product ON products (product);
+CREATE INDEX IF NOT EXISTS materials_material ON materials (material);
+"""
+
+# path -> (mtime_ns, size, sha1, project json)
+_cache = {}
+_lock = threading.Lock()
+
+
+def connect(project_dir=PROJECT_DIR):
+    connection = sqlite3.connect(Path(project_dir) / INDEX_NAME, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def read_project(path):
+    # Parsed project json, file is read again only when it changed
+    path = Path(path)
+    stat = path.stat()
+    cached = _cache.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[3]
+    data = path.read_bytes()
+    sha1 = hashlib.sha1(data).hexdigest()
+    if cached and cached[2] == sha1:
+        project = cached[3]
+    else:
+        project = json.loads(data)
+    with _lock:
+        _cache[path] = (stat.st_mtime_ns, stat.st_size, sha1, project)
+    return project
+
+
+def project_tasks(project):
+    # Loaded projects always end with a Transformation
+    return ", ".join(list(project["Build"].keys()) + ["Transformation"])
+
+
+def refresh(project_dir=PROJECT_DIR):
+    # Bring the index up to date with the project folder, only changed files are parsed.
+    # Unreadable files are indexed without tasks (parsed again when they change), see unreadable.
+    project_dir = Path(project_dir)
+    if not project_dir.is_dir():
+        return
+    files = {
+        entry.name[:-len(".json")]: entry
+        for entry in os.scandir(project_dir) if entry.name.endswith(".json") and entry.is_file()
+    }
+    with closing(connect(project_dir)) as connection:
+        indexed = {name: (mtime, size) for name, mtime, size in connection.execute(
+            "SELECT name, mtime_ns, size FROM projects"
+        )}
+    removed = [name for name in indexed if name not in files]
+    changed = [
+        name for name, entry in files.items()
+        if indexed.get(name) != (entry.stat().st_mtime_ns, entry.stat().st_size)
+    ]
+    if not removed and not changed:
+        return
+
+    # Files are parsed before the index is locked
+    projects, products, materials, errors = [], [], [], []
+    for name in changed:
+        path = Path(files[name].path)
+        try:
+            project = read_project(path)
+            stat, sha1 = path.stat(), _cache[path][2]
+            built, used = [], []
+            for workflow, reactions in project["Build"].items():
+                for product, values in reactions.items():
+                    built.append((name, workflow, product))
+                    values = values.values() if isinstance(values, dict) else values
+                    used += [(name, product, str(value)) for value in values if value not in ["", None]]
+            projects.append((name, stat.st_mtime_ns, stat.st_size, sha1, project_tasks(project)))
+            products += built
+            materials += used
+        except OSError:
+            # Removed while indexing
+            continue
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # Not JSON or not a project
+            stat = files[name].stat()
+            projects.append((name, stat.st_mtime_ns, stat.st_size, None, None))
+            errors.append((name, f"{type(e).__name__}: {e}"))
+
+    # Delete and insert in one transaction, sessions (threads or processes) do not index a project twice
+    with _lock, closing(connect(project_dir)) as connection, connection:
+        connection.execute("BEGIN IMMEDIATE")
+        for name in removed + changed:
+            for table, column in [("projects", "name"), ("products", "project"),
+                                  ("materials", "project"), ("errors", "project")]:
+                connection.execute(f"DELETE FROM {table} WHERE {column} = ?", (name,))
+        connection.executemany("INSERT INTO projects VALUES (?, ?, ?, ?, ?)", projects)
+        connection.executemany("INSERT INTO products VALUES (?, ?, ?)", products)
+        connection.executemany("INSERT INTO materials VALUES (?, ?, ?)", materials)
+        connection.executemany("INSERT INTO errors VALUES (?, ?)", errors)
+
+
+def unreadable(project_dir=PROJECT_DIR):
+    # {name: error} of project files which could not be indexed
+    refresh(project_dir)
+    if not Path(project_dir).is_dir():
+        return {}
+    with closing(connect(project_dir)) as connection:
+        return dict(connection.execute("SELECT project, message FROM errors ORDER BY project"))
+
+
+def list_projects(project_dir=PROJECT_DIR):
+    # Project files by name
+    refresh(project_dir)
+    if not Path(project_dir).is_dir():
+        return []
+    with closing(connect(project_dir)) as connection:
+        names = [name for (name,) in connection.execute(
+            "SELECT name FROM projects WHERE tasks IS NOT NULL ORDER BY name"
+        )]
+    return [Path(project_dir) / f"{name}.json" for name in names]
+
+
+def search(text, project_dir=PROJECT_DIR):
+    # Projects whose name, product or material contains `text`
+    if not text:
+        return list_projects(project_dir)
+    refresh(project_dir)
+    pattern = f"%{text}%"
+    with closing(connect(project_dir)) as connection:
+        names = [name for (name,) in connection.execute(
+            "SELECT name FROM projects WHERE name LIKE ?1 AND tasks IS NOT NULL "
+            "UNION SELECT project FROM products WHERE product LIKE ?1 "
+            "UNION SELECT project FROM materials WHERE material LIKE ?1 "
+            "ORDER BY 1",
+            (pattern,),
+        )]
+    return [Path(project_dir) / f"{name}.json" for name in names]
+
+
+def tasks(name, project_dir=PROJECT_DIR):
+    with closing(connect(project_dir)) as connection:
+        row = connection.execute("SELECT tasks FROM projects WHERE name = ?", (name,)).fetchone()
+    if row is None or row[0] is None:
+        return project_tasks(load_project(name, project_dir))
+    return row[0]
+
+
+def load_project(name, project_dir=PROJECT_DIR):
+    # Project json by name (cached parse)
+    return read_project(Path(project_dir) / f"{name}.json")
@@ -0,0 +1,93 @@
+"""
+Plate-swap schedule for runs with more Source plates than free deck slots.
+
+Transfers of each workflow are split into deck "sessions". A session is the set
+of Source plates on deck while its transfers run. Plates are swapped only when a
+needed plate is missing, evicting the plate whose next use is the farthest
+(fewest swaps for a given order of workflows). protocol_v2 pauses before each
+session that needs a swap and lists which plates go into which slots.
+"""
+
+EMPTY = ["", "None", "nan", None]
+
+
+def source_location(plates):
+    # material -> Source plate key
+    location = {}
+    for key, plate in plates.items():
+        if plate["type"] != "Source":
+            continue
+        for value in plate["data"].values():
+            if value not in EMPTY:
+                location.setdefault(value, key)
+    return location
+
+
+def plates_needed(export_json):
+    # Source plates needed by each workflow, in order of first use
+    location = source_location(export_json["Plate"])
+    needs = []
+    for workflow in export_json["Meta"]["workflow"]:
+        needed = []
+        data = export_json["Workflow"].get(workflow, {}).get("data", {})
+        for column, values in data.items():
+            if column in ["Name", "DW", "A_enzyme"]:
+                continue
+            for value in values:
+                plate = location.get(value)
+                if plate and plate not in needed:
+                    needed.append(plate)
+        needs.append((workflow, needed))
+    return needs
+
+
+def plan_sessions(export_json, free_slots):
+    """Initial Source plate slots and sessions of each workflow.
+
+    Returns {"initial": {plate: slot}, "workflows": {workflow: [session]}} where a
+    session is {"plates": [...], "load": {plate: slot}, "remove": {plate: slot}}.
+    """
+    needs = plates_needed(export_json)
+    order = []
+    for _, needed in needs:
+        order += [plate for plate in needed if plate not in order]
+    if order and not free_slots:
+        raise ValueError("Deck is already Full. Reduce Plates")
+
+    def next_use(plate, index):
+        for n, (_, needed) in enumerate(needs[index:], index):
+            if plate in needed:
+                return n
+        return len(needs)
+
+    # Fill the deck in order of first use
+    on_deck = dict(zip(order, free_slots))
+    initial = dict(on_deck)
+    free = list(free_slots[len(on_deck):])
+
+    sessions = {}
+    for index, (workflow, needed) in enumerate(needs):
+        todo = list(needed)
+        sessions[workflow] = []
+        while todo:
+            load, remove = {}, {}
+            served = [plate for plate in todo if plate in on_deck]
+            for plate in [p for p in todo if p not in on_deck]:
+                if not free:
+                    candidates = [p for p in on_deck if p not in todo]
+                    if not candidates:
+                        break
+                    evict = max(candidates, key=lambda p: next_use(p, index + 1))
+                    remove[evict] = on_deck.pop(evict)
+                    free.append(remove[evict])
+                slot = free.pop(0)
+                on_deck[plate] = slot
+                load[plate] = slot
+                served.append(plate)
+            sessions[workflow].append({"plates": served, "load": load, "remove": remove})
+            todo = [plate for plate in todo if plate not in served]
+    return {"initial": initial, "workflows": sessions}
+
+
+def count_swaps(sessions):
+    return sum(len(s["load"]) for workflow in sessions["workflows"].values() for s in workflow)
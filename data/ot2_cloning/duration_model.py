@@ -0,0 +1,317 @@
+"""
+Self-calibrating duration model of OT-2 operations.
+
+Fit per-operation durations from traces of real runs (protocol_v2 `*.trace.json`)
+or run logs exported from the Opentrons App, and keep them in `calibration.json`.
+The calibration stores sufficient statistics, so every new run refines the fit.
+
+    python -m data.ot2_cloning.duration_model runs/*.trace.json
+
+Planners load the model with `load_model()`, the app embeds it in
+PARAMETERS["Calibration"] so ETA of protocol_v2 uses the same values.
+"""
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+
+CALIBRATION_PATH = Path(__file__).parent / "calibration.json"
+
+# Same keys as DURATION_MODEL in protocol_v2
+DEFAULT_MODEL = {
+    "tip_pickup": 7.0,
+    "tip_drop": 5.0,
+    "travel": 2.5,
+    "submerge": 1.0,
+    "blow_out": 1.5,
+    "tc_lid": 20.0,
+    "tc_lid_heat": 120.0,
+    "tc_ramp_rate": 2.0,
+    "liquid_scale": 1.0,
+}
+
+# Opentrons App run log command -> traced method name
+RUNLOG_COMMANDS = {
+    "aspirate": "aspirate",
+    "dispense": "dispense",
+    "blowout": "blow_out",
+    "pickUpTip": "pick_up_tip",
+    "dropTip": "drop_tip",
+    "moveToWell": "move_to",
+    "touchTip": "touch_tip",
+    "thermocycler/openLid": "open_lid",
+    "thermocycler/closeLid": "close_lid",
+    "thermocycler/setTargetLidTemperature": "set_lid_temperature",
+    "thermocycler/setTargetBlockTemperature": "set_block_temperature",
+}
+
+
+def empty_stats():
+    # n, sum x, sum y, sum xx, sum xy
+    return [0, 0.0, 0.0, 0.0, 0.0]
+
+
+def add_sample(stats, key, y, x=0.0):
+    s = stats.setdefault(key, empty_stats())
+    s[0] += 1
+    s[1] += x
+    s[2] += y
+    s[3] += x * x
+    s[4] += x * y
+
+
+def mean(s):
+    return s[2] / s[0]
+
+
+def linear_fit(s):
+    # Least squares y = a + b*x, falls back to mean when x does not vary
+    n, sx, sy, sxx, sxy = s
+    denominator = n * sxx - sx * sx
+    if n < 3 or abs(denominator) < 1e-9:
+        return mean(s), None
+    b = (n * sxy - sx * sy) / denominator
+    return (sy - b * sx) / n, b
+
+
+def read_trace(path):
+    # Leaf spans of a Chrome trace from protocol_v2 as (method, track, start, end, args)
+    with open(path, "r") as f:
+        trace = json.load(f)
+    if trace.get("otherData", {}).get("simulation"):
+        return []
+    spans = [
+        (e["name"], e["tid"], e["ts"] / 1e6, (e["ts"] + e["dur"]) / 1e6, e.get("args", {}))
+        for e in trace["traceEvents"]
+        if e.get("ph") == "X"
+    ]
+    spans.sort(key=lambda span: (span[2], -span[3]))
+    # Composite spans (transfer, mix, ...) contain other spans of the same track
+    leaves = []
+    for i, span in enumerate(spans):
+        following = spans[i + 1] if i + 1 < len(spans) else None
+        if following and following[1] == span[1] and following[2] < span[3] and following[3] <= span[3]:
+            continue
+        leaves.append(span)
+    return leaves
+
+
+def read_runlog(path):
+    # Commands of a run log exported from the Opentrons App as leaf spans
+    with open(path, "r") as f:
+        runlog = json.load(f)
+    slots = {}
+    spans = []
+    for command in runlog.get("commands", []):
+        params = command.get("params", {})
+        if command["commandType"] == "loadLabware":
+            location = params.get("location", {})
+            labware_id = command.get("result", {}).get("labwareId")
+            slot = location.get("slotName") if isinstance(location, dict) else None
+            if labware_id and slot and str(slot).isdigit():
+                slots[labware_id] = int(slot)
+            continue
+        method = RUNLOG_COMMANDS.get(command["commandType"])
+        if not method or not command.get("startedAt") or not command.get("completedAt"):
+            continue
+        info = {}
+        if "volume" in params:
+            info["volume"] = params["volume"]
+        if "flowRate" in params:
+            info["flow_rate"] = params["flowRate"]
+        if "celsius" in params:
+            info["temperature"] = params["celsius"]
+        if "holdTimeSeconds" in params:
+            info["hold_time_seconds"] = params["holdTimeSeconds"]
+        if params.get("labwareId") in slots:
+            key = "source_slot" if method == "aspirate" else "destination_slot"
+            info[key] = slots[params["labwareId"]]
+        spans.append((
+            method,
+            params.get("pipetteId", "module"),
+            datetime.fromisoformat(command["startedAt"].replace("Z", "+00:00")).timestamp(),
+            datetime.fromisoformat(command["completedAt"].replace("Z", "+00:00")).timestamp(),
+            info,
+        ))
+    return spans
+
+
+def collect(spans, stats):
+    # Add samples of leaf spans to sufficient statistics
+    last_slot = {}
+    temperature = 25.0
+    for method, track, start, end, info in spans:
+        duration = end - start
+        slot = info.get("source_slot", info.get("destination_slot"))
+        moved = slot is not None and last_slot.get(track) not in [None, slot]
+        if slot is not None:
+            last_slot[track] = slot
+
+        if method in ["aspirate", "dispense"] and info.get("flow_rate") and "volume" in info:
+            x = float(info["volume"]) / float(info["flow_rate"])
+            if moved:
+                add_sample(stats, "travel", duration, x)
+            else:
+                add_sample(stats, "liquid", duration, x)
+        elif method == "pick_up_tip":
+            add_sample(stats, "tip_pickup", duration)
+        elif method in ["drop_tip", "return_tip"]:
+            add_sample(stats, "tip_drop", duration)
+        elif method == "blow_out":
+            add_sample(stats, "blow_out", duration)
+        elif method in ["open_lid", "close_lid"]:
+            add_sample(stats, "tc_lid", duration)
+        elif method == "set_lid_temperature":
+            add_sample(stats, "tc_lid_heat", duration)
+        elif method == "set_block_temperature" and ("temperature" in info or "volume" in info):
+            # Traces of older versions kept the positional temperature (set_block_temperature(12)) as volume
+            target = float(info.get("temperature", info.get("volume")))
+            hold = float(info.get("hold_time_seconds", 0)) + 60 * float(info.get("hold_time_minutes", 0))
+            change = abs(target - temperature)
+            temperature = target
+            if change >= 5:
+                # ramp time against temperature change
+                add_sample(stats, "tc_ramp", duration - hold, change)
+        elif method == "execute_profile" and "temperature" in info:
+            # Block stays at the last step of the profile
+            temperature = float(info["temperature"])
+
+
+def fit(stats):
+    """Model parameters from sufficient statistics.
+
+    Travel between labware is not a term of its own for each pair of slots: the
+    samples of every move are pooled into the one "travel" constant that the
+    planners add to each aspirate and dispense (see transfer_seconds in
+    protocol_v2), as planners do not know the slots of a move. Long and short
+    moves are folded into this per-command constant.
+    """
+    model = json.loads(json.dumps(DEFAULT_MODEL))
+    for key in ["tip_pickup", "tip_drop", "blow_out", "tc_lid", "tc_lid_heat"]:
+        if stats.get(key, empty_stats())[0]:
+            model[key] = round(mean(stats[key]), 3)
+    if stats.get("liquid", empty_stats())[0]:
+        submerge, scale = linear_fit(stats["liquid"])
+        model["submerge"] = round(max(submerge, 0.0), 3)
+        if scale is not None and scale > 0:
+            model["liquid_scale"] = round(scale, 3)
+    if stats.get("tc_ramp", empty_stats())[0] and stats["tc_ramp"][4] > 0:
+        # seconds per degree fitted through origin, stored as degree per second
+        model["tc_ramp_rate"] = round(stats["tc_ramp"][3] / stats["tc_ramp"][4], 3)
+
+    # Calibrations of older versions kept samples by slot pair ("travel:4>7")
+    travel = [s for key, s in stats.items() if key == "travel" or key.startswith("travel:")]
+    if travel:
+        # Aspirate/dispense after moving = travel + liquid handling
+        n, x, y = (sum(s[i] for s in travel) for i in range(3))
+        liquid = n * model["submerge"] + model["liquid_scale"] * x
+        model["travel"] = round(max((y - liquid) / n, 0.0), 3)
+    return model
+
+
+def load_calibration(path=CALIBRATION_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {"version": 1, "runs": [], "stats": {}, "model": dict(DEFAULT_MODEL)}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_model(path=CALIBRATION_PATH):
+    # Calibrated model for planners and ETA estimators
+    model = dict(DEFAULT_MODEL)
+    model.update({key: value for key, value in load_calibration(path)["model"].items() if key in DEFAULT_MODEL})
+    return model
+
+
+def workflow_seconds(export_json, model=None):
+    """Planned (pipetting, total) seconds of each workflow for planners.
+
+    Coarse version of the time model in protocol_v2 (same thermocycler programs).
+    """
+    if model is None:
+        model = load_model()
+    parameter = export_json["Parameter"]
+
+    def ramp(*temperatures):
+        return sum(abs(a - b) for a, b in zip(temperatures, temperatures[1:])) / model["tc_ramp_rate"]
+
+    def liquid(volume, rate):
+        return model["submerge"] + model["liquid_scale"] * volume / rate
+
+    tip = model["tip_pickup"] + model["tip_drop"]
+    empty = ["", "None", "nan", None]
+    thermocycler = {
+        "PCR": model["tc_lid_heat"] + ramp(25, 94) + 30
+        + 30 * (40 + float(parameter["pcr_extension"]) + ramp(94, float(parameter["annealing"]), 68, 94))
+        + 60 + 300 + ramp(68, 12),
+        "GGA": model["tc_lid_heat"] + 30 * (40 + ramp(37, 16, 37)) + 300 + ramp(16, 12),
+        "Gibson": model["tc_lid_heat"] + 300 + 20 + 2400 + 7 * 45 + ramp(25, 37, 65, 50, 12),
+    }
+
+    seconds = {}
+    for workflow in export_json["Meta"]["workflow"]:
+        key = workflow.split("_")[0]
+        if key == "Transformation":
+            samples = {
+                v for plate in export_json["Plate"].values() if plate["type"] == "Transformation"
+                for v in plate["data"].values() if v not in empty
+            }
+            pipetting = tip + len(samples) * (3 * tip + 6 * (model["travel"] + model["submerge"]))
+            recovery = 60 * float(parameter["tf_recovery"])
+            if parameter.get("tf_recovery_module", "thermocycler") != "thermocycler":
+                # Recovery on a module overlaps with the next workflows
+                recovery = len(samples) * (tip + 2 * model["travel"] + 2 * liquid(150, 20))
+            seconds[workflow] = (pipetting, pipetting + 600 + 90 + recovery)
+            continue
+        data = export_json["Workflow"][workflow]["data"]
+        reactions = len([v for v in data["Name"] if v not in empty])
+        samples = sum(
+            len([v for v in values if v not in empty])
+            for column, values in data.items() if column not in ["Name", "DW", "A_enzyme"]
+        )
+        # reagent distribution, sample transfers (1 uL/s) and mixing of products
+        pipetting = 2 * tip + 2 * reactions * (model["travel"] + liquid(10, 20))
+        pipetting += samples * (tip + 2 * model["travel"] + 2 * liquid(1, 1))
+        pipetting += reactions * (tip + model["travel"] + 4 * liquid(15, 10))
+        seconds[workflow] = (pipetting, pipetting + thermocycler.get(key, 0))
+    return seconds
+
+
+def calibrate(paths, path=CALIBRATION_PATH):
+    # Add runs to the calibration file, runs already included are skipped
+    calibration = load_calibration(path)
+    added = []
+    for run in paths:
+        run = Path(run)
+        if run.name in calibration["runs"]:
+            continue
+        if run.name.endswith(".trace.json"):
+            spans = read_trace(run)
+        else:
+            spans = read_runlog(run)
+        if not spans:
+            continue
+        collect(spans, calibration["stats"])
+        calibration["runs"].append(run.name)
+        added.append(run.name)
+
+    calibration["model"] = fit(calibration["stats"])
+    with open(path, "w") as f:
+        json.dump(calibration, f, indent=2)
+    return calibration, added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit OT-2 duration model from run traces and logs")
+    parser.add_argument("runs", nargs="+", help="*.trace.json of protocol_v2 or run log JSON of Opentrons App")
+    parser.add_argument("-c", "--calibration", default=CALIBRATION_PATH, help="calibration file to update")
+    args = parser.parse_args(argv)
+
+    calibration, added = calibrate(args.runs, args.calibration)
+    print(f"Added {len(added)} runs ({len(calibration['runs'])} in total)")
+    print(json.dumps(calibration["model"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Incremental building of the export JSON.
+
+Each entry of the export is built from its input table by a builder memoized
+on a content hash of the inputs: a plate, a workflow table or a volume table.
+The deck plan and validation are memoized on the hashes of what they read, and
+validation merges cached indexes of each entry. Making the protocol again after
+editing one cell rebuilds only that entry and what depends on it.
+
+Cached values are shared (across sessions too), callers must not modify them.
+
+The same steps run headless (see generate.py):
+
+    project_tables(project_json) -> tables_export(tables) -> export JSON
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+import pandas as pd
+
+from data.ot2_cloning.deck_sessions import plan_sessions
+from data.ot2_cloning.duration_model import load_model
+from data.ot2_cloning.plate_layout import empty_long, to_long
+from data.ot2_cloning.reagent_plan import is_cold, plan_reagents
+from data.ot2_cloning.reservoir_plan import fill_volumes, plan_reservoir, reagent_volumes
+from data.ot2_cloning.render import load_template
+from data.ot2_cloning.tip_inventory import count_tips, load_inventory, plan_tip_racks, tip_pickups
+from data.ot2_cloning.validation import index_entry, merge_indexes, validate
+from data.ot2_cloning.well_allocator import allocate, materials_of
+from data.ot2_cloning.workflow_schema import SCHEMA_VERSION, encode_volume, encode_workflow
+
+CACHE_SIZE = 2048
+_cache = OrderedDict()
+
+EMPTY = ["", "None", "nan", None]
+META = {"Task": "OT-2 cloning", "version": "2.1", "Messenger": "kun", "schema": SCHEMA_VERSION}
+# Default reaction volumes (uL) of each workflow, columns of workflow tables
+DEFAULT_VOLUMES = {
+    "PCR": {"0": "1", "1": "0.5", "2": "0.5", "A_enzyme": "12.5", "DW": "10.5"},
+    "Gibson": {"0": "2", "1": "2", "A_enzyme": "5", "DW": "1"},
+    "GGA": {"0": "1", "1": "1", "2": "1", "3": "1", "4": "0.5", "A_enzyme": "2.5", "DW": "3"},
+}
+# Reagents of projects without A_enzyme / DW columns, as in new tables of the app
+DEFAULT_REAGENTS = {
+    "PCR": {"A_enzyme": "[E]PCRmix", "DW": "[E]DW"},
+    "Gibson": {"A_enzyme": "[E]Gibsonmix", "DW": "[E]DW"},
+    "GGA": {"A_enzyme": "[E]Buffer", "DW": "[E]DW"},
+}
+DEFAULT_PARAMETER = {
+    "stop_reaction": True,
+    "annealing": 57,
+    "pcr_extension": 25,
+    "tf_recovery": 40,
+    "tf_recovery_module": "thermocycler",
+    "tf_multichannel": False,
+    "tf_dilution": 0,
+    "notify_lead_time": 5,
+    "num_of_tips": "NULL",
+}
+
+
+def content_hash(*parts):
+    # sha1 of tables (values, index and columns) and JSON-like values
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+            digest.update(json.dumps([str(c) for c in part.columns]).encode())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def memo(section, key, build):
+    # Value of `build()` for a section and content hash, least recently used are dropped
+    item = (section, key)
+    if item in _cache:
+        _cache.move_to_end(item)
+        return _cache[item]
+    value = build()
+    _cache[item] = value
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return value
+
+
+def plate_entry(df, wide, name, plate_type, **extra):
+    # (key, plate entry) of a plate table, wide form is converted to long
+    key = content_hash(df, wide, name, plate_type, extra)
+
+    def build():
+        long = to_long(df) if wide else df
+        return dict({"name": name, "type": plate_type, "data": long.dropna()["Value"].to_dict()}, **extra)
+    return key, memo("Plate", key, build)
+
+
+def workflow_entry(df, workflow):
+    key = content_hash(df, workflow)
+    return key, memo("Workflow", key, lambda: encode_workflow(df, workflow))
+
+
+def volume_entry(df):
+    key = content_hash(df)
+    return key, memo("Workflow_volume", key, lambda: encode_volume(df))
+
+
+def validate_export(export_json, keys, multichannel=False):
+    """Errors of the export (see validation.py).
+
+    `keys` are the content hashes of the export entries {(section, name): key}
+    from the builders, entry indexes are reused for unchanged entries.
+    """
+    def build():
+        parts = []
+        for (section, name), key in keys.items():
+            if section == "Workflow":
+                entry = export_json["Workflow"][name]
+                parts.append(memo("Index", key, lambda: index_entry("Workflow", entry)))
+            elif section == "Plate":
+                entry = (name, export_json["Plate"][name])
+                parts.append(memo("Index", (name, key), lambda: index_entry("Plate", entry)))
+        return validate(export_json, multichannel, index=merge_indexes(parts))
+    deck_key = content_hash(export_json.get("Deck", {}))
+    return memo("Validation", content_hash(sorted(map(str, keys.items())), deck_key, multichannel), build)
+
+
+def enzyme_position(enzyme_list):
+    # 24-well position
+    enzyme_list = enzyme_list
+    well_position = ["A1", "A2", "A3", "A4", "A5", "A6", "B1", "B2", "B3", "B4", "B5", "B6", "C1", "C2", "C3", "C4", "C5", "C6", "D1", "D2", "D3", "D4", "D5", "D6"]
+    return_dict = {}
+    for enzyme, well in zip(enzyme_list, well_position):
+        return_dict[enzyme] = well
+    return return_dict
+
+def deck_position(export_json, additional_plate: list, tip_racks={}):
+    # Slots of labware and modules, Source plates by sessions (see deck_sessions.py)
+    position = [1,2,3,4,5,6,9]
+    plates = export_json["Plate"]
+
+    deck_dict = {}
+    deck_dict["Enzyme_tube"] = position.pop(0)
+    deck_dict["p20_tip"] = position.pop(0)
+    deck_dict["p300_tip"] = position.pop(0)
+
+    # Heater-shaker only fits on the left or right column, not next to the trash,
+    # and not in slot 4 in front of the thermocycler (always loaded, slots 7-11).
+    # 8-channel pipettes can not reach labware beside, in front of or behind it.
+    heater_shaker = "Recovery" in additional_plate and export_json["Parameter"]["tf_recovery_module"] == "heatershaker"
+    multichannel = export_json["Parameter"].get("tf_multichannel", False)
+    if heater_shaker:
+        slots = [6] if multichannel else [1, 3, 6]
+        allowed = [i for i in position if i in slots]
+        if not allowed:
+            raise ValueError(
+                f"No free slot for Heater-shaker (slot {' or '.join(map(str, slots))}). "
+                "Recover on the thermocycler or temperature module"
+            )
+        deck_dict["Recovery"] = allowed[0]
+        position.remove(allowed[0])
+    if "Reservoir" in additional_plate:
+        blocked = [deck_dict["Recovery"] + i for i in [-3, -1, 1, 3]] if heater_shaker else []
+        allowed = [i for i in position if i not in blocked]
+        if not allowed:
+            raise ValueError("No slot for Reservoir. Reduce Plates")
+        deck_dict["Reservoir"] = allowed[0]
+        position.remove(allowed[0])
+
+    for key in plates.keys():
+        # OT-2
+        if plates[key]["type"] == "Destination":
+            deck_dict[key] = 7
+            continue
+        # Source plates are placed by sessions
+        if plates[key]["type"] == "Source":
+            continue
+        try:
+            deck_dict[key] = position.pop(0)
+        except:
+            raise ValueError("Deck is already Full. Reduce Plates")
+
+    if additional_plate:
+        for key in additional_plate:
+            if key in deck_dict:
+                continue
+            try:
+                deck_dict[key] = position.pop(0)
+            except:
+                raise ValueError("Deck is already Full. Reduce Plates")
+
+    # Extra tip racks when first racks are not enough
+    for key in tip_racks.keys():
+        if key in deck_dict:
+            continue
+        try:
+            deck_dict[key] = position.pop(0)
+        except:
+            raise ValueError("Deck is already Full. Reduce Plates")
+
+    # Source plates on the rest, swapped between sessions when the deck is short
+    sessions = plan_sessions(export_json, position)
+    deck_dict.update(sessions["initial"])
+
+    return deck_dict, sessions["workflows"]
+
+
+def reagents_of(export_json):
+    # Reagents ([E]) in order of use, CP cell and SOC for Transformation
+    enzymes = []
+    for workflow in export_json["Meta"]["workflow"]:
+        if workflow.startswith("Transformation"):
+            continue
+        data = export_json["Workflow"][workflow]["data"]
+        columns = [column for column in data if column != "Name"]
+        for row in zip(*[data[column] for column in columns]):
+            for value in row:
+                if value not in EMPTY and str(value).startswith("[E]") and value not in enzymes:
+                    enzymes.append(value)
+    if any(workflow.startswith("Transformation") for workflow in export_json["Meta"]["workflow"]):
+        enzymes += ["[E]CPcell", "[E]SOC"]
+    return enzymes
+
+
+def build_deck(export_json, cold_module=False):
+    """Deck plan of an export and the tips it needs.
+
+    Tip racks continue partially used racks of the inventory, cold-sensitive
+    enzymes go on a temperature module with `cold_module`.
+    """
+    parameter = export_json["Parameter"]
+    use_tf = any(workflow.startswith("Transformation") for workflow in export_json["Meta"]["workflow"])
+    enzymes = reagents_of(export_json)
+
+    ## Tip racks (continue partially used racks of inventory)
+    tip_needs = count_tips(export_json)
+    tip_racks = plan_tip_racks(tip_pickups(export_json))
+
+    ## Enzymes (cold-sensitive enzymes on temperature module)
+    cold_enzymes = [i for i in enzymes if cold_module and is_cold(i)]
+    modules = []
+    if cold_enzymes:
+        modules.append("Enzyme_cold")
+    ## Transformation recovery module
+    if use_tf and parameter["tf_recovery_module"] != "thermocycler":
+        modules.append("Recovery")
+    ## Bulk reagents (DW, SOC, CP cell) in reservoir when tubes are too small
+    volumes = reagent_volumes(export_json)
+    reservoir = plan_reservoir(export_json, volumes)
+    if reservoir:
+        modules.append("Reservoir")
+    if use_tf and parameter.get("tf_dilution"):
+        modules.append("TF_dilution")
+
+    deck_dict, sessions = deck_position(export_json, modules, tip_racks)
+    deck = {
+        "Enzyme_position": enzyme_position([i for i in enzymes if i not in cold_enzymes + list(reservoir)]),
+        "Cold_position": enzyme_position(cold_enzymes),
+        "Reservoir_position": reservoir,
+        "Reagent_volumes": fill_volumes(volumes, reservoir),
+        "Deck_position": deck_dict,
+        "Tip_racks": tip_racks,
+        "Sessions": sessions,
+        "Reagent_plan": plan_reagents(export_json, cold_module=bool(cold_enzymes)),
+    }
+    return deck, tip_needs
+
+
+def project_tables(project_json):
+    """Tables of a project like the app loads it.
+
+    {"workflow": [...], "tables": {workflow: df}, "volumes": {workflow: df},
+    "plates": {key: (long df, name, type, extra)}}. Plates are allocated (see
+    well_allocator.py) and final products are spotted on Transformation plates.
+    Tables without A_enzyme / DW get the reagents of DEFAULT_REAGENTS.
+    """
+    build = project_json["Build"]
+    workflows = [f"{key}_{n}" for n, key in enumerate(list(build) + ["Transformation"], 1)]
+    tables, volumes = {}, {}
+    for workflow in workflows[:-1]:
+        df = pd.DataFrame(build[workflow.split("_")[0]]).T.reset_index(names=["Name"])
+        df.columns = [str(column) for column in df.columns]
+        for column, value in DEFAULT_REAGENTS.get(workflow.split("_")[0], {}).items():
+            if column not in df.columns:
+                df[column] = value
+        tables[workflow] = df
+        defaults = DEFAULT_VOLUMES.get(workflow.split("_")[0], {})
+        columns = [column for column in df.columns if column != "Name" and df[column].notna().any()]
+        volumes[workflow] = pd.DataFrame({column: [defaults.get(column)] for column in sorted(columns)})
+
+    plates = {}
+    layout = allocate(build, tf=True)
+    for n, data in enumerate(layout["Source"], 1):
+        plates[f"Source_{n}"] = (long_table(data), f"Source_plate_{n}", "Source", {})
+    plates["Destination_1"] = (long_table(layout["Destination"]), "Destination_1", "Destination", {})
+    used = {material for _, _, materials in materials_of(build) for material in materials}
+    finals = [product for _, product, _ in materials_of(build) if product not in used]
+    tf = workflows[-1]
+    for n in range(0, len(finals), 96):
+        data = dict(zip(empty_long().index, finals[n:n + 96]))
+        key = f"{tf}_{n // 96 + 1}"
+        plates[key] = (long_table(data), key, "Transformation", {"agar": "96well"})
+    return {"workflow": workflows, "tables": tables, "volumes": volumes, "plates": plates}
+
+
+def long_table(data):
+    df = empty_long()
+    df.loc[list(data.keys()), "Value"] = list(data.values())
+    return df
+
+
+def tables_export(tables, parameter=None, cold_module=False, wide=None):
+    """Export JSON and its errors (see validation.py) from tables.
+
+    `tables` as from project_tables, `wide` lists plate keys given in wide form.
+    Entries, the deck plan and validation are memoized.
+    """
+    wide = wide or []
+    export_json = {
+        "Meta": dict(META, workflow=list(tables["workflow"])),
+        "Plate": {},
+        "Workflow": {},
+        "Workflow_volume": {},
+        "Deck": {},
+        "Parameter": dict(DEFAULT_PARAMETER, **(parameter or {})),
+        "Calibration": load_model(),
+    }
+    keys = {}
+    for key, (df, name, plate_type, extra) in tables["plates"].items():
+        keys[("Plate", key)], export_json["Plate"][key] = plate_entry(df, key in wide, name, plate_type, **extra)
+    for workflow, df in tables["tables"].items():
+        keys[("Workflow", workflow)], export_json["Workflow"][workflow] = workflow_entry(df, workflow)
+    for workflow, df in tables["volumes"].items():
+        keys[("Workflow_volume", workflow)], export_json["Workflow_volume"][workflow] = volume_entry(df)
+
+    # Deck (planned again only when tables, parameters, the tip inventory or the
+    # protocol template, which counts the tips, changed)
+    deck_key = content_hash(sorted(map(str, keys.items())), export_json["Meta"]["workflow"],
+                            export_json["Parameter"], export_json["Calibration"], cold_module, load_inventory(),
+                            load_template()[0])
+    export_json["Deck"], tip_needs = memo("Deck", deck_key, lambda: build_deck(export_json, cold_module))
+    export_json["Parameter"]["num_of_tips"] = tip_needs
+
+    errors = validate_export(export_json, keys, multichannel=export_json["Parameter"]["tf_multichannel"])
+    return export_json, errors
@@ -0,0 +1,108 @@
+"""
+Headless protocol generation without the app.
+
+Each project file goes project -> tables -> export JSON -> protocol (see
+export.py), projects run in a process pool. One protocol per project is
+written to the output folder, with `summary.json` of every project (errors of
+invalid projects and simulation results included).
+
+    python -m data.ot2_cloning.generate "data/project/*.json" -o protocols
+    python -m data.ot2_cloning.generate data/project --set tf_multichannel=true -j 4 --simulate
+"""
+import argparse
+import glob
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from data.ot2_cloning.export import project_tables, tables_export
+from data.ot2_cloning.render import render, simulate
+
+
+def project_paths(patterns):
+    # Project files of folders and glob patterns, in order without duplicates
+    paths = []
+    for pattern in patterns:
+        if Path(pattern).is_dir():
+            paths += sorted(Path(pattern).glob("*.json"))
+        else:
+            paths += [Path(i) for i in sorted(glob.glob(pattern))]
+    return list(dict.fromkeys(paths))
+
+
+def generate(path, out_dir, parameter=None, cold_module=False, run_simulation=False):
+    # Protocol of one project, summary of the result
+    # Protocols and simulations are cached by content (see render.py)
+    path = Path(path)
+    summary = {"project": path.stem, "path": str(path), "protocol": None, "errors": []}
+    try:
+        project_json = json.loads(path.read_text())
+        export_json, errors = tables_export(project_tables(project_json), parameter, cold_module)
+    except Exception as e:
+        summary["errors"] = [{"code": type(e).__name__, "item": path.stem, "message": str(e)}]
+        summary["traceback"] = traceback.format_exc()
+        return summary
+    if errors:
+        summary["errors"] = errors
+        return summary
+
+    protocol_path = Path(out_dir) / f"{path.stem}.py"
+    key, protocol = render(export_json)
+    protocol_path.write_text(protocol)
+    summary["protocol"] = str(protocol_path)
+    summary["key"] = key
+    summary["workflow"] = export_json["Meta"]["workflow"]
+    summary["num_of_tips"] = export_json["Parameter"]["num_of_tips"]
+    if run_simulation:
+        summary["simulation"] = simulate(key)
+    return summary
+
+
+def parse_value(value):
+    # --set values as JSON (numbers, true/false), plain text otherwise
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make OT-2 cloning protocols of projects")
+    parser.add_argument("projects", nargs="+", help="project folders or glob patterns of project JSON")
+    parser.add_argument("-o", "--out", default="protocols", help="output folder")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="protocol parameter, e.g. annealing=60 (see export.DEFAULT_PARAMETER)")
+    parser.add_argument("--cold-module", action="store_true", help="temperature module for cold-sensitive enzymes")
+    parser.add_argument("--simulate", action="store_true", help="simulate protocols with opentrons")
+    args = parser.parse_args(argv)
+
+    parameter = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        parameter[key] = parse_value(value)
+
+    paths = project_paths(args.projects)
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        summaries = list(executor.map(
+            generate, paths, [out_dir] * len(paths), [parameter] * len(paths),
+            [args.cold_module] * len(paths), [args.simulate] * len(paths),
+        ))
+
+    (out_dir / "summary.json").write_text(json.dumps(summaries, indent=2, default=str))
+    failed = [i for i in summaries if i["errors"] or i.get("simulation", {}).get("status") == "failed"]
+    print(f"{len(summaries) - len(failed)} protocols, {len(failed)} projects with errors -> {out_dir}")
+    for summary in failed:
+        for error in summary["errors"]:
+            print(f"{summary['project']}: {error['message']}")
+        if not summary["errors"]:
+            print(f"{summary['project']}: simulation failed, see {out_dir / 'summary.json'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
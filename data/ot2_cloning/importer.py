@@ -0,0 +1,207 @@
+"""
+Import of workflow tables and plate maps from CSV / Excel files.
+
+Files are read in chunks of CHUNK_ROWS rows (pandas chunks for CSV,
+openpyxl read-only rows for .xlsx) and every row is checked and written
+straight into the session form of the app: {column: [values]} for workflow
+tables (see workflow_schema.py) and {well: value} for plates (see
+plate_layout.py). Bad rows are skipped and all of them are reported together
+as {"code", "item", "message"} like validation.py.
+
+Columns are mapped by name:
+    workflow  Name (name, product, reaction, or the first column),
+              A_enzyme (enzyme, mix, master mix), DW (dw, water, h2o),
+              every other column is a material, numbered 0, 1, ... in order
+    plate     long form: well (well, position) and value (value, name, dna,
+              or the next column); wide form: row letters, then columns 1..N
+
+    ERROR3   duplicated product
+    ERROR10  reaction without Name
+    ERROR11  reaction without materials
+    ERROR12  unknown well of the plate
+    ERROR13  well filled twice
+
+    from data.ot2_cloning.importer import import_plate, import_workflow, read_chunks
+    data, errors = import_workflow(read_chunks(file, file.name), defaults={"A_enzyme": "[E]PCRmix"})
+    wells, errors = import_plate(read_chunks(file, file.name))
+"""
+import re
+from itertools import islice
+from pathlib import Path
+
+import pandas as pd
+
+from data.ot2_cloning.plate_layout import LAYOUTS
+from data.ot2_cloning.validation import error
+from data.ot2_cloning.workflow_schema import null
+
+CHUNK_ROWS = 500
+ALIASES = {
+    "Name": ["name", "product", "reaction"],
+    "A_enzyme": ["aenzyme", "enzyme", "mix", "mastermix"],
+    "DW": ["dw", "water", "h2o"],
+    "well": ["well", "wells", "position"],
+    "value": ["value", "name", "dna", "material"],
+}
+# A01 -> A1
+WELL = re.compile(r"^([A-Z]{1,2})0*([1-9][0-9]*)$")
+
+
+def normalize(header):
+    # " Master mix" -> "mastermix"
+    return re.sub(r"[\s_\-]", "", str(header)).lower()
+
+
+def skipped(header):
+    # Columns without header (pandas "Unnamed: 3", empty Excel cells)
+    return header is None or str(header).strip() == "" or str(header).startswith("Unnamed:")
+
+
+def cell(value):
+    # Excel numbers of whole values as text without ".0"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return null(value)
+
+
+def read_chunks(file, name, chunk_rows=CHUNK_ROWS):
+    # DataFrames of `chunk_rows` rows (text cells) of a .csv or .xlsx file
+    suffix = Path(name).suffix.lower()
+    if suffix == ".csv":
+        yield from pd.read_csv(file, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+    elif suffix == ".xlsx":
+        try:
+            import openpyxl
+        except ImportError:
+            raise ValueError("openpyxl is needed to import .xlsx files (pip install openpyxl)")
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = [f"Unnamed: {i}" if skipped(h) else str(h) for i, h in enumerate(next(rows, []))]
+            while chunk := list(islice(rows, chunk_rows)):
+                yield pd.DataFrame([row[:len(header)] for row in chunk], columns=header, dtype=object)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Only .csv and .xlsx files can be imported, not `{name}`")
+
+
+def workflow_columns(header):
+    # {file column: workflow column}, materials numbered in order of the file
+    header = [column for column in header if not skipped(column)]
+    mapping = {}
+    for target in ["Name", "A_enzyme", "DW"]:
+        for column in header:
+            if column not in mapping and normalize(column) in ALIASES[target]:
+                mapping[column] = target
+                break
+    if "Name" not in mapping.values():
+        if not header:
+            raise ValueError("ERROR10: No columns in the file")
+        mapping = {header[0]: "Name", **{k: v for k, v in mapping.items() if k != header[0]}}
+    materials = [column for column in header if column not in mapping]
+    mapping.update({column: str(n) for n, column in enumerate(materials)})
+    return mapping
+
+
+def import_workflow(chunks, defaults=None):
+    """Workflow table {column: [values]} of the rows of `chunks`, and errors.
+
+    `defaults` {column: value} fills A_enzyme / DW when the file has no such
+    column. Empty rows are skipped.
+    """
+    defaults = defaults or {}
+    data, errors, names = None, [], set()
+    line = 1  # header
+    for chunk in chunks:
+        if data is None:
+            mapping = workflow_columns(chunk.columns)
+            order = ["Name"] + sorted((c for c in mapping.values() if c.isdigit()), key=int) + ["A_enzyme", "DW"]
+            data = {column: [] for column in order}
+            positions = {column: n for n, column in enumerate(chunk.columns)}
+            sources = {target: positions[column] for column, target in mapping.items()}
+        for row in chunk.itertuples(index=False, name=None):
+            line += 1
+            values = {target: cell(row[position]) for target, position in sources.items()}
+            if all(value is None for value in values.values()):
+                continue
+            name = values["Name"]
+            if name is None:
+                errors.append(error("ERROR10", f"row {line}", f"Reaction of row {line} has no Name!"))
+                continue
+            if name in names:
+                errors.append(error("ERROR3", name, f"Duplicated Product `{name}` (row {line})!"))
+                continue
+            if all(values[c] is None for c in data if c.isdigit()):
+                errors.append(error("ERROR11", name, f"Reaction `{name}` (row {line}) has no materials!"))
+                continue
+            names.add(name)
+            for column, values_of in data.items():
+                values_of.append(values[column] if column in values else null(defaults.get(column)))
+    if data is None:
+        raise ValueError("ERROR10: No columns in the file")
+    return data, errors
+
+
+def well_name(value):
+    # "a01 " -> "A1", None when it is not a well name
+    match = WELL.match(str(value).strip().upper())
+    return f"{match[1]}{match[2]}" if match else None
+
+
+def plate_columns(header):
+    # ("long", well column, value column) or ("wide", row column, None)
+    header = list(header)
+    named = [column for column in header if not skipped(column)]
+    well = next((c for c in named if normalize(c) in ALIASES["well"]), None)
+    if well is not None:
+        others = [c for c in named if c != well]
+        value = next((c for c in others if normalize(c) in ALIASES["value"]), others[0] if others else None)
+        if value is None:
+            raise ValueError("ERROR12: Plate map has a well column but no value column")
+        return "long", well, value
+    if len(header) > 1 and all(str(c).strip().isdigit() for c in header[1:]):
+        return "wide", header[0], None
+    raise ValueError("ERROR12: Plate map needs a well column (long form) or columns 1..N (wide form)")
+
+
+def import_plate(chunks, plate_type="96well"):
+    """Plate {well: value} of filled wells of `chunks`, and errors.
+
+    Long form rows are (well, value), wide form rows a plate row (A, B, ...)
+    with one column for each plate column.
+    """
+    layout = LAYOUTS[plate_type]
+    wells, errors = {}, []
+    line = 1
+    form = None
+
+    def add(well, value, item):
+        if value is None:
+            return
+        if well not in layout["index"]:
+            errors.append(error("ERROR12", item, f"Well `{item}` is not in a {plate_type} plate!"))
+        elif well in wells:
+            errors.append(error("ERROR13", well, f"Well `{well}` is filled twice ({wells[well]}, {value})!"))
+        else:
+            wells[well] = value
+
+    for chunk in chunks:
+        if form is None:
+            form, first, second = plate_columns(chunk.columns)
+            positions = {column: n for n, column in enumerate(chunk.columns)}
+            if form == "wide":
+                plate_columns_of = [(n, str(column).strip()) for n, column in enumerate(chunk.columns) if n]
+        for row in chunk.itertuples(index=False, name=None):
+            line += 1
+            if form == "long":
+                well = cell(row[positions[first]])
+                if well is not None:
+                    add(well_name(well), cell(row[positions[second]]), well)
+                continue
+            letter = cell(row[0])
+            if letter is None:
+                continue
+            for n, column in plate_columns_of:
+                add(well_name(f"{letter}{column}"), cell(row[n]), f"{letter}{column}")
+    return wells, errors
@@ -0,0 +1,97 @@
+"""
+Plate layouts of 96, 384 and 1536-well plates.
+
+Well names, (row, column) and index tables are built once per format. Wells
+are indexed by column (A1, B1, ..., H1, A2, ...) like the OT-2 and protocol_v2
+(`WELLS_96`) order them, so long and wide forms of a plate table convert by a
+NumPy reshape:
+
+    long (96, 1) values  <->  wide (8 rows, 12 columns) values
+
+Sessions keep plates as {well: value} of filled wells, tables of either form
+are made from them only for the editor being shown. protocol_v2 loads 96-well
+labware (Destination plates sit in the thermocycler), so plates of the app are
+checked against `DECK_FORMAT` (see validation.py).
+"""
+import string
+
+import numpy as np
+import pandas as pd
+
+PLATE_FORMATS = {
+    "96well": (8, 12),
+    "384well": (16, 24),
+    "1536well": (32, 48),
+}
+# Format of plates loaded by protocol_v2
+DECK_FORMAT = "96well"
+
+
+def row_names(count):
+    # A ... Z, AA, AB, ... (1536-well plates have 32 rows)
+    letters = string.ascii_uppercase
+    return [letters[i] if i < 26 else letters[i // 26 - 1] + letters[i % 26] for i in range(count)]
+
+
+def build_layout(rows, columns):
+    row_name = row_names(rows)
+    wells = np.array([f"{r}{c}" for c in range(1, columns + 1) for r in row_name])
+    return {
+        "rows": row_name,
+        "columns": list(range(1, columns + 1)),
+        "wells": wells,
+        "index": {well: i for i, well in enumerate(wells)},
+        "position": {well: (i % rows, i // rows) for i, well in enumerate(wells)},
+    }
+
+
+LAYOUTS = {name: build_layout(*shape) for name, shape in PLATE_FORMATS.items()}
+
+
+def plate_format(wells):
+    # Format of a plate by its number of wells
+    for name, (rows, columns) in PLATE_FORMATS.items():
+        if rows * columns == wells:
+            return name
+    raise ValueError(f"No plate format with {wells} wells")
+
+
+def well_names(plate_type="96well"):
+    return list(LAYOUTS[plate_type]["wells"])
+
+
+def empty_long(plate_type="96well"):
+    # Long form: one row per well, column "Value"
+    plate_df = pd.DataFrame(index=LAYOUTS[plate_type]["wells"], columns=["Value"])
+    plate_df.index.name = "well"
+    return plate_df
+
+
+def to_wide(df):
+    # Long form (index well) to wide form (index row, columns 1..N)
+    layout = LAYOUTS[plate_format(len(df))]
+    values = df["Value"].reindex(layout["wells"]).to_numpy()
+    wide = values.reshape(len(layout["columns"]), len(layout["rows"])).T
+    return pd.DataFrame(wide, index=layout["rows"], columns=layout["columns"])
+
+
+def to_wells(df):
+    # Long or wide form to {well: value} of filled wells only
+    long = df if list(df.columns) == ["Value"] else to_long(df)
+    return {well: value for well, value in long["Value"].items() if not pd.isna(value) and value != ""}
+
+
+def from_wells(wells, plate_type="96well", wide=False):
+    # {well: value} to long form (wide form with `wide`)
+    df = empty_long(plate_type)
+    df.loc[list(wells.keys()), "Value"] = list(wells.values())
+    return to_wide(df) if wide else df
+
+
+def to_long(df):
+    # Wide form (index row, columns 1..N) to long form (index well)
+    layout = LAYOUTS[plate_format(df.size)]
+    df = df.rename(columns=int).reindex(index=layout["rows"], columns=layout["columns"])
+    long = pd.DataFrame({"Value": df.to_numpy().T.reshape(-1)}, index=layout["wells"])
+    long.index.name = "well"
+    return long
@@ -0,0 +1,273 @@
+"""
+Loader of protocols made before, without running them.
+
+The PARAMETERS literal of a protocol file is read from its syntax tree
+(`ast`), nothing of the protocol is executed. Exports of older apps are
+migrated to the export JSON of export.py:
+
+    v1 app    "Plates", "Reactions", "Reaction_volume", "Parameters"
+              (regacy/appv1.py, tables as pandas to_dict)
+    schema 1  protocol_v2 before columnar tables (see workflow_schema.py)
+
+The deck is not migrated, it is planned again when the protocol is made.
+An archive folder of protocols is indexed in `.protocols.json` (workflows and
+products of each file, by mtime and size); only changed files are parsed,
+by a process pool.
+
+    from data.ot2_cloning.protocol_loader import index_archive, load_protocol
+    export_json = load_protocol(text)
+    index = index_archive("data/protocol")
+
+    python -m data.ot2_cloning.protocol_loader data/protocol -j 4
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from data.ot2_cloning.export import DEFAULT_PARAMETER, META
+from data.ot2_cloning.workflow_schema import null, upgrade, upgrade_volume, upgrade_workflow
+
+ARCHIVE_DIR = Path("data/protocol")
+INDEX_NAME = ".protocols.json"
+TASK = "OT-2 cloning"
+# v1 plate and reaction types -> types of the current app
+V1_PLATE_TYPES = {"source": "Source", "Reaction": "Destination", "TF": "Transformation"}
+V1_REACTION_TYPES = {"PCR": "PCR", "Assembly": "Gibson"}
+V1_PARAMETERS = {"Stop_between_reactions": "stop_reaction", "PCR_extension_time": "pcr_extension",
+                 "TF_recovery_time": "tf_recovery"}
+
+# path -> (mtime_ns, size, export json)
+_cache = {}
+_lock = threading.Lock()
+
+
+class NanToNone(ast.NodeTransformer):
+    # v1 protocols were written by str() of the export, NaN cells as a bare `nan`
+    def visit_Name(self, node):
+        if node.id == "nan":
+            return ast.copy_location(ast.Constant(None), node)
+        return node
+
+
+def literals(text, names=("PARAMETERS",), filename="<protocol>"):
+    # {name: value} of top-level literal assignments, the file is parsed, not run
+    try:
+        tree = ast.parse(text, filename)
+    except SyntaxError as e:
+        raise ValueError(f"Protocol can not be parsed: {e}")
+    values = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets, value = [node.target], node.value
+        else:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name) and target.id in names:
+                try:
+                    values[target.id] = ast.literal_eval(NanToNone().visit(value))
+                except (ValueError, TypeError, MemoryError, RecursionError):
+                    # TypeError of unhashable keys ({[1]: 2}), the others of huge or deep values
+                    raise ValueError(f"{target.id} of the protocol (line {node.lineno}) is not a literal")
+    return values
+
+
+def v1_columns(columns):
+    # {v1 column: column}: DNA1.. -> 0.., Enzyme1 -> A_enzyme, Enzyme2.. -> after DNAs
+    def number(column):
+        return int(re.findall(r"\d+", column)[0])
+    dnas = sorted((c for c in columns if re.fullmatch(r"DNA\d+", c)), key=number)
+    enzymes = sorted((c for c in columns if re.fullmatch(r"Enzyme\d+", c)), key=number)
+    mapping = {"Name": "Name", "DW": "DW"}
+    mapping.update({column: str(n) for n, column in enumerate(dnas)})
+    if enzymes:
+        mapping[enzymes[0]] = "A_enzyme"
+    mapping.update({column: str(n) for n, column in enumerate(enzymes[1:], len(dnas))})
+    return {column: target for column, target in mapping.items() if column in columns}
+
+
+def enzyme(value):
+    # v1 enzymes had no "[E]" prefix
+    if value is None or value.startswith("[E]"):
+        return value
+    return f"[E]{value}"
+
+
+def migrate_v1(parameters):
+    # Export JSON (schema 2) of a v1 app export
+    workflows, tables, volumes = [], {}, {}
+    for reaction in parameters["Reactions"].values():
+        data = upgrade_workflow({"data": reaction["data"]})["data"]
+        if not any(data.get("Name", [])):
+            continue
+        workflow = f"{V1_REACTION_TYPES.get(reaction['type'], reaction['type'])}_{len(workflows) + 1}"
+        mapping = v1_columns(list(data))
+        reagents = {"DW", *(c for c in mapping if c.startswith("Enzyme"))}
+        tables[workflow] = {"type": workflow.split("_")[0], "data": {
+            mapping[c]: [enzyme(v) for v in data[c]] if c in reagents else data[c] for c in mapping
+        }}
+        volume = upgrade_volume(parameters.get("Reaction_volume", {}).get(reaction["type"], {}))
+        volumes[workflow] = {mapping[c]: v for c, v in volume.items() if c in mapping and c != "Name"}
+        workflows.append(workflow)
+
+    plates, counts = {}, {}
+    tf_plates = [plate for plate in parameters["Plates"].values()
+                 if plate["type"] == "TF" and any(null(v) for v in plate["data"].values())]
+    if tf_plates:
+        workflows.append(f"Transformation_{len(workflows) + 1}")
+    for plate in parameters["Plates"].values():
+        plate_type = V1_PLATE_TYPES.get(plate["type"], plate["type"])
+        if plate_type == "Transformation":
+            if plate not in tf_plates:
+                continue
+            plate_type = workflows[-1]
+        counts[plate_type] = counts.get(plate_type, 0) + 1
+        entry = {"name": plate["name"], "type": plate_type.split("_")[0],
+                 "data": {well: null(v) for well, v in plate["data"].items() if null(v) is not None}}
+        if plate_type.startswith("Transformation"):
+            entry["agar"] = "96well"
+        plates[f"{plate_type}_{counts[plate_type]}"] = entry
+
+    v1 = parameters["Parameters"]
+    return {
+        "Meta": dict(META, workflow=workflows, Messenger=v1.get("Messenger") or META["Messenger"]),
+        "Plate": plates,
+        "Workflow": tables,
+        "Workflow_volume": volumes,
+        "Deck": {},
+        "Parameter": dict(DEFAULT_PARAMETER, **{new: v1[old] for old, new in V1_PARAMETERS.items() if old in v1}),
+    }
+
+
+def move_plates(parameters):
+    # Early schema 1 exports kept Transformation plates ({well: value}) in Workflow
+    workflows = parameters.get("Workflow", {})
+    plates = {key: entry for key, entry in workflows.items()
+              if not all(isinstance(values, (dict, list)) for values in entry["data"].values())}
+    if not plates:
+        return parameters
+    return dict(parameters,
+                Plate=dict(parameters.get("Plate", {}), **plates),
+                Workflow={key: entry for key, entry in workflows.items() if key not in plates})
+
+
+def migrate(parameters):
+    # Export JSON (schema 2) of PARAMETERS of any version
+    if "Reactions" in parameters and "Plates" in parameters:
+        task = parameters.get("Parameters", {}).get("protocol")
+        export_json = migrate_v1(parameters)
+    else:
+        task = parameters.get("Meta", {}).get("Task")
+        export_json = upgrade(move_plates(parameters))
+    if task != TASK:
+        raise ValueError(f"This is not {TASK} protocol")
+    return export_json
+
+
+def load_protocol(text, filename="<protocol>"):
+    # Export JSON of a protocol file (text)
+    values = literals(text, filename=filename)
+    if "PARAMETERS" not in values:
+        raise ValueError("No PARAMETERS in the protocol")
+    return migrate(values["PARAMETERS"])
+
+
+def read_protocol(path):
+    # Export JSON of a protocol file, parsed again only when it changed
+    path = Path(path)
+    stat = path.stat()
+    cached = _cache.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    export_json = load_protocol(path.read_text(), str(path))
+    with _lock:
+        _cache[path] = (stat.st_mtime_ns, stat.st_size, export_json)
+    return export_json
+
+
+def summarize(path):
+    # Index entry of a protocol file, errors are kept instead of raised
+    path = Path(path)
+    stat = path.stat()
+    entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "name": path.stem,
+             "workflow": [], "products": [], "error": None}
+    try:
+        text = path.read_text()
+        metadata = literals(text, names=("metadata",), filename=str(path)).get("metadata", {})
+        export_json = load_protocol(text, str(path))
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        entry["error"] = str(e)
+        return entry
+    entry["name"] = metadata.get("protocolName", path.stem).replace("{{PRESENT_TIME}}", "").strip()
+    entry["workflow"] = export_json["Meta"]["workflow"]
+    entry["products"] = [name for table in export_json["Workflow"].values()
+                         for name in table["data"].get("Name", []) if name is not None]
+    return entry
+
+
+def index_archive(archive_dir=ARCHIVE_DIR, workers=None):
+    """{relative path: entry} of protocols (*.py) in an archive folder.
+
+    The index is kept in `.protocols.json` of the folder, only new and changed
+    files are parsed (in a process pool when there are many, unless `workers`
+    is 1).
+    """
+    archive_dir = Path(archive_dir)
+    if not archive_dir.is_dir():
+        return {}
+    index_path = archive_dir / INDEX_NAME
+    index = json.loads(index_path.read_text()) if index_path.exists() else {}
+    files = {path.relative_to(archive_dir).as_posix(): path for path in sorted(archive_dir.rglob("*.py"))}
+    changed = [
+        name for name, path in files.items()
+        if (index.get(name, {}).get("mtime_ns"), index.get(name, {}).get("size"))
+        != (path.stat().st_mtime_ns, path.stat().st_size)
+    ]
+    if changed or set(index) - set(files):
+        paths = [files[name] for name in changed]
+        if len(paths) > 8 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                entries = list(executor.map(summarize, paths, chunksize=16))
+        else:
+            entries = [summarize(path) for path in paths]
+        index = {name: index[name] for name in files if name in index}
+        index.update(zip(changed, entries))
+        index = dict(sorted(index.items()))
+        # Unique temporary file, app sessions and the CLI may write the index at the same time
+        with tempfile.NamedTemporaryFile("w", dir=archive_dir, prefix=f"{INDEX_NAME}.", suffix=".tmp",
+                                         delete=False) as tmp:
+            tmp.write(json.dumps(index, indent=1))
+        try:
+            # Temporary files are private (0600), the index is read by everyone using the archive
+            os.chmod(tmp.name, 0o644)
+            os.replace(tmp.name, index_path)
+        except OSError:
+            os.unlink(tmp.name)
+            raise
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index an archive of OT-2 cloning protocols")
+    parser.add_argument("archive", nargs="?", default=str(ARCHIVE_DIR), help="folder of protocol files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args(argv)
+
+    index = index_archive(args.archive, args.jobs)
+    failed = {name: entry for name, entry in index.items() if entry["error"]}
+    print(f"{len(index) - len(failed)} protocols, {len(failed)} files with errors -> "
+          f"{Path(args.archive) / INDEX_NAME}")
+    for name, entry in failed.items():
+        print(f"{name}: {entry['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
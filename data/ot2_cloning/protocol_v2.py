@@ -1,5 +1,6 @@
 from opentrons import protocol_api
 from opentrons import simulate
+from opentrons import types
 
 protocol = simulate.get_protocol_api("2.13")
 import pandas as pd
@@ -8,6 +9,7 @@ import time
 import json
 import requests
 import logging
+import os
 
 metadata = {
     "protocolName": "{{PRESENT_TIME}} Cloning (PCR, Assembly, Transformation)",
@@ -23,6 +25,7 @@ PARAMETERS = {
         "version": "2.1",
         "workflow": ["PCR_1", "GGA_2", "Gibson_3", "Transformation_4"],
         "Messenger": "kun",
+        "schema": 2,
     },
     "Plate": {
         "Source_1": {
@@ -50,61 +53,42 @@ PARAMETERS = {
         "PCR_1": {
             "type": "PCR",
             "data": {
-                "0": {"0": "a"},
-                "1": {"0": "s"},
-                "2": {"0": "d"},
-                "Name": {"0": "asdf"},
-                "A_enzyme": {"0": "[E]PCRmix"},
-                "DW": {"0": "[E]DW"},
+                "0": ["a"],
+                "1": ["s"],
+                "2": ["d"],
+                "Name": ["asdf"],
+                "A_enzyme": ["[E]PCRmix"],
+                "DW": ["[E]DW"],
             },
         },
         "GGA_2": {
             "type": "GGA",
             "data": {
-                "0": {"0": "asdf"},
-                "1": {"0": "a"},
-                "2": {"0": "d"},
-                "3": {"0": "[E]BsaI"},
-                "4": {"0": "[E]T4_ligase"},
-                "Name": {"0": "bde"},
-                "A_enzyme": {"0": "[E]Buffer"},
-                "DW": {"0": "[E]DW"},
+                "0": ["asdf"],
+                "1": ["a"],
+                "2": ["d"],
+                "3": ["[E]BsaI"],
+                "4": ["[E]T4_ligase"],
+                "Name": ["bde"],
+                "A_enzyme": ["[E]Buffer"],
+                "DW": ["[E]DW"],
             },
         },
         "Gibson_3": {
             "type": "Gibson",
             "data": {
-                "0": {"0": "bde"},
-                "1": {"0": "asdf"},
-                "Name": {"0": "final"},
-                "A_enzyme": {"0": "[E]Gibsonmix"},
-                "DW": {"0": "[E]DW"},
+                "0": ["bde"],
+                "1": ["asdf"],
+                "Name": ["final"],
+                "A_enzyme": ["[E]Gibsonmix"],
+                "DW": ["[E]DW"],
             },
         },
     },
     "Workflow_volume": {
-        "PCR_1": {
-            "0": {"0": "1"},
-            "1": {"0": "0.5"},
-            "2": {"0": "0.5"},
-            "A_enzyme": {"0": "12.5"},
-            "DW": {"0": "10.5"},
-        },
-        "GGA_2": {
-            "0": {"0": "1"},
-            "1": {"0": "1"},
-            "2": {"0": "1"},
-            "3": {"0": "1"},
-            "4": {"0": "0.5"},
-            "A_enzyme": {"0": "2.5"},
-            "DW": {"0": "3"},
-        },
-        "Gibson_3": {
-            "0": {"0": "2"},
-            "1": {"0": "2"},
-            "A_enzyme": {"0": "5"},
-            "DW": {"0": "1"},
-        },
+        "PCR_1": {"0": 1.0, "1": 0.5, "2": 0.5, "A_enzyme": 12.5, "DW": 10.5},
+        "GGA_2": {"0": 1.0, "1": 1.0, "2": 1.0, "3": 1.0, "4": 0.5, "A_enzyme": 2.5, "DW": 3.0},
+        "Gibson_3": {"0": 2.0, "1": 2.0, "A_enzyme": 5.0, "DW": 1.0},
     },
     "Deck": {
         "Enzyme_position": {
@@ -117,6 +101,10 @@ PARAMETERS = {
             "[E]CPcell": "B1",
             "[E]SOC": "B2",
         },
+        "Tip_racks": {
+            "p20_tip": {"rack_id": "p20-0001", "starting_tip": "A1", "tips": 9, "type": "opentrons_96_tiprack_20ul"},
+            "p300_tip": {"rack_id": "p300-0001", "starting_tip": "A1", "tips": 8, "type": "opentrons_96_tiprack_300ul"},
+        },
         "Deck_position": {
             "Enzyme_tube": 1,
             "p20_tip": 2,
@@ -132,20 +120,659 @@ PARAMETERS = {
         "annealing": 57,
         "pcr_extension": 25,
         "tf_recovery": 40,
+        "tf_recovery_module": "thermocycler",
+        "tf_multichannel": False,
+        "tf_agar": "96well",
+        "tf_dilution": 0,
+        "notify_lead_time": 5,
         "num_of_tips": "NULL",
     },
 }
 
 default_labware = "biorad_96_wellplate_200ul_pcr"
-logging.basicConfig(filename=f"{metadata['protocolName']}.log", level=logging.INFO)
+# Bulk reagents (DW, SOC, CP cell), same as reservoir_plan.py
+RESERVOIR = {"labware": "nest_12_reservoir_15ml", "dead_volume": 500}
+
+
+# [Schema]
+# Workflow tables are columnar (Meta "schema": 2, see workflow_schema.py),
+# {"column": {"row": "value"}} tables of schema 1 are converted on load.
+def load_workflows(parameters):
+    empty = ["", "None", "nan", None]
+    if parameters["Meta"].get("schema", 1) >= 2:
+        return parameters
+    for entry in parameters["Workflow"].values():
+        data = entry["data"]
+        rows = list(dict.fromkeys(row for values in data.values() for row in values))
+        entry["data"] = {
+            column: [None if values.get(row) in empty else values.get(row) for row in rows]
+            for column, values in data.items()
+        }
+    for volumes in parameters["Workflow_volume"].values():
+        for column, value in volumes.items():
+            volumes[column] = float(next(iter(value.values())) if isinstance(value, dict) else value)
+    parameters["Meta"]["schema"] = 2
+    return parameters
+
+
+load_workflows(PARAMETERS)
+
+# Run logs and traces are kept in user storage on the robot
+LOG_DIR = "/data/user_storage" if os.path.isdir("/data/user_storage") else "."
+RUN_NAME = f"{time.strftime('%y%m%d_%H%M%S')}_{PARAMETERS['Meta']['Task'].replace(' ', '_')}"
+logging.basicConfig(filename=os.path.join(LOG_DIR, f"{RUN_NAME}.log"), level=logging.INFO)
 logging.info(f"Protocol Start: {time.strftime('%Y-%m-%d %H:%M:%S')}")
 logging.info(f"user: {PARAMETERS['Meta']['Messenger']}")
 
+# [Time model]
+# Planned duration of robot operations (seconds), used for ETA of notifications.
+DURATION_MODEL = {
+    "tip_pickup": 7.0,
+    "tip_drop": 5.0,
+    "travel": 2.5,  # move between two labware
+    "submerge": 1.0,  # move into / out of liquid per aspirate or dispense
+    "blow_out": 1.5,
+    "tc_lid": 20.0,  # open or close lid
+    "tc_lid_heat": 120.0,
+    "tc_ramp_rate": 2.0,  # degree per second
+    "liquid_scale": 1.0,  # real / nominal time of liquid handling at flow rate
+}
+# Fitted from real runs by duration_model.py
+DURATION_MODEL.update(PARAMETERS.get("Calibration", {}))
+
+
+def liquid_seconds(volume, rate):
+    # Aspirate or dispense `volume` uL at `rate` uL/s
+    return DURATION_MODEL["submerge"] + DURATION_MODEL["liquid_scale"] * float(volume) / float(rate)
+
+
+def transfer_seconds(count, volume, rate, mix=(0, 0), mix_rate=None, new_tip=True):
+    # `count` single transfers (pipette.transfer)
+    each = 2 * DURATION_MODEL["travel"] + 2 * liquid_seconds(volume, rate)
+    if new_tip:
+        each += DURATION_MODEL["tip_pickup"] + DURATION_MODEL["tip_drop"]
+    if sum(mix):
+        each += 2 * mix[0] * liquid_seconds(mix[1], mix_rate or rate)
+    return count * each
+
+
+def distribute_seconds(count, volume, rate, max_volume, disposal_volume=5, mix_before=(0, 0)):
+    # One source to `count` wells (pipette.distribute, new_tip="once")
+    if not count:
+        return 0.0
+    per_aspirate = max(int((max_volume - disposal_volume) // float(volume)), 1)
+    aspirates = -(-count // per_aspirate)
+    seconds = DURATION_MODEL["tip_pickup"] + DURATION_MODEL["tip_drop"]
+    seconds += aspirates * (
+        DURATION_MODEL["travel"]
+        + liquid_seconds(per_aspirate * float(volume) + disposal_volume, rate)
+        + DURATION_MODEL["blow_out"]
+        + 2 * mix_before[0] * liquid_seconds(mix_before[1], rate)
+    )
+    seconds += count * (DURATION_MODEL["travel"] + liquid_seconds(volume, rate))
+    return seconds
+
+
+def thermocycler_seconds(program, temperature=25.0):
+    # Planned duration of each step in thermocycler program (see run_thermocycler)
+    def ramp(start, end):
+        return abs(end - start) / DURATION_MODEL["tc_ramp_rate"]
+
+    durations = []
+    for step in program:
+        if "close_lid" in step:
+            durations.append(DURATION_MODEL["tc_lid"])
+        elif "lid" in step:
+            durations.append(DURATION_MODEL["tc_lid_heat"])
+        elif "profile" in step:
+            cycle = 0.0
+            for profile_step in step["profile"]:
+                cycle += ramp(temperature, profile_step["temperature"])
+                cycle += profile_step["hold_time_seconds"]
+                temperature = profile_step["temperature"]
+            durations.append(cycle * step["repetitions"])
+        elif "temperature" in step:
+            durations.append(ramp(temperature, step["temperature"]) + step.get("seconds", 0))
+            temperature = step["temperature"]
+        else:
+            durations.append(0.0)
+    return durations
+
+
+def pcr_program():
+    profile = [
+        {"temperature": 94, "hold_time_seconds": 20},
+        {
+            "temperature": int(PARAMETERS["Parameter"]["annealing"]),
+            "hold_time_seconds": 20,
+        },
+        {
+            "temperature": 68,
+            "hold_time_seconds": int(PARAMETERS["Parameter"]["pcr_extension"]),
+        },
+    ]
+    return [
+        {"close_lid": True},
+        {"lid": 95},
+        {"temperature": 94, "seconds": 30},
+        {"profile": profile, "repetitions": 30},
+        {"temperature": 68, "seconds": 60},
+        {"temperature": 12, "seconds": 300},
+        {"deactivate_lid": True},
+        {"temperature": 12},
+        # End with closed lid
+    ]
+
+
+def gibson_program():
+    program = [
+        {"close_lid": True},
+        {"lid": 80},
+        {"temperature": 37, "seconds": 300},  # DpnI
+        {"temperature": 65, "seconds": 20},  # denaturation
+        {"temperature": 50, "seconds": 2400},
+    ]
+    # Ramp rate is 0.1 degree per second
+    for current_tmp in range(45, 12, -5):
+        program.append({"temperature": current_tmp, "seconds": 45})
+    program += [{"deactivate_lid": True}, {"temperature": 12}]
+    return program
+
+
+def gga_program():
+    profile = [
+        {"temperature": 37, "hold_time_seconds": 20},
+        {"temperature": 16, "hold_time_seconds": 20},
+    ]
+    return [
+        {"close_lid": True},
+        {"lid": 90},
+        {"profile": profile, "repetitions": 30},
+        {"temperature": 12, "seconds": 300},
+        {"deactivate_lid": True},
+        {"temperature": 12},
+    ]
+
+
+def transfer_materials_seconds(workflow_df, volume_dict, mix_last=(0, 0)):
+    # Planned duration of transfer_materials (same flow rates)
+    df = pd.DataFrame(workflow_df["data"])
+    empty = ["", "None", "nan"]
+    seconds = 0.0
+    for column, rate, mix_before in [("DW", 50, (0, 0)), ("A_enzyme", 20, (2, 50))]:
+        for name, tmp in df.groupby(column):
+            if name in empty:
+                continue
+            seconds += distribute_seconds(
+                len(tmp), volume_dict[column], rate, 300, mix_before=mix_before
+            )
+    for column in df.columns.drop(["Name", "A_enzyme", "DW"], errors="ignore"):
+        count = (df[column].notna() & ~df[column].isin(empty)).sum()
+        seconds += transfer_seconds(count, volume_dict[column], 1)
+    if sum(mix_last):
+        seconds += len(df) * (
+            DURATION_MODEL["tip_pickup"]
+            + DURATION_MODEL["tip_drop"]
+            + DURATION_MODEL["travel"]
+            + 2 * mix_last[0] * liquid_seconds(mix_last[1], 10)
+        )
+    return seconds
+
+
+def transformation_samples(workflow):
+    # Samples of a Transformation workflow
+    samples = []
+    for key in tf_plates(workflow):
+        for value in PARAMETERS["Plate"][key]["data"].values():
+            if value not in ["", "None", "nan"] and value not in samples:
+                samples.append(value)
+    return samples
+
+
+def recovery_offloaded():
+    # Recovery on temperature module or heater-shaker instead of thermocycler
+    return PARAMETERS["Parameter"].get("tf_recovery_module", "thermocycler") != "thermocycler"
+
+
+def multichannel_transformation(workflow):
+    # 8-channel Transformation (tf_multichannel) only when every product column
+    # is full of samples of the workflow, the 8-channel moves whole columns and
+    # would give CP cells and DNA to the other wells of a partial column
+    if not PARAMETERS["Parameter"].get("tf_multichannel", False):
+        return False
+    samples = transformation_samples(workflow)
+    for key, column in transformation_columns(workflow):
+        data = PARAMETERS["Plate"][key]["data"]
+        if any(data.get(f"{row}{column}") not in samples for row in "ABCDEFGH"):
+            return False
+    return True
+
+
+# uL of each Transformation well: CP cell, reaction mix (DNA) and recovery media
+TF_VOLUMES = {"cp_cell": 45, "reaction_mix": 5, "media": 100}
+
+
+def transformation_columns(workflow):
+    # Destination columns holding samples of a Transformation workflow [(plate key, column)]
+    samples = transformation_samples(workflow)
+    columns = []
+    for key, plate in PARAMETERS["Plate"].items():
+        if plate["type"] != "Destination":
+            continue
+        for well, value in plate["data"].items():
+            if value in samples and (key, well[1:]) not in columns:
+                columns.append((key, well[1:]))
+    return columns
+
+
+# [Spotting]
+# Agar labware of TF plates. Spots follow the 96-well table of a TF plate in
+# column order: one spot per well on 96-well plates, a 9 mm grid on the single
+# well of an omnitray, a grid of spots in each well of 6/12/24-well plates.
+# agar_height is the agar surface above the well bottom (mm).
+AGAR_LABWARE = {
+    "96well": {"labware": "biorad_96_wellplate_200ul_pcr", "agar_height": 3.0, "pitch": 9.0, "multichannel": True},
+    "omnitray": {"labware": "nest_1_reservoir_195ml", "agar_height": 4.0, "pitch": 9.0, "multichannel": True},
+    "24well": {"labware": "corning_24_wellplate_3.4ml_flat", "agar_height": 5.0, "pitch": 4.5, "multichannel": False},
+    "12well": {"labware": "corning_12_wellplate_6.9ml_flat", "agar_height": 5.0, "pitch": 6.0, "multichannel": False},
+    "6well": {"labware": "corning_6_wellplate_16.8ml_flat", "agar_height": 3.0, "pitch": 9.0, "multichannel": False},
+}
+SPOT_VOLUME = 4
+SPOT_DISPOSAL = 1
+DILUTION = (10, 90)  # cells and diluent (SOC) of each 10-fold dilution step
+# Column order, same as plate_layout.well_names("96well") of the app
+WELLS_96 = [row + str(col) for col in range(1, 13) for row in "ABCDEFGH"]
+
+
+def tf_plates(workflow):
+    # TF plates of a Transformation workflow are keyed "<workflow>_<n>"
+    return [
+        key for key, plate in PARAMETERS["Plate"].items()
+        if plate["type"] == "Transformation" and key.startswith(f"{workflow}_")
+    ]
+
+
+def agar(plate):
+    return AGAR_LABWARE[plate.get("agar", PARAMETERS["Parameter"].get("tf_agar", "96well"))]
+
+
+def sample_source(sample):
+    # Well of transformed cells, right of the product on Destination plate
+    for plate in PARAMETERS["Plate"].values():
+        if plate["type"] != "Destination":
+            continue
+        for well, value in plate["data"].items():
+            if value == sample:
+                return f"{well[0]}{int(well[1:]) + 1}"
+
+
+def dilution_steps():
+    return int(PARAMETERS["Parameter"].get("tf_dilution", 0))
+
+
+def spot_series(workflow):
+    # Spots in order [(plate key, well, sample, dilution step)].
+    # Repeated spots of a sample are its dilution steps (neat, 1/10, 1/100, ...).
+    seen = {}
+    spots = []
+    for key in tf_plates(workflow):
+        data = PARAMETERS["Plate"][key]["data"]
+        for well in sorted(data, key=WELLS_96.index):
+            sample = data[well]
+            if sample in ["", "None", "nan", None]:
+                continue
+            step = min(seen.get(sample, 0), dilution_steps())
+            seen[sample] = seen.get(sample, 0) + 1
+            spots.append((key, well, sample, step))
+    return spots
+
+
+def dilution_well(workflow, sample, step):
+    # Dilution `step` of a sample on TF_dilution plate: same row,
+    # the steps of each source column next to each other
+    source = sample_source(sample)
+    columns = sorted({int(sample_source(s)[1:]) for s in transformation_samples(workflow)})
+    return f"{source[0]}{columns.index(int(source[1:])) * dilution_steps() + step}"
+
+
+def beside_heater_shaker(key):
+    # 8-channel can not reach labware beside, in front of or behind a heater-shaker
+    # Tips are planned before the deck (Tip model), labware counts as reachable then
+    deck = PARAMETERS.get("Deck", {}).get("Deck_position", {})
+    if PARAMETERS["Parameter"].get("tf_recovery_module") != "heatershaker" or "Recovery" not in deck:
+        return False
+    return deck.get(key) in [deck["Recovery"] + i for i in [-3, -1, 1, 3]]
+
+
+def spotting_moves(workflow, multichannel=False):
+    """Spotting of a Transformation workflow as pipette moves.
+
+    [(sample, step, [(plate key, well)])]: each move mixes a sample (or its
+    dilution `step`) once and spots it on the wells, several spots per
+    aspiration. 8-channel moves are columns addressed by their top well, None
+    when the TF plates do not allow it (partial columns, rows not matching the
+    source column, agar labware without 9 mm rows, plates next to a heater-shaker).
+    """
+    spots = spot_series(workflow)
+    if dilution_steps() and beside_heater_shaker("TF_dilution"):
+        multichannel = False
+    if not multichannel:
+        moves = {}
+        for key, well, sample, step in spots:
+            moves.setdefault((sample, step), []).append((key, well))
+        return [(sample, step, wells) for (sample, step), wells in moves.items()]
+
+    columns = {}
+    for key, well, sample, step in spots:
+        columns.setdefault((key, well[1:]), {})[well[0]] = (sample, step)
+    moves = {}
+    for (key, column), rows in columns.items():
+        if not agar(PARAMETERS["Plate"][key])["multichannel"] or len(rows) != 8 or beside_heater_shaker(key):
+            return None
+        sources = {(sample_source(sample)[1:], step) for sample, step in rows.values()}
+        if len(sources) != 1 or any(sample_source(sample)[0] != row for row, (sample, _) in rows.items()):
+            return None
+        moves.setdefault(rows["A"], []).append((key, f"A{column}"))
+    return [(sample, step, wells) for (sample, step), wells in moves.items()]
+
+
+def spotting_seconds(workflow):
+    # Planned duration of dilution and spotting (same moves as spot_samples)
+    multichannel = PARAMETERS["Parameter"].get("tf_multichannel", False)
+    moves = spotting_moves(workflow, multichannel)
+    if moves is None:
+        moves = spotting_moves(workflow)
+    per_aspirate = int((20 - SPOT_DISPOSAL) // SPOT_VOLUME)
+    seconds = 0.0
+    for sample, step, wells in moves:
+        aspirates = -(-len(wells) // per_aspirate)
+        seconds += DURATION_MODEL["tip_pickup"] + DURATION_MODEL["tip_drop"] + 4 * liquid_seconds(20, 8)
+        seconds += aspirates * (
+            2 * DURATION_MODEL["travel"] + liquid_seconds(per_aspirate * SPOT_VOLUME, 8) + DURATION_MODEL["blow_out"]
+        )
+        seconds += len(wells) * (2 * DURATION_MODEL["travel"] + liquid_seconds(SPOT_VOLUME, 15))
+    if dilution_steps():
+        sources = len({sample for sample, step, wells in moves})
+        seconds += distribute_seconds(sources * dilution_steps(), DILUTION[1], 20, 300)
+        seconds += transfer_seconds(sources * dilution_steps(), DILUTION[0], 7.56, mix=(3, 20))
+    return seconds
+
+
+def transformation_seconds(workflow):
+    # Planned duration of each part of run_Transformation
+    samples = len(transformation_samples(workflow))
+    # 8-channel moves a column at once
+    moves = samples
+    if multichannel_transformation(workflow):
+        moves = len(transformation_columns(workflow))
+    heat_shock = distribute_seconds(moves, 45, 20, 300, 10, mix_before=(2, 25))
+    heat_shock += transfer_seconds(moves, 5, 7.56)
+    heat_shock += 2 * DURATION_MODEL["tc_lid"] + 600
+    heat_shock += sum(thermocycler_seconds([{"temperature": 42, "seconds": 90}, {"temperature": 8}], 12))
+    heat_shock += transfer_seconds(moves, 100, 20) + 30
+    return {
+        "heat_shock": heat_shock,
+        "move": transfer_seconds(moves, 150, 20, mix=(2, 100)),
+        "recovery": float(PARAMETERS["Parameter"]["tf_recovery"]) * 60,
+        # Mixing on a module is done after switching back to single-channel
+        "mix": 60 if PARAMETERS["Parameter"].get("tf_recovery_module") == "heatershaker"
+        else transfer_seconds(samples if recovery_offloaded() else moves, 40, 20) / 2,
+        "spotting": spotting_seconds(workflow),
+    }
+
+
+def workflow_seconds(workflow):
+    # Planned duration of a workflow (thermocycler busy time)
+    key = workflow.split("_")[0]
+    if key == "Transformation":
+        parts = transformation_seconds(workflow)
+        if recovery_offloaded():
+            # Recovery, mixing and spotting overlap with next workflows
+            return parts["heat_shock"] + parts["move"]
+        return parts["heat_shock"] + parts["recovery"] + parts["mix"] + parts["spotting"]
+    programs = {"PCR": pcr_program, "GGA": gga_program, "Gibson": gibson_program}
+    return transfer_materials_seconds(
+        PARAMETERS["Workflow"][workflow], PARAMETERS["Workflow_volume"][workflow], (2, 15)
+    ) + sum(thermocycler_seconds(programs[key]()))
+
+
+# [Tip model]
+# Tip pickups of run() for the tip inventory of the app, which plans tip racks
+# from them before the protocol is rendered (see render.template_model).
+MAX_VOLUME = {"p20": 20, "p300": 300}
+
+
+def transfer_tips(volume, pipette, count=1):
+    # Tips of `count` transfers with new_tip="always", volumes over the max volume are split
+    return count * int(-(-float(volume) // MAX_VOLUME[pipette]))
+
+
+def transfer_materials_tips(workflow_df, volume_dict, mix_last=(0, 0)):
+    # [(pipette, channels, pickups)] of transfer_materials
+    df = pd.DataFrame(workflow_df["data"])
+    empty = ["", "None", "nan"]
+    pickups = []
+    # DW and A_enzyme: one tip for each reagent
+    for column in ["DW", "A_enzyme"]:
+        if column in df:
+            pickups.append(("p300", 1, len([v for v in df[column].unique() if not pd.isna(v) and v != ""])))
+    for column in df.columns.drop(["Name", "A_enzyme", "DW"], errors="ignore"):
+        count = (df[column].notna() & ~df[column].isin(empty)).sum()
+        pickups.append(("p20", 1, transfer_tips(volume_dict[column], "p20", int(count))))
+    if sum(mix_last):
+        pickups.append(("p20", 1, len({v for v in df["Name"] if not pd.isna(v) and v not in empty})))
+    return pickups
+
+
+def transformation_tips(workflow):
+    # [(pipette, channels, pickups)] of run_Transformation, recovery mixing and spotting
+    samples = transformation_samples(workflow)
+    if not samples:
+        return []
+    multichannel = multichannel_transformation(workflow)
+    channels = 8 if multichannel else 1
+    moves = len(transformation_columns(workflow)) if multichannel else len(samples)
+    module = PARAMETERS["Parameter"].get("tf_recovery_module", "thermocycler")
+    pickups = [
+        ("p300", channels, 1),
+        ("p20", channels, transfer_tips(TF_VOLUMES["reaction_mix"], "p20", moves)),
+        ("p300", channels, transfer_tips(TF_VOLUMES["media"], "p300", moves)),
+    ]
+    if recovery_offloaded():
+        pickups.append(("p300", channels, transfer_tips(sum(TF_VOLUMES.values()), "p300", moves)))
+    # Mixing on the thermocycler with the mounted pipette, on a temperature module single-channel
+    if module == "thermocycler":
+        pickups.append(("p300", channels, moves))
+    elif module == "temperature":
+        pickups.append(("p300", 1, len(samples)))
+
+    # Dilution and spotting, 8-channel when the TF plates allow it (see spot_samples)
+    multichannel = PARAMETERS["Parameter"].get("tf_multichannel", False)
+    spots = spotting_moves(workflow, multichannel) if multichannel else None
+    channels = 1 if spots is None else 8
+    if spots is None:
+        spots = spotting_moves(workflow)
+    diluted = [(sample, step) for sample, step, _ in spots if step]
+    if diluted:
+        steps = max(step for _, step in diluted)
+        pickups.append(("p300", channels, 1))
+        pickups.append(("p20", channels, transfer_tips(DILUTION[0], "p20", steps * len({s for s, _ in diluted}))))
+    pickups.append(("p20", channels, len(spots)))
+    return pickups
+
+
+def tip_pickups():
+    # Tip pickups of the run {"p20": {channels: pickups}, "p300": {...}}
+    pickups = {"p20": {}, "p300": {}}
+    for workflow in PARAMETERS["Meta"]["workflow"]:
+        if workflow.startswith("Transformation"):
+            moves = transformation_tips(workflow)
+        else:
+            moves = transfer_materials_tips(
+                PARAMETERS["Workflow"][workflow], PARAMETERS["Workflow_volume"][workflow], (2, 15)
+            )
+        for pipette, channels, count in moves:
+            if count:
+                pickups[pipette][channels] = pickups[pipette].get(channels, 0) + count
+    return pickups
+
+
+# [Tracing]
+TRACE_METHODS = {
+    "pipette": [
+        "transfer", "distribute", "consolidate", "mix", "aspirate", "dispense",
+        "blow_out", "touch_tip", "pick_up_tip", "drop_tip", "return_tip", "move_to",
+    ],
+    "thermocycler": [
+        "open_lid", "close_lid", "set_lid_temperature", "deactivate_lid",
+        "set_block_temperature", "execute_profile", "deactivate_block", "deactivate",
+    ],
+    "module": [
+        "set_temperature", "start_set_temperature", "await_temperature", "set_and_wait_for_temperature",
+        "set_target_temperature", "wait_for_temperature", "set_and_wait_for_shake_speed",
+        "deactivate_shaker", "deactivate_heater", "deactivate",
+    ],
+    "protocol": ["delay", "pause", "load_labware", "load_module", "load_instrument"],
+}
+
+
+class Tracer:
+    """Chrome trace (Perfetto) spans of protocol calls.
+
+    Real runs use wall-clock time. In simulation every call returns at once, so
+    leaf operations are timed with DURATION_MODEL instead.
+    """
+
+    def __init__(self, simulating):
+        self.simulating = simulating
+        self.events = []
+        self.virtual = 0.0
+        self.origin = time.perf_counter()
+        self.temperature = 25.0
+        self.tracks = {}
+
+    def now(self):
+        if self.simulating:
+            return self.virtual
+        return time.perf_counter() - self.origin
+
+    def instrument(self, obj, track, category):
+        # Replace methods of `obj` by traced ones.
+        # Bound on the instance, so composite calls (transfer -> aspirate) are traced too.
+        tid = self.tracks.setdefault(track, len(self.tracks) + 1)
+        for method in TRACE_METHODS[category]:
+            if hasattr(obj, method):
+                setattr(obj, method, self.wrap(obj, getattr(obj, method), method, track, tid))
+        return obj
+
+    def wrap(self, obj, func, method, track, tid):
+        def traced(*args, **kwargs):
+            start = self.now()
+            depth = len(self.events)
+            result = func(*args, **kwargs)
+            if self.simulating and len(self.events) == depth:
+                self.virtual += self.model(obj, method, args, kwargs)
+            self.events.append((method, track, tid, start, self.now(), self.describe(obj, method, args, kwargs)))
+            return result
+        return traced
+
+    def model(self, obj, method, args, kwargs):
+        # Planned duration of leaf operation in simulation
+        volume = args[0] if args and isinstance(args[0], (int, float)) else kwargs.get("volume")
+        if method in ["aspirate", "dispense"]:
+            return liquid_seconds(volume or 0, getattr(obj.flow_rate, method))
+        if method == "pick_up_tip":
+            return DURATION_MODEL["tip_pickup"]
+        if method in ["drop_tip", "return_tip"]:
+            return DURATION_MODEL["tip_drop"]
+        if method in ["move_to", "touch_tip"]:
+            return DURATION_MODEL["travel"]
+        if method == "blow_out":
+            return DURATION_MODEL["blow_out"]
+        if method in ["open_lid", "close_lid"]:
+            return DURATION_MODEL["tc_lid"]
+        if method == "set_lid_temperature":
+            return DURATION_MODEL["tc_lid_heat"]
+        if method == "set_block_temperature":
+            step = {
+                "temperature": kwargs.get("temperature", args[0] if args else self.temperature),
+                "seconds": kwargs.get("hold_time_seconds", 0) + 60 * kwargs.get("hold_time_minutes", 0),
+            }
+            seconds = thermocycler_seconds([step], self.temperature)[0]
+            self.temperature = step["temperature"]
+            return seconds
+        if method == "execute_profile":
+            step = {"profile": kwargs["steps"], "repetitions": kwargs["repetitions"]}
+            seconds = thermocycler_seconds([step], self.temperature)[0]
+            self.temperature = kwargs["steps"][-1]["temperature"]
+            return seconds
+        if method == "delay":
+            return kwargs.get("seconds", args[0] if args else 0) + 60 * kwargs.get("minutes", 0)
+        return 0.0
+
+    def describe(self, obj, method, args, kwargs):
+        # Span arguments: pipette, volume, flow rate, source and destination
+        info = {}
+        if hasattr(obj, "flow_rate"):
+            info["pipette"] = obj.name
+            if method in ["aspirate", "dispense", "blow_out"]:
+                info["flow_rate"] = getattr(obj.flow_rate, method)
+        if args and isinstance(args[0], (int, float)):
+            # Modules take the temperature first (set_block_temperature(12)), pipettes the volume
+            info["temperature" if "temperature" in method else "volume"] = args[0]
+        locations = [a for a in args if not isinstance(a, (int, float, str))]
+        locations += [kwargs[k] for k in ["location", "source", "dest"] if k in kwargs]
+        if method in ["transfer", "distribute", "consolidate"] and len(locations) >= 2:
+            info["source"], info["destination"] = locations[0], locations[1]
+        elif method == "aspirate" and locations:
+            info["source"] = locations[0]
+        elif locations:
+            info["destination"] = locations[0]
+        for key in ["source", "destination"]:
+            if key in info:
+                if isinstance(info[key], list):
+                    info[f"{key}_count"] = len(info[key])
+                    info[key] = info[key][0] if info[key] else None
+                info[key] = str(info[key])
+                slot = re.findall(r"on (\d+)", info[key])
+                if slot:
+                    info[f"{key}_slot"] = int(slot[-1])
+        for key in ["temperature", "hold_time_seconds", "hold_time_minutes", "repetitions", "seconds", "minutes"]:
+            if key in kwargs:
+                info[key] = kwargs[key]
+        if method == "execute_profile" and kwargs.get("steps"):
+            info["temperature"] = kwargs["steps"][-1]["temperature"]
+        if method in ["pause", "load_labware", "load_module", "load_instrument"] and args:
+            info["name"] = str(args[0])
+        return info
+
+    def save(self, path, tips=None):
+        # Write Chrome trace JSON (chrome://tracing, ui.perfetto.dev)
+        # `tips` {rack_id: [wells]} picked up by the run go to the tip inventory of the app
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}}
+            for track, tid in self.tracks.items()
+        ]
+        for method, track, tid, start, end, info in self.events:
+            events.append({
+                "name": method, "cat": track, "ph": "X", "pid": 1, "tid": tid,
+                "ts": round(start * 1e6), "dur": round((end - start) * 1e6), "args": info,
+            })
+        with open(path, "w") as f:
+            json.dump({
+                "traceEvents": events,
+                "displayTimeUnit": "ms",
+                "otherData": {"run": RUN_NAME, "simulation": self.simulating, "tips": tips or {}},
+            }, f)
+        logging.info(f"Trace saved: {path}")
+
+
 def run(protocol: protocol_api.ProtocolContext):
 
     # [Functions]
     def discord_message(message, user=PARAMETERS["Meta"]["Messenger"]):
-        if user == "None":
+        logging.info(message)
+        if user == "None" or protocol.is_simulating():
             return None
 
         # Send message to discord chaneel
@@ -156,6 +783,150 @@ def run(protocol: protocol_api.ProtocolContext):
         response = requests.post(url, headers=headers, data=json.dumps(data), verify=False)
 
 
+    def elapsed():
+        # Robot time since protocol start without pauses (planned time in simulation)
+        if protocol.is_simulating():
+            return clock["planned"]
+        return time.time() - clock["start"] - clock["paused"]
+
+
+    def advance(seconds):
+        # Add planned duration of finished step
+        clock["planned"] += seconds
+
+
+    def pace():
+        # Ratio of real to planned time so far, corrects remaining estimates
+        if clock["planned"] < 60:
+            return 1.0
+        return min(max(elapsed() / clock["planned"], 0.5), 3.0)
+
+
+    def eta_text(seconds):
+        # Wall-clock time after `seconds` of planned robot time, at the pace of the run so far
+        seconds *= pace()
+        eta = time.localtime(time.time() + seconds)
+        return f"{time.strftime('%H:%M', eta)} ({round(seconds / 60)} minutes later)"
+
+
+    def pause(message):
+        # Operator time in pause is excluded from the time model
+        start = time.time()
+        protocol.pause(message)
+        clock["paused"] += time.time() - start
+
+
+    def next_action(workflow):
+        # Next user action after the workflow
+        workflows = PARAMETERS["Meta"]["workflow"]
+        index = workflows.index(workflow)
+        if index + 1 == len(workflows):
+            return "Take out products"
+        plan = PARAMETERS["Deck"].get("Reagent_plan", {}).get(workflows[index + 1])
+        if plan is not None:
+            if not plan["pause"] or not PARAMETERS["Parameter"]["stop_reaction"]:
+                return "next step starts without stop"
+            return f"{reagent_message(plan)} for next step"
+        if workflows[index + 1].startswith("Transformation"):
+            return "Take in CP cell for next step"
+        return "Take in Enzyme for next step"
+
+
+    def reagent_message(plan):
+        # What to load and remove at a pause (see reagent_plan.py)
+        message = []
+        if plan["load"]:
+            message.append("Load " + ", ".join(f"{name} ({reagent_wells[name]})" for name in plan["load"]))
+        if plan["remove"]:
+            message.append("Remove " + ", ".join(plan["remove"]))
+        return ", ".join(message)
+
+
+    def run_thermocycler(program, final_volume, notice=None):
+        # Run thermocycler program step by step
+        # notice is sent `notify_lead_time` minutes before the program ends,
+        # splitting the hold or profile running at that moment.
+        # Deferred tasks (recovery mixing and spotting) due during a hold or profile
+        # split it too, the block keeps its temperature while they run.
+        durations = thermocycler_seconds(program, clock["temperature"])
+        lead = float(PARAMETERS["Parameter"].get("notify_lead_time", 5)) * 60
+        notify_at = max(sum(durations) - lead, 0)
+        spent = 0.0
+
+        def send_notice():
+            discord_message(notice.format(eta=eta_text(sum(durations) - spent)))
+
+        def run_part(step, duration, split, late=False):
+            # Run the part of a profile (whole cycles, `late` rounds up) or hold
+            # before `split` seconds of the step, returns the rest of the step
+            if "profile" in step and split > 0:
+                cycles = step["repetitions"] * split / duration
+                cycles = min(int(-(-cycles // 1) if late else cycles), step["repetitions"] - 1)
+                if cycles > 0:
+                    tc_mod.execute_profile(steps=step["profile"], repetitions=cycles,
+                                           block_max_volume=final_volume)
+                    clock["temperature"] = step["profile"][-1]["temperature"]
+                    part = duration * cycles / step["repetitions"]
+                    return dict(step, repetitions=step["repetitions"] - cycles), duration - part, part
+            elif step.get("seconds") and late and split > 0:
+                split = max(split, duration - step["seconds"] + 1)
+            if step.get("seconds") and split > duration - step["seconds"]:
+                first = split - (duration - step["seconds"])
+                tc_mod.set_block_temperature(temperature=step["temperature"],
+                                             hold_time_seconds=first,
+                                             block_max_volume=final_volume)
+                clock["temperature"] = step["temperature"]
+                return dict(step, seconds=step["seconds"] - first), step["seconds"] - first, duration - step["seconds"] + first
+            return step, duration, 0.0
+
+        for step, duration in zip(program, durations):
+            split = notify_at - spent
+            if notice and split < duration:
+                step, duration, part = run_part(step, duration, split)
+                advance(part)
+                spent += part
+                send_notice()
+                notice = None
+
+            while deferred and ("profile" in step or step.get("seconds")):
+                wait = min(due for due, _ in deferred) - elapsed()
+                if wait >= duration:
+                    break
+                step, duration, part = run_part(step, duration, wait, late=True)
+                advance(part)
+                spent += part
+                started, pending = elapsed(), len(deferred)
+                run_deferred()
+                if not part and len(deferred) == pending:
+                    break
+                if part and step.get("seconds"):
+                    # The block held its temperature while the tasks ran
+                    held = min(elapsed() - started, step["seconds"])
+                    step = dict(step, seconds=step["seconds"] - held)
+                    duration -= held
+
+            if "close_lid" in step:
+                tc_mod.close_lid()
+            elif "lid" in step:
+                tc_mod.set_lid_temperature(step["lid"])
+            elif "profile" in step:
+                tc_mod.execute_profile(steps=step["profile"], repetitions=step["repetitions"],
+                                       block_max_volume=final_volume)
+                clock["temperature"] = step["profile"][-1]["temperature"]
+            elif "deactivate_lid" in step:
+                tc_mod.deactivate_lid()
+            elif "seconds" in step:
+                tc_mod.set_block_temperature(temperature=step["temperature"],
+                                             hold_time_seconds=step["seconds"],
+                                             block_max_volume=final_volume)
+                clock["temperature"] = step["temperature"]
+            else:
+                tc_mod.set_block_temperature(step["temperature"])
+                clock["temperature"] = step["temperature"]
+            advance(duration)
+            spent += duration
+
+
     def flow_rate(pipette, **kwargs):
         # Change flow rate of pipette
 
@@ -166,21 +937,110 @@ def run(protocol: protocol_api.ProtocolContext):
             setattr(pipette.flow_rate, i, kwargs[i])
 
 
-    def find_materials_well(material, right_well=False):
+    def find_materials_well(material):
         # Convert material name to well
-        # right_well means well of right side of plate (for abstraction)
         if material.startswith("[E]"):
             return PARAMETERS["Deck"]["Enzyme_position"][material]
 
         for plate in PARAMETERS["Plate"].values():
+            # Plates off deck (plate swap)
+            if plate["Deck"] is None:
+                continue
+            # Agar plates are not a source of liquid
+            if plate["type"] == "Transformation":
+                continue
             for well in plate["data"].keys():
                 if plate["data"][well] == material:
-                    wells = plate["Deck"].wells_by_name()
-                    if right_well:
-                        pos = list(wells.keys()).index(well)
-                        return wells[list(wells)[pos + 8]]
-                    else:
-                        return wells[well]
+                    return plate["Deck"].wells_by_name()[well]
+
+
+    def reagent_sources(material, volume, dest, channels=1):
+        # Split `dest` over the wells holding a reagent [(source well, dest)].
+        # Reservoir wells are used in order while they hold `volume` for every channel.
+        if material not in reservoir_wells:
+            return [(find_materials_well(material), list(dest))]
+        chunks = []
+        for target in dest:
+            wells = reservoir_wells[material]
+            well = next((w for w in wells if reservoir_left[w] >= volume * channels), None)
+            if well is None:
+                well = max(wells, key=reservoir_left.get)
+            reservoir_left[well] -= volume * channels
+            if chunks and chunks[-1][0] == well:
+                chunks[-1][1].append(target)
+            else:
+                chunks.append((well, [target]))
+        return chunks
+
+
+    def source_bottom(well):
+        # Aspirate low in reservoir wells, above the bottom of tubes
+        return well.bottom(z=1 if well in reservoir_left else 3)
+
+
+    def right_well(well):
+        # Same row in the next column of the labware
+        row, column = well.well_name[0], int(well.well_name[1:])
+        wells = well.parent.wells_by_name()
+        assert f"{row}{column + 1}" in wells, f"No right well of {well.well_name} for Transformation"
+        return wells[f"{row}{column + 1}"]
+
+
+    def column_tops(wells):
+        # Top wells of the columns of `wells` (8-channel addresses a column by its top well)
+        tops = []
+        for well in wells:
+            top = well.parent.wells_by_name()["A" + well.well_name[1:]]
+            if top not in tops:
+                tops.append(top)
+        return tops
+
+
+    def set_starting_tips():
+        # First racks may be partially used (tip inventory), also for pipettes mounted later
+        for pipette, key in [(p20, "p20_tip"), (p300, "p300_tip")]:
+            if key in tip_racks:
+                pipette.starting_tip = pipette.tip_racks[0].wells_by_name()[tip_racks[key]["starting_tip"]]
+
+
+    def mount_pipettes(multichannel, note=None):
+        # Swap pipettes on both mounts, 8-channel only for Transformation
+        nonlocal p20, p300
+        kind = "multi" if multichannel else "single"
+        message = f"Mount p20_{kind}_gen2 on left and p300_{kind}_gen2 on right"
+        if note:
+            message += f", {note}"
+        discord_message(f"{workflow}: Protocol Paused, {message}")
+        pause(message)
+        p20 = tracer.instrument(
+            protocol.load_instrument(f"p20_{kind}_gen2", "left", tip_racks=tips["p20"], replace=True),
+            "p20", "pipette",
+        )
+        p300 = tracer.instrument(
+            protocol.load_instrument(f"p300_{kind}_gen2", "right", tip_racks=tips["p300"], replace=True),
+            "p300", "pipette",
+        )
+        set_starting_tips()
+
+
+    def on_deck(material):
+        return material.startswith("[E]") or find_materials_well(material) is not None
+
+
+    def load_session(session):
+        # Swap Source plates for the session (see deck_sessions.py)
+        if not session["load"]:
+            return
+        plates = PARAMETERS["Plate"]
+        message = [f"Remove {plates[key]['name']} from slot {slot}" for key, slot in session["remove"].items()]
+        message += [f"Place {plates[key]['name']} in slot {slot}" for key, slot in session["load"].items()]
+        discord_message(f"{workflow}: Plate swap, " + ", ".join(message))
+        pause(", ".join(message))
+        for key, slot in session["remove"].items():
+            del protocol.deck[str(slot)]
+            plates[key]["Deck"] = None
+        for key, slot in session["load"].items():
+            plates[key]["Deck"] = protocol.load_labware(default_labware, slot, label=plates[key]["name"])
 
 
     def transfer_materials(workflow_df, volume_dict, mix_last=(0, 0)):
@@ -193,21 +1053,24 @@ def run(protocol: protocol_api.ProtocolContext):
             if len(tmp):
                 if pd.isna(dw) or dw == "":
                     continue
-                src = find_materials_well(dw)
                 vol = float(volume_dict["DW"])
                 dest = [find_materials_well(name) for name in tmp["Name"].values]
 
                 # volume에 따라 tip을 달리 사용하도록 하기.
                 flow_rate(p300, aspirate=50, dispense=50, blow_out=20)
-                p300.distribute(
-                    vol,
-                    src,
-                    dest,
-                    new_tip="once",
-                    touch_tip=False,
-                    disposal_volume=5,
-                    blow_out=False,
-                )
+                p300.pick_up_tip()
+                # DW in bulk comes from reservoir wells, one distribute for each well
+                for src, chunk in reagent_sources(dw, vol, dest):
+                    p300.distribute(
+                        vol,
+                        src,
+                        chunk,
+                        new_tip="never",
+                        touch_tip=False,
+                        disposal_volume=5,
+                        blow_out=False,
+                    )
+                p300.drop_tip()
 
         for enzyme_name in df["A_enzyme"].unique():
             tmp = df[df["A_enzyme"] == enzyme_name]
@@ -233,17 +1096,28 @@ def run(protocol: protocol_api.ProtocolContext):
                 )
         # Other Materials
         df.drop(columns=["A_enzyme", "DW"], inplace=True)
-        columns = df.columns
-        for value in df.values:
-            for sample_type, sample_name in zip(columns, value):
+        transfers = []
+        for value in df.to_dict("records"):
+            dest_name = value.pop("Name")
+            for sample_type, sample_name in value.items():
                 # Empty well will be skipped
-                if sample_type == "Name":
-                    dest = find_materials_well(sample_name)
+                if pd.isna(sample_name) or sample_name in ["", "None", "nan"]:
                     continue
-                if pd.isna(sample_name) or sample_name == "":
+                transfers.append((sample_type, sample_name, dest_name))
+
+        # Plates are swapped between sessions when Source plates exceed the deck
+        # Due deferred tasks (recovery mixing and spotting) run between transfers
+        mixed = []
+        done = 0.0
+        for session in PARAMETERS["Deck"].get("Sessions", {}).get(workflow) or [None]:
+            if session:
+                load_session(session)
+            for sample_type, sample_name, dest_name in list(transfers):
+                if not on_deck(sample_name):
                     continue
-
+                transfers.remove((sample_type, sample_name, dest_name))
                 src = find_materials_well(sample_name)
+                dest = find_materials_well(dest_name)
                 vol = float(volume_dict[sample_type])
 
                 # Check DNA or Enzyme
@@ -263,40 +1137,29 @@ def run(protocol: protocol_api.ProtocolContext):
                     blow_out=False,
                     blowout_location="destination well",
                 )
+                advance(transfer_seconds(1, vol, 1))
+                done += transfer_seconds(1, vol, 1)
+                run_deferred()
 
-            # Mix Product
+            # Mix Product when all materials are added
             if sum(mix_last):
-                flow_rate(p20, aspirate=10, dispense=10, blow_out=10)
-                p20.pick_up_tip()
-                for _ in range(mix_last[0]):
-                    p20.aspirate(mix_last[1], dest.bottom())
-                    p20.dispense(mix_last[1], dest.bottom(z=3))
-                p20.drop_tip()
-
-
-    def spotting_dispense(pipette, src, dest: list, spotting_volume=4):
-        # Dispense liquid at the top of well
-        # and then, move down pipette to specific height.
-
-        if not pipette.has_tip:
-            pipette.pick_up_tip()
-
-        disposal_vol = 1
-        whole_vol = spotting_volume * len(dest) + disposal_vol
-        cnt = 0
-        while whole_vol > spotting_volume:
-            if pipette.max_volume < whole_vol:
-                pipette.aspirate(pipette.max_volume, src)
-            else:
-                pipette.aspirate(whole_vol, src)
-
-            while pipette.current_volume > spotting_volume:
-                pipette.dispense(spotting_volume, dest[cnt].bottom(z=4.4))
-                pipette.move_to(dest[cnt].bottom(z=3))
-                cnt += 1
-                whole_vol -= spotting_volume
+                waiting = [t[2] for t in transfers]
+                for dest_name in df["Name"]:
+                    if dest_name in waiting or dest_name in mixed:
+                        continue
+                    if pd.isna(dest_name) or dest_name in ["", "None", "nan"]:
+                        continue
+                    mixed.append(dest_name)
+                    dest = find_materials_well(dest_name)
+                    flow_rate(p20, aspirate=10, dispense=10, blow_out=10)
+                    p20.pick_up_tip()
+                    for _ in range(mix_last[0]):
+                        p20.aspirate(mix_last[1], dest.bottom())
+                        p20.dispense(mix_last[1], dest.bottom(z=3))
+                    p20.drop_tip()
 
-            pipette.blow_out(pipette.trash_container.wells()[0])
+        assert not transfers, f"{workflow}: materials not on deck {[t[1] for t in transfers]}"
+        advance(transfer_materials_seconds(workflow_df, volume_dict, mix_last) - done)
 
 
     def run_PCR(workflow_df, volume_dict):
@@ -304,33 +1167,8 @@ def run(protocol: protocol_api.ProtocolContext):
         transfer_materials(workflow_df=workflow_df, volume_dict=volume_dict, mix_last=(2, 15))
         ## Thermocycler
         discord_message(f"Thermocycler in {workflow} start RUN take off Enzyme")
-        tc_mod.close_lid()
-        tc_mod.set_lid_temperature(95)
-        tc_mod.set_block_temperature(
-            temperature=94, hold_time_seconds=30, block_max_volume=final_volume
-        )
-        profile = [
-            {"temperature": 94, "hold_time_seconds": 20},
-            {
-                "temperature": int(PARAMETERS["Parameter"]["annealing"]),
-                "hold_time_seconds": 20,
-            },
-            {
-                "temperature": 68,
-                "hold_time_seconds": int(PARAMETERS["Parameter"]["pcr_extension"]),
-            },
-        ]
-        tc_mod.execute_profile(steps=profile, repetitions=30, block_max_volume=final_volume)
-        tc_mod.set_block_temperature(
-            temperature=68, hold_time_seconds=60, block_max_volume=final_volume
-        )
-        discord_message(f"{workflow} will be end 5 minutes later, Take in Enzyme for next step")
-        tc_mod.set_block_temperature(
-            temperature=12, hold_time_minutes=5, block_max_volume=final_volume
-        )
-        tc_mod.deactivate_lid()
-        tc_mod.set_block_temperature(12)
-        # End with closed lid
+        run_thermocycler(pcr_program(), final_volume,
+                         notice=f"{workflow} will be end at {{eta}}, {next_action(workflow)}")
 
     def run_Gibson(workflow_df, volume_dict):
         final_volume = sum(map(float, volume_dict.values()))
@@ -339,40 +1177,8 @@ def run(protocol: protocol_api.ProtocolContext):
         discord_message(f"{key}: Thermocycler is running remove Enzyme")
 
         ## Thermocycler
-        tc_mod.close_lid()
-        tc_mod.set_lid_temperature(80)
-
-        ### DpnI
-        tc_mod.set_block_temperature(
-            temperature=37, hold_time_minutes=5, block_max_volume=final_volume
-        )
-        ### denaturation
-        tc_mod.set_block_temperature(
-            temperature=65, hold_time_seconds=20, block_max_volume=final_volume
-        )
-        tc_mod.set_block_temperature(
-            temperature=50,
-            hold_time_minutes=40,
-            block_max_volume=final_volume,
-        )
-        discord_message(
-            f"{workflow} will be end 10 minutes later, Take in CP cell for next step"
-        )
-        # Ramp rate is 0.1 degree per second
-        current_tmp = 50
-        while True:
-            current_tmp -= 5
-
-            if current_tmp <= 12:
-                tc_mod.deactivate_lid()
-                tc_mod.set_block_temperature(12)
-                break
-
-            tc_mod.set_block_temperature(
-                temperature=current_tmp,
-                hold_time_seconds=45,  # ramp_rate is almost 0.1 degree per second
-                block_max_volume=final_volume,
-            )
+        run_thermocycler(gibson_program(), final_volume,
+                         notice=f"{workflow} will be end at {{eta}}, {next_action(workflow)}")
 
 
     def run_GGA(workflow_df, volume_dict):
@@ -380,70 +1186,208 @@ def run(protocol: protocol_api.ProtocolContext):
         transfer_materials(workflow_df=workflow_df, volume_dict=volume_dict, mix_last=(2, 15))
         ## Thermocycler
         discord_message(f"{key}: Thermocycler in PCR start RUN take off Enzyme")
-
-        tc_mod.close_lid()
-        tc_mod.set_lid_temperature(90)
-
-        profile = [
-            {"temperature": 37, "hold_time_seconds": 20},
-            {"temperature": 16, "hold_time_seconds": 20},
+        run_thermocycler(gga_program(), final_volume,
+                         notice=f"{workflow} will be end at {{eta}}, {next_action(workflow)}")
+
+
+    def defer(seconds, task):
+        # Run task after `seconds` of robot time (checked between workflows, material
+        # transfers and during thermocycler holds and profiles)
+        deferred.append((elapsed() + seconds, task))
+
+
+    def run_deferred(wait=False):
+        # Run due deferred tasks, `wait` for the pending ones at the end of protocol
+        for due, task in sorted(deferred, key=lambda item: item[0]):
+            remaining = due - elapsed()
+            if remaining > 0:
+                if not wait:
+                    break
+                protocol.delay(seconds=remaining)
+                advance(remaining)
+            deferred.remove((due, task))
+            task()
+
+
+    def mix_recovery(workflow, wells):
+        # Resuspend cells in the middle of recovery
+        if PARAMETERS["Parameter"].get("tf_recovery_module") == "heatershaker":
+            recovery_mod.set_and_wait_for_shake_speed(500)
+            protocol.delay(seconds=60)
+            recovery_mod.deactivate_shaker()
+        else:
+            flow_rate(p300, aspirate=20, dispense=20, blow_out=100)
+            for well in wells:
+                p300.pick_up_tip()
+                for _ in range(2):
+                    p300.aspirate(40, well)
+                    p300.dispense(40, well.bottom(z=5))
+                p300.drop_tip()
+        advance(transformation_seconds(workflow)["mix"])
+
+
+    def spot_locations(key):
+        # {TF plate well: spot on agar} of a loaded TF plate
+        spec = agar(PARAMETERS["Plate"][key])
+        labware = PARAMETERS["Plate"][key]["Deck"]
+        if len(labware.wells()) == 96:
+            return {name: well.bottom(z=spec["agar_height"]) for name, well in labware.wells_by_name().items()}
+
+        # Grid of spots in each agar well (3 mm margin), filled in column order
+        spots = []
+        for well in labware.wells():
+            if well.diameter:
+                side = (well.diameter - 6) / 2 ** 0.5
+                rows = cols = int(side // spec["pitch"]) + 1
+            else:
+                rows = min(int((well.width - 6) // spec["pitch"]) + 1, 8)
+                cols = min(int((well.length - 6) // spec["pitch"]) + 1, 12)
+            for col in range(cols):
+                for row in range(rows):
+                    spots.append(well.bottom(z=spec["agar_height"]).move(types.Point(
+                        x=(col - (cols - 1) / 2) * spec["pitch"],
+                        y=((rows - 1) / 2 - row) * spec["pitch"],
+                    )))
+        return dict(zip(WELLS_96, spots))
+
+
+    def dilute(workflow, sources, moves):
+        # 10-fold dilution series of transformed cells on TF_dilution plate
+        # {(sample, step): well}, step 0 is the cells themselves
+        wells = {(sample, 0): sources[sample] for sample, step, _ in moves}
+        diluted = [
+            (sample, step) for sample, step, _ in moves if step
         ]
-        tc_mod.execute_profile(steps=profile, repetitions=30, block_max_volume=final_volume)
+        if not diluted:
+            return wells
+        dilution_wells = dilution_plate.wells_by_name()
+        steps = max(step for _, step in diluted)
+        samples = list(dict.fromkeys(sample for sample, _ in diluted))
+        for sample in samples:
+            for step in range(1, steps + 1):
+                wells[(sample, step)] = dilution_wells[dilution_well(workflow, sample, step)]
 
-        discord_message(f"{workflow} will be end 5 minutes later, Take in Enzyme for next step")
-        tc_mod.set_block_temperature(
-            temperature=12, hold_time_minutes=5, block_max_volume=final_volume
-        )
-        tc_mod.deactivate_lid()
-        tc_mod.set_block_temperature(12)
-
-
-    def run_Transformation():
         flow_rate(p300, aspirate=20, dispense=20, blow_out=100)
-        src = find_materials_well("[E]CPcell")
-
-        unique_sample = []
-        for key in PARAMETERS["Plate"].keys():
-            if not key.startswith("Transformation"):
-                continue
+        p300.pick_up_tip()
+        targets = [wells[(sample, step)] for sample in samples for step in range(1, steps + 1)]
+        for diluent, chunk in reagent_sources("[E]SOC", DILUTION[1], targets, p300.channels):
+            p300.distribute(
+                DILUTION[1],
+                source_bottom(diluent),
+                chunk,
+                new_tip="never",
+                disposal_volume=5,
+            )
+        p300.drop_tip()
+        flow_rate(p20, aspirate=7.56, dispense=7.56, blow_out=7.56)
+        for step in range(1, steps + 1):
+            p20.transfer(
+                DILUTION[0],
+                [wells[(sample, step - 1)] for sample in samples],
+                [wells[(sample, step)] for sample in samples],
+                mix_after=(3, 15),
+                new_tip="always",
+            )
+        return wells
+
+
+    def spot_samples(workflow, sources):
+        # Spot transformed cells {sample: well} on TF plates of the workflow (see spotting_moves).
+        # 8-channel when TF plates are laid out in columns, single-channel is mounted afterwards.
+        multichannel = PARAMETERS["Parameter"].get("tf_multichannel", False)
+        moves = spotting_moves(workflow, multichannel)
+        if moves is None:
+            multichannel = False
+            moves = spotting_moves(workflow)
+        if (p20.channels > 1) != multichannel:
+            mount_pipettes(multichannel)
+        wells = dilute(workflow, sources, moves)
+        locations = {key: spot_locations(key) for key in tf_plates(workflow)}
 
-            plate = PARAMETERS["Plate"][key]
-            if plate["type"] == "Transformation":
-                unique_sample += list(plate["data"].values())
-        unique_sample = list(set(unique_sample))
-        if "" in unique_sample:
-            unique_sample.remove("")
-
-        dest = [
-            # use right well of destination plate for CP cell
-            find_materials_well(name, right_well=True)
-            for name in unique_sample
-        ]
+        flow_rate(p20, aspirate=8, dispense=15, blow_out=15)
+        per_aspirate = int((p20.max_volume - SPOT_DISPOSAL) // SPOT_VOLUME)
+        for sample, step, spots in moves:
+            src = wells[(sample, step)]
+            spots = [locations[key][well] for key, well in spots]
+            p20.pick_up_tip()
+            # Mix Sample
+            for _ in range(2):
+                p20.aspirate(20, src)
+                p20.dispense(20, src.bottom(z=4))
+            # Several spots per aspiration, dispense above agar and touch the drop on it
+            for n in range(0, len(spots), per_aspirate):
+                batch = spots[n:n + per_aspirate]
+                p20.aspirate(SPOT_VOLUME * len(batch) + SPOT_DISPOSAL, src)
+                for spot in batch:
+                    p20.dispense(SPOT_VOLUME, spot.move(types.Point(z=1.4)))
+                    p20.move_to(spot)
+                p20.blow_out(p20.trash_container.wells()[0])
+            p20.drop_tip()
+        if p20.channels > 1:
+            mount_pipettes(multichannel=False)
+        advance(transformation_seconds(workflow)["spotting"])
+
+
+    def run_Transformation(workflow, reagent_plan=None):
+        # `reagent_plan` of a pause before the workflow, the 8-channel takes it into its mount pause
+        samples = transformation_samples(workflow)
+        if not samples:
+            return
+        parts = transformation_seconds(workflow)
+        # Single-channel when a product column is not full of samples
+        multichannel = multichannel_transformation(workflow)
+        CP_cell_volume = TF_VOLUMES["cp_cell"]
+        reaction_mix_vol = TF_VOLUMES["reaction_mix"]
+        media_volume = TF_VOLUMES["media"]
+        if recovery_offloaded():
+            # Warm up recovery module during heat shock
+            if PARAMETERS["Parameter"]["tf_recovery_module"] == "heatershaker":
+                recovery_mod.set_target_temperature(37)
+            else:
+                recovery_mod.start_set_temperature(37)
+
+        # CP cell goes to the right well of assembly product
+        products = [find_materials_well(name) for name in samples]
+        sample_wells = [right_well(well) for well in products]
+        if multichannel:
+            # Columns of products to the right columns, 8 samples in a move.
+            # CP cell and SOC come from reservoir wells (see reservoir_plan.py)
+            assert all(name in reservoir_wells for name in ["[E]CPcell", "[E]SOC"]), \
+                f"{workflow}: 8-channel Transformation needs CP cell and SOC in the reservoir"
+            loaded = reagent_plan["load"] if reagent_plan else []
+            note = [reagent_message(reagent_plan)] if reagent_plan else []
+            fill = [f"{name} ({reagent_wells[name]})" for name in ["[E]CPcell", "[E]SOC"] if name not in loaded]
+            if fill:
+                note.append("fill " + ", ".join(fill))
+            mount_pipettes(multichannel=True, note=", ".join(note))
+            products = column_tops(products)
+            dest = [right_well(well) for well in products]
+        else:
+            dest = sample_wells
 
-        CP_cell_volume = 45
-        ## Mix CP cell
+        flow_rate(p300, aspirate=20, dispense=20, blow_out=100)
         p300.pick_up_tip()
-        for _ in range(2):
-            p300.aspirate(25, src)
-            p300.dispense(25, src.bottom(z=10))
-
-        # Transfer CP cell to right well of assembly product
-        p300.distribute(
-            CP_cell_volume,
-            src.bottom(z=3),
-            dest,
-            new_tip="never",
-            touch_tip=False,
-            disposal_volume=10,
-            blow_out=True,
-            blowout_location="source well",
-        )
+        for cp_cell, chunk in reagent_sources("[E]CPcell", CP_cell_volume, dest, p300.channels):
+            ## Mix CP cell
+            for _ in range(2):
+                p300.aspirate(25, cp_cell)
+                p300.dispense(25, cp_cell.bottom(z=10))
+
+            # Transfer CP cell to right well of assembly product
+            p300.distribute(
+                CP_cell_volume,
+                source_bottom(cp_cell),
+                chunk,
+                new_tip="never",
+                touch_tip=False,
+                disposal_volume=10,
+                blow_out=True,
+                blowout_location="source well",
+            )
         p300.drop_tip()
 
         # Transfer Assembly Mix to distributed CP cell
-        src = [find_materials_well(name, "DNA", right_well=False) for name in unique_sample]
-        reaction_mix_vol = 5
-        p20.transfer(reaction_mix_vol, src, dest, new_tip="always", blow_out=False)
+        p20.transfer(reaction_mix_vol, products, dest, new_tip="always", blow_out=False)
 
         tc_mod.close_lid()
         protocol.delay(minutes=10)
@@ -455,145 +1399,224 @@ def run(protocol: protocol_api.ProtocolContext):
             block_max_volume=reaction_mix_vol + CP_cell_volume,
         )
         tc_mod.set_block_temperature(8)
+        clock["temperature"] = 8
         tc_mod.open_lid()
 
-        src = find_materials_well("LB", "DW").bottom(z=3)
-
         # Add media for recovery
-        # start_time = time.time()
-        p300.transfer(
-            100,
-            src,
-            dest,
-            new_tip="always",
-            touch_tip=False,
-            disposal_volume=5,
-            blow_out=False,
-        )
+        for media, chunk in reagent_sources("[E]SOC", media_volume, dest, p300.channels):
+            p300.transfer(
+                media_volume,
+                source_bottom(media),
+                chunk,
+                new_tip="always",
+                touch_tip=False,
+                disposal_volume=5,
+                blow_out=False,
+            )
         protocol.delay(seconds=30)
-        # end_time = time.time()
+        advance(parts["heat_shock"])
 
-        # Duration time in 8 degree
-        # rest_time = 120 - (end_time - start_time)
-        # if rest_time > 0:
-        #    if rest_time < 30:
-        #        protocol.delay(seconds=30)
-        #    else:
-        #        protocol.delay(seconds=rest_time)
+        if recovery_offloaded():
+            # Recovery on module, thermocycler is free for the next workflow.
+            # Mixing and spotting run between the next workflows when they are due.
+            if PARAMETERS["Parameter"]["tf_recovery_module"] == "heatershaker":
+                recovery_mod.wait_for_temperature()
+            else:
+                recovery_mod.await_temperature(37)
+            p300.transfer(
+                CP_cell_volume + reaction_mix_vol + media_volume,
+                dest,
+                [recovery_plate.wells_by_name()[well.well_name] for well in dest],
+                new_tip="always",
+                mix_before=(2, 100),
+                blow_out=False,
+            )
+            advance(parts["move"])
+            if multichannel:
+                mount_pipettes(multichannel=False)
+            wells = [recovery_plate.wells_by_name()[well.well_name] for well in sample_wells]
+            defer(parts["recovery"] / 2, lambda: mix_recovery(workflow, wells))
+            defer(parts["recovery"], lambda: spot_samples(workflow, dict(zip(samples, wells))))
+            discord_message(f"{workflow}: Recovery until {eta_text(parts['recovery'])}, thermocycler is free")
+            return
 
         # Recovery
         tc_mod.set_block_temperature(
             temperature=37,
-            hold_time_minutes=int(int(PARAMETERS["Parameters"]["TF_recovery_time"]) / 2),
+            hold_time_minutes=int(int(PARAMETERS["Parameter"]["tf_recovery"]) / 2),
         )
-
-        for dest_well in dest:
-            p300.pick_up_tip()
-            for _ in range(2):
-                p300.aspirate(40, dest_well)
-                p300.dispense(40, dest_well.bottom(z=5))
-            p300.drop_tip()
-
+        clock["temperature"] = 37
+        mix_recovery(workflow, dest)
         tc_mod.set_block_temperature(
             temperature=37,
-            hold_time_minutes=int(int(PARAMETERS["Parameters"]["TF_recovery_time"]) / 2),
+            hold_time_minutes=int(int(PARAMETERS["Parameter"]["tf_recovery"]) / 2),
         )
-
+        advance(parts["recovery"])
 
         # Spotting
-        spotting_volume = 4
-        flow_rate(p20, aspirate=8, dispense=15, blow_out=15)
-        for i in PARAMETERS["Plates"].keys():
-            plate = PARAMETERS["Plates"][i]
-            if plate["type"] != "TF":
-                continue
-            else:
-                unique_sample = list(set(plate["data"].values()))
-                if "" in unique_sample:
-                    unique_sample.remove("")
-                for sample in unique_sample:
-                    src = find_materials_well(sample, "DNA", right_well=True)
-                    dest = [
-                        plate["Deck"][well]
-                        for well, value in plate["data"].items()
-                        if value == sample
-                    ]
-                    p20.pick_up_tip()
-                    # Mix Sample
-                    for _ in range(3):
-                        p20.aspirate(20, src)
-                        p20.dispense(20, src.bottom(z=4))
-                    # Dispense Sample
-                    spotting_dispense(p20, src, dest, spotting_volume)
-                    # p20.distribute(spotting_volume, src, dest, new_tip="never", touch_tip=False)
-                    p20.drop_tip()
+        spot_samples(workflow, dict(zip(samples, sample_wells)))
         tc_mod.deactivate()
     
     #------------------------------------------------ Protocol Start
-    discord_message(f"Protocol Start: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    tracer = Tracer(protocol.is_simulating())
+    tracer.instrument(protocol, "protocol", "protocol")
+    clock = {"start": time.time(), "planned": 0.0, "paused": 0.0, "temperature": 25.0}
+    deferred = []
+    planned = sum(workflow_seconds(workflow) for workflow in PARAMETERS["Meta"]["workflow"])
+    discord_message(
+        f"Protocol Start: {time.strftime('%Y-%m-%d %H:%M:%S')}, "
+        f"expected end {eta_text(planned)} without pauses"
+    )
     # Deck Setting
     ## Modules
-    tc_mod = protocol.load_module(module_name="thermocyclerModuleV1")
+    tc_mod = tracer.instrument(protocol.load_module(module_name="thermocyclerModuleV1"), "thermocycler", "thermocycler")
     tc_mod.open_lid()
     # enzyme deck is fixed in ot-2
     Enzyme_deck = protocol.load_labware("opentrons_24_tuberack_nest_1.5ml_screwcap", 1)
 
     ## Pipette
-    p20_tip = protocol.load_labware("opentrons_96_tiprack_20ul", 2)
-    p300_tip = protocol.load_labware("opentrons_96_tiprack_300ul", 3)
-
-    p20 = protocol.load_instrument("p20_single_gen2", "left", tip_racks=[p20_tip])
-    p300 = protocol.load_instrument("p300_single_gen2", "right", tip_racks=[p300_tip])
+    # Tip racks from inventory, first rack may be partially used
+    tip_racks = PARAMETERS["Deck"].get("Tip_racks", {})
+    tips = {"p20": [], "p300": []}
+    tip_rack_ids = {}
+    for key, location in PARAMETERS["Deck"]["Deck_position"].items():
+        pipette = key.split("_")[0]
+        if not key.startswith(f"{pipette}_tip") or pipette not in tips:
+            continue
+        rack = tip_racks.get(key, {})
+        tips[pipette].append(protocol.load_labware(
+            f"opentrons_96_tiprack_{pipette[1:]}ul", location, label=rack.get("rack_id")
+        ))
+        if rack.get("rack_id"):
+            tip_rack_ids[rack["rack_id"]] = tips[pipette][-1]
+
+    p20 = protocol.load_instrument("p20_single_gen2", "left", tip_racks=tips["p20"])
+    p300 = protocol.load_instrument("p300_single_gen2", "right", tip_racks=tips["p300"])
+    set_starting_tips()
+    tracer.instrument(p20, "p20", "pipette")
+    tracer.instrument(p300, "p300", "pipette")
 
     ## Enzymes
+    reagent_wells = dict(PARAMETERS["Deck"]["Enzyme_position"])
     for key in PARAMETERS["Deck"]["Enzyme_position"].keys():
         PARAMETERS["Deck"]["Enzyme_position"][key] = Enzyme_deck.wells_by_name()[
             PARAMETERS["Deck"]["Enzyme_position"][key]
         ]
+    # Cold-sensitive enzymes on temperature module
+    if "Enzyme_cold" in PARAMETERS["Deck"]["Deck_position"]:
+        temp_mod = tracer.instrument(
+            protocol.load_module("temperature module gen2", PARAMETERS["Deck"]["Deck_position"]["Enzyme_cold"]),
+            "temperature", "module",
+        )
+        Cold_deck = temp_mod.load_labware("opentrons_24_aluminumblock_nest_1.5ml_snapcap")
+        temp_mod.set_temperature(4)
+        for key, well in PARAMETERS["Deck"].get("Cold_position", {}).items():
+            reagent_wells[key] = f"cold {well}"
+            PARAMETERS["Deck"]["Enzyme_position"][key] = Cold_deck.wells_by_name()[well]
+
+    # Bulk reagents in reservoir wells, uL left above the dead volume of each well
+    reservoir_wells, reservoir_left = {}, {}
+    if "Reservoir" in PARAMETERS["Deck"]["Deck_position"]:
+        reservoir = protocol.load_labware(
+            RESERVOIR["labware"], PARAMETERS["Deck"]["Deck_position"]["Reservoir"], label="Reservoir"
+        )
+        for key, fills in PARAMETERS["Deck"].get("Reservoir_position", {}).items():
+            reagent_wells[key] = "reservoir " + ", ".join(f"{well} {volume} uL" for well, volume in fills.items())
+            reservoir_wells[key] = [reservoir.wells_by_name()[well] for well in fills]
+            for well, volume in zip(reservoir_wells[key], fills.values()):
+                reservoir_left[well] = volume - RESERVOIR["dead_volume"]
+            PARAMETERS["Deck"]["Enzyme_position"][key] = reservoir_wells[key][0]
+
+    # Dilution series of transformed cells before spotting
+    if dilution_steps():
+        dilution_plate = protocol.load_labware(
+            default_labware, PARAMETERS["Deck"]["Deck_position"]["TF_dilution"], label="TF dilution"
+        )
+
+    # Transformation recovery off the thermocycler
+    if recovery_offloaded():
+        location = PARAMETERS["Deck"]["Deck_position"]["Recovery"]
+        if PARAMETERS["Parameter"]["tf_recovery_module"] == "heatershaker":
+            recovery_mod = protocol.load_module("heaterShakerModuleV1", location)
+            recovery_plate = recovery_mod.load_labware("opentrons_96_pcr_adapter_armadillo_wellplate_200ul")
+            recovery_mod.close_labware_latch()
+        else:
+            recovery_mod = protocol.load_module("temperature module gen2", location)
+            recovery_plate = recovery_mod.load_labware("opentrons_96_aluminumblock_biorad_wellplate_200ul")
+        tracer.instrument(recovery_mod, "recovery", "module")
 
     ## Plates
     for key in PARAMETERS["Plate"].keys():
-        location = PARAMETERS["Deck"]["Deck_position"][key]
+        location = PARAMETERS["Deck"]["Deck_position"].get(key)
+        if location is None:
+            # Placed later by plate swap
+            PARAMETERS["Plate"][key]["Deck"] = None
+            continue
         if str(location) == "7":
             PARAMETERS["Plate"][key]["Deck"] = tc_mod.load_labware(default_labware)
             continue
 
-        # TF plate 넣어야 함.
+        labware = default_labware
+        if PARAMETERS["Plate"][key]["type"] == "Transformation":
+            labware = agar(PARAMETERS["Plate"][key])["labware"]
         PARAMETERS["Plate"][key]["Deck"] = protocol.load_labware(
-            default_labware, location=location
+            labware, location=location, label=PARAMETERS["Plate"][key]["name"]
         )
 
     ## Workflows
-    for workflow in PARAMETERS["Meta"]["workflow"]:
-        key = workflow.split('_')[0]
-        assert key in [
-            "PCR",
-            "GGA",
-            "Gibson",
-            "Transformation",
-        ], f"{workflow}: Error Workflow"
+    try:
+        for workflow in PARAMETERS["Meta"]["workflow"]:
+            key = workflow.split('_')[0]
+            assert key in [
+                "PCR",
+                "GGA",
+                "Gibson",
+                "Transformation",
+            ], f"{workflow}: Error Workflow"
+
+            # Recovery mixing and spotting of earlier Transformations
+            run_deferred()
         
-        # Empty workflow를 무시하고 지나갈 수 있어야 함.
-        if PARAMETERS["Parameter"]["stop_reaction"]:
-            # 첫 번째 workflow 전은 stop하지 않음
-            if not workflow == PARAMETERS["Meta"]["workflow"][0]:
-                protocol.pause(f"{workflow}: will be start Place down enzyme")
-                discord_message(f"{workflow}: Protocol Paused please push start button")        
+            # Empty workflow를 무시하고 지나갈 수 있어야 함.
+            reagent_plan = PARAMETERS["Deck"].get("Reagent_plan", {}).get(workflow)
+            # 8-channel Transformation loads its reagents at the pause mounting the pipettes
+            mount_pause = key == "Transformation" and multichannel_transformation(workflow)
+            if PARAMETERS["Parameter"]["stop_reaction"]:
+                # Stop only where enzymes must be loaded
+                if reagent_plan is not None:
+                    if reagent_plan["pause"] and not mount_pause:
+                        discord_message(f"{workflow}: Protocol Paused, {reagent_message(reagent_plan)}")
+                        pause(f"{workflow}: {reagent_message(reagent_plan)}")
+                # 첫 번째 workflow 전은 stop하지 않음
+                elif not workflow == PARAMETERS["Meta"]["workflow"][0]:
+                    discord_message(f"{workflow}: Protocol Paused please push start button")
+                    pause(f"{workflow}: will be start Place down enzyme")
         
-        if key == "Transformation":
-            run_Transformation(workflow_df=PARAMETERS["Workflow"][workflow], volume_dict=PARAMETERS["Workflow_volume"][workflow])
-            continue
+            if key == "Transformation":
+                paused = PARAMETERS["Parameter"]["stop_reaction"] and reagent_plan and reagent_plan["pause"]
+                run_Transformation(workflow, reagent_plan if paused else None)
+                continue
 
-        workflow_df = PARAMETERS["Workflow"][workflow]
-        volume_dict = PARAMETERS["Workflow_volume"][workflow]
+            # Columnar tables and volumes in uL (see load_workflows)
+            workflow_df = PARAMETERS["Workflow"][workflow]
+            volume_dict = PARAMETERS["Workflow_volume"][workflow]
 
-        # key - value 형식으로 변경
-        for i in volume_dict.keys():
-            volume_dict[i] = next(volume_dict[i].values().__iter__())
-            
-        f"run_{key}(workflow_df={workflow_df},volume_dict={volume_dict})"
-        # Run workflow functions
-        eval(f"run_{key}({workflow_df},{volume_dict})")
-        tc_mod.open_lid()
+            # Run workflow functions
+            {"PCR": run_PCR, "GGA": run_GGA, "Gibson": run_Gibson}[key](workflow_df, volume_dict)
+            tc_mod.open_lid()
+
+        run_deferred(wait=True)
+        if recovery_offloaded():
+            if PARAMETERS["Parameter"]["tf_recovery_module"] == "heatershaker":
+                recovery_mod.deactivate_heater()
+                recovery_mod.open_labware_latch()
+            else:
+                recovery_mod.deactivate()
+    finally:
+        # Also when the run stops on an error, tips picked up so far are used
+        tracer.save(os.path.join(LOG_DIR, f"{RUN_NAME}.trace.json"), tips={
+            rack_id: [well.well_name for well in rack.wells() if not well.has_tip]
+            for rack_id, rack in tip_rack_ids.items()
+        })
 
     discord_message(f"Protocol End: {time.strftime('%Y-%m-%d %H:%M:%S')}")
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Reagent-loading plan with the fewest pauses.
+
+Each workflow needs its reagents (`[E]...`) on deck while it is pipetted, and a
+reagent stays usable on deck only for its stability limit. A pause is placed
+before a workflow only when a needed reagent is missing or expired; at each
+pause everything that stays usable until its later use is loaded as well, so
+the next pause comes as late as possible. Cold-sensitive reagents can sit on an
+optional temperature module (4 degree) where they last much longer. A reagent
+which expires before its workflow is pipetted, even loaded at its start, is
+reported in `expires` of the workflow.
+"""
+from data.ot2_cloning.duration_model import workflow_seconds
+
+# Minutes a reagent stays usable on deck, at room temperature and on cold block
+# None means no limit.
+REAGENT_STABILITY = {
+    "[E]DW": {"room": None, "cold": None},
+    "[E]SOC": {"room": None, "cold": None},
+    "[E]Buffer": {"room": 240, "cold": None},
+    "[E]PCRmix": {"room": 60, "cold": 480},
+    "[E]Gibsonmix": {"room": 30, "cold": 480},
+    "[E]BsaI": {"room": 30, "cold": 480},
+    "[E]T4_ligase": {"room": 30, "cold": 480},
+    "[E]CPcell": {"room": 5, "cold": 60},
+}
+DEFAULT_STABILITY = {"room": 30, "cold": 480}
+TF_REAGENTS = ["[E]CPcell", "[E]SOC"]
+EMPTY = ["", "None", "nan", None]
+
+
+def workflow_reagents(export_json):
+    # Reagents used by each workflow, in order
+    reagents = {}
+    for workflow in export_json["Meta"]["workflow"]:
+        if workflow.startswith("Transformation"):
+            reagents[workflow] = list(TF_REAGENTS)
+            continue
+        used = []
+        for values in export_json["Workflow"][workflow]["data"].values():
+            for value in values:
+                if value not in EMPTY and str(value).startswith("[E]") and value not in used:
+                    used.append(value)
+        reagents[workflow] = used
+    return reagents
+
+
+def is_cold(reagent):
+    stability = REAGENT_STABILITY.get(reagent, DEFAULT_STABILITY)
+    return stability["room"] is not None
+
+
+def stability_seconds(reagent, cold_module=False):
+    stability = REAGENT_STABILITY.get(reagent, DEFAULT_STABILITY)
+    minutes = stability["cold"] if cold_module and is_cold(reagent) else stability["room"]
+    return None if minutes is None else minutes * 60
+
+
+def plan_reagents(export_json, cold_module=False, durations=None):
+    """Pause points and what to load/remove at each.
+
+    Returns {workflow: {"pause": bool, "load": [...], "remove": [...], "expires": [...]}},
+    the first workflow lists the initial setup and never pauses. Reagents of a
+    workflow are never removed before it, `expires` lists those of them which
+    do not last until the end of its pipetting.
+    """
+    if durations is None:
+        durations = workflow_seconds(export_json)
+    reagents = workflow_reagents(export_json)
+    workflows = export_json["Meta"]["workflow"]
+
+    # Planned start and end of pipetting (reagents are used at the start of a workflow)
+    start, use_end, t = {}, {}, 0.0
+    for workflow in workflows:
+        start[workflow] = t
+        use_end[workflow] = t + durations[workflow][0]
+        t += durations[workflow][1]
+
+    def valid(reagent, loaded_at, workflow):
+        limit = stability_seconds(reagent, cold_module)
+        return limit is None or loaded_at + limit >= use_end[workflow]
+
+    loaded = {}  # reagent -> load time
+    plan = {}
+    for index, workflow in enumerate(workflows):
+        needed = reagents[workflow]
+        if index and all(r in loaded and valid(r, loaded[r], workflow) for r in needed):
+            plan[workflow] = {"pause": False, "load": [], "remove": [], "expires": []}
+            continue
+
+        # Pause (or initial setup): load what is usable until its later uses
+        now = start[workflow]
+        load = []
+        for later in workflows[index:]:
+            for reagent in reagents[later]:
+                if reagent in load:
+                    continue
+                if reagent in loaded and valid(reagent, loaded[reagent], later):
+                    continue
+                if later != workflow and not valid(reagent, now, later):
+                    continue
+                load.append(reagent)
+                loaded[reagent] = now
+        # Reagents which are not needed anymore (or expired) are taken off,
+        # reagents of this workflow stay even when they expire during it
+        future = {r for later in workflows[index:] for r in reagents[later]}
+        remove = [
+            r for r in loaded if r not in needed and (
+                r not in future or not any(valid(r, loaded[r], w) for w in workflows[index:] if r in reagents[w])
+            )
+        ]
+        for reagent in remove:
+            loaded.pop(reagent)
+        expires = [r for r in needed if not valid(r, loaded[r], workflow)]
+        plan[workflow] = {"pause": bool(index), "load": load, "remove": remove, "expires": expires}
+    return plan
+
+
+def count_pauses(plan):
+    return sum(step["pause"] for step in plan.values())
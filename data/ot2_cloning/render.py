@@ -0,0 +1,219 @@
+"""
+Protocol rendering of export JSON into the protocol_v2 template.
+
+The export JSON is embedded as a Python literal in place of the `PARAMETERS`
+block of the template (checked by parsing it back), nothing else of the
+template is touched. Rendered protocols are content addressed by
+(template version, export JSON) in `.render_cache`, next to the result of
+their simulation, so an identical request is neither rendered nor simulated
+again.
+
+    from data.ot2_cloning.render import render, simulate
+    key, protocol = render(export_json)
+    result = simulate(key)
+"""
+import ast
+import hashlib
+import json
+import math
+import pprint
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from data.ot2_cloning.workflow_schema import upgrade
+
+TEMPLATE_PATH = Path(__file__).parent / "protocol_v2.py"
+CACHE_DIR = Path(__file__).parent / ".render_cache"
+SIMULATE_TIMEOUT = 1800  # seconds
+LOG_LINES = 40
+
+# template path -> (mtime_ns, version, text)
+_templates = {}
+# template path -> (version, code of the planning part)
+_models = {}
+
+
+def load_template(path=TEMPLATE_PATH):
+    # Template text and its version (sha1 of the text), read again only when it changed
+    path = Path(path)
+    mtime = path.stat().st_mtime_ns
+    cached = _templates.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+    text = path.read_text()
+    version = hashlib.sha1(text.encode()).hexdigest()
+    _templates[path] = (mtime, version, text)
+    return version, text
+
+
+def template_code(path=TEMPLATE_PATH):
+    # Code of the module-level planning part of the template: constants and
+    # functions without opentrons, no calls (logging, loading) and no run()
+    version, text = load_template(path)
+    cached = _models.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    tree = ast.parse(text, str(path))
+    opentrons = {alias.asname or alias.name for node in tree.body if isinstance(node, ast.ImportFrom)
+                 and (node.module or "").startswith("opentrons") for alias in node.names}
+    body = []
+    for node in tree.body:
+        if isinstance(node, ast.Import) and not any(a.name.startswith("opentrons") for a in node.names):
+            body.append(node)
+        elif isinstance(node, ast.FunctionDef) and node.name != "run":
+            body.append(node)
+        elif isinstance(node, ast.Assign) and not any(
+            isinstance(n, ast.Name) and n.id in opentrons for n in ast.walk(node.value)
+        ):
+            body.append(node)
+    code = compile(ast.Module(body=body, type_ignores=[]), str(path), "exec")
+    _models[path] = (version, code)
+    return code
+
+
+def template_model(export_json, path=TEMPLATE_PATH):
+    """Planning functions of the template for an export JSON.
+
+    {name: value} of the module level of protocol_v2 (tip model, spotting
+    moves, ...) with PARAMETERS set to the export JSON, so the app plans with
+    the code the robot runs. opentrons is not needed.
+    """
+    model = {"__name__": "protocol_model"}
+    exec(template_code(path), model)
+    model["PARAMETERS"] = upgrade(export_json)
+    return model
+
+
+def plain(value):
+    # JSON-like value of Python literals only, NaN / numpy values to plain ones
+    if isinstance(value, dict):
+        return {str(k): plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def render_key(export_json, template_version):
+    data = json.dumps(plain(export_json), sort_keys=True)
+    return hashlib.sha1(f"{template_version}\n{data}".encode()).hexdigest()
+
+
+def embed(template, export_json):
+    # Template with PARAMETERS replaced by the export JSON
+    parameters = plain(export_json)
+    literal = pprint.pformat(parameters, sort_dicts=False)
+    if ast.literal_eval(literal) != parameters:
+        raise ValueError("Export JSON can not be embedded as a Python literal")
+    start = template.index("PARAMETERS = {")
+    end = template.index("\n}\n", start) + len("\n}\n")
+    protocol = template[:start] + "PARAMETERS = " + literal + "\n" + template[end:]
+    return protocol.replace("{{PRESENT_TIME}}", datetime.now().strftime('%Y-%m-%d'), 1)
+
+
+def render(export_json, template_path=TEMPLATE_PATH, cache_dir=CACHE_DIR):
+    # (key, protocol text), cached protocol when it was rendered before
+    # Export JSON of old schema is converted (see workflow_schema.py)
+    export_json = upgrade(export_json)
+    version, template = load_template(template_path)
+    key = render_key(export_json, version)
+    path = Path(cache_dir) / f"{key}.py"
+    if path.exists():
+        return key, path.read_text()
+    protocol = embed(template, export_json)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(protocol)
+    tmp.replace(path)
+    return key, protocol
+
+
+def cached_protocol(key, cache_dir=CACHE_DIR):
+    # Protocol text of a render key
+    return (Path(cache_dir) / f"{key}.py").read_text()
+
+
+def simulate_command():
+    # opentrons_simulate of PATH, or of the opentrons package of this interpreter
+    command = shutil.which("opentrons_simulate")
+    if command:
+        return [command]
+    try:
+        import opentrons.simulate  # noqa: F401
+    except ImportError:
+        return None
+    return [sys.executable, "-m", "opentrons.simulate"]
+
+
+def traced_tips(trace):
+    # {"p20": n, "p300": n} of pick_up_tip commands in a trace of protocol_v2
+    # (also those of transfers), 8 for each pickup of the 8-channel
+    tips = {}
+    for event in trace["traceEvents"]:
+        if event.get("name") == "pick_up_tip" and event.get("ph") == "X":
+            pipette = event["args"]["pipette"]  # "p20_multi_gen2"
+            name = pipette.split("_")[0]
+            tips[name] = tips.get(name, 0) + (8 if "_multi" in pipette else 1)
+    return tips
+
+
+def simulate(key, cache_dir=CACHE_DIR):
+    """Simulation result of a rendered protocol, cached by its key.
+
+    {"status": "passed" | "failed" | "unavailable", "returncode", "seconds",
+    "tips": {"p20": n, "p300": n}, "error", "log"}, `log` is the tail of the
+    simulation output. Without opentrons the protocol is only compiled, the
+    result is "unavailable" (or "failed" on syntax errors) and not cached.
+    """
+    path = Path(cache_dir) / f"{key}.py"
+    result_path = path.with_suffix(".simulation.json")
+    if result_path.exists():
+        return json.loads(result_path.read_text())
+    command = simulate_command()
+    if command is None:
+        try:
+            compile(path.read_text(), str(path), "exec")
+        except SyntaxError as e:
+            return {"status": "failed", "returncode": None, "seconds": 0, "tips": {},
+                    "error": f"SyntaxError: {e}", "log": str(e)}
+        return {"status": "unavailable", "returncode": None, "seconds": 0, "tips": {},
+                "error": None, "log": "opentrons is not installed, protocol compiled only"}
+
+    start = time.monotonic()
+    # Run logs and traces of the protocol go to a temporary folder
+    tips = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        try:
+            process = subprocess.run(command + [str(path.resolve())], cwd=cwd, capture_output=True,
+                                     text=True, timeout=SIMULATE_TIMEOUT)
+            returncode, output = process.returncode, process.stdout + process.stderr
+        except subprocess.TimeoutExpired:
+            returncode, output = None, f"Simulation timed out after {SIMULATE_TIMEOUT} seconds"
+        # Tips of the commands the simulation ran, the trace is saved also when it failed
+        for trace in Path(cwd).glob("*.trace.json"):
+            try:
+                tips = traced_tips(json.loads(trace.read_text()))
+            except (ValueError, KeyError):
+                pass
+    # Last line of the traceback, e.g. "...ExceptionInProtocolError: OutOfTipsError [line 1200]: ..."
+    errors = [line for line in output.splitlines() if "Error" in line and not line.startswith(" ")]
+    result = {
+        "status": "passed" if returncode == 0 else "failed",
+        "returncode": returncode,
+        "seconds": round(time.monotonic() - start, 1),
+        "tips": tips,
+        "error": errors[-1] if returncode != 0 and errors else None,
+        "log": "\n".join(output.splitlines()[-LOG_LINES:]),
+    }
+    result_path.write_text(json.dumps(result, indent=2))
+    return result
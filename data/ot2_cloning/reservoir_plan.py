@@ -0,0 +1,125 @@
+"""
+Reagent volumes and bulk reagents in a reservoir.
+
+Volumes of each reagent are summed over the workflows, so tubes are filled to
+fit. Bulk reagents (DW, SOC and CP cells) which do not fit a 1.5 mL tube, or
+which the 8-channel takes, go to a 12-well reservoir on the "Reservoir" deck
+slot and fill as many of its wells as their volume needs. protocol_v2 uses the
+reservoir wells in order and splits a distribute over them.
+"""
+from math import ceil
+
+from data.ot2_cloning.render import template_model
+
+TUBE = {"capacity": 1500, "dead_volume": 50}
+# Same labware and dead volume as RESERVOIR in protocol_v2
+RESERVOIR = {
+    "labware": "nest_12_reservoir_15ml",
+    "wells": [f"A{i}" for i in range(1, 13)],
+    "capacity": 15000,
+    "dead_volume": 500,
+}
+BULK_REAGENTS = ["[E]DW", "[E]SOC", "[E]CPcell"]
+TF_REAGENTS = ["[E]CPcell", "[E]SOC"]
+# Same volumes as run_Transformation in protocol_v2 (uL per well)
+CP_CELL_VOLUME = 45
+MEDIA_VOLUME = 100
+DILUENT_VOLUME = 90
+DISPOSAL_VOLUME = 5
+EMPTY = ["", "None", "nan", None]
+
+
+def tf_wells(export_json):
+    # Transformed samples and the wells which get CP cell and SOC
+    # (8-channel fills whole columns right of the products, see protocol_v2)
+    model = template_model(export_json)
+    samples, wells = set(), 0
+    for workflow in export_json["Meta"]["workflow"]:
+        if not workflow.startswith("Transformation"):
+            continue
+        tf_samples = model["transformation_samples"](workflow)
+        samples |= set(tf_samples)
+        if model["multichannel_transformation"](workflow):
+            wells += 8 * len(model["transformation_columns"](workflow))
+        else:
+            wells += len(tf_samples)
+    return samples, wells
+
+
+def reagent_volumes(export_json):
+    # uL of each reagent used by the run, without dead volume of tubes or wells
+    volumes = {}
+
+    def add(reagent, volume):
+        volumes[reagent] = volumes.get(reagent, 0.0) + volume
+
+    for workflow in export_json["Meta"]["workflow"]:
+        if workflow.startswith("Transformation"):
+            continue
+        data = export_json["Workflow"][workflow]["data"]
+        volume_table = export_json["Workflow_volume"].get(workflow, {})
+        for column, values in data.items():
+            if column == "Name" or column not in volume_table:
+                continue
+            volume = float(volume_table[column])
+            used = [v for v in values if v not in EMPTY and str(v).startswith("[E]")]
+            for reagent in used:
+                add(reagent, volume)
+            # DW and A_enzyme are distributed, disposal volume once per reagent
+            if column in ["DW", "A_enzyme"]:
+                for reagent in set(used):
+                    add(reagent, DISPOSAL_VOLUME)
+
+    samples, wells = tf_wells(export_json)
+    if samples:
+        steps = int(export_json["Parameter"].get("tf_dilution", 0))
+        add("[E]CPcell", CP_CELL_VOLUME * wells + 2 * DISPOSAL_VOLUME)
+        add("[E]SOC", MEDIA_VOLUME * wells)
+        if steps:
+            add("[E]SOC", DILUENT_VOLUME * steps * wells + DISPOSAL_VOLUME)
+    return volumes
+
+
+def plan_reservoir(export_json, volumes=None):
+    """Reservoir wells of bulk reagents {reagent: {well: fill volume}}.
+
+    A bulk reagent goes to the reservoir when it does not fit a tube, or when
+    8-channel Transformation takes it. Each well is filled with an equal part
+    plus the dead volume.
+    """
+    if volumes is None:
+        volumes = reagent_volumes(export_json)
+    multichannel = export_json["Parameter"].get("tf_multichannel", False)
+    usable = RESERVOIR["capacity"] - RESERVOIR["dead_volume"]
+    free = list(RESERVOIR["wells"])
+    plan = {}
+    for reagent in BULK_REAGENTS:
+        volume = volumes.get(reagent, 0)
+        if not volume:
+            continue
+        if volume + TUBE["dead_volume"] <= TUBE["capacity"] and not (multichannel and reagent in TF_REAGENTS):
+            continue
+        count = ceil(volume / usable)
+        if count > len(free):
+            raise ValueError("Reservoir is full. Reduce reactions")
+        plan[reagent] = {free.pop(0): round(volume / count + RESERVOIR["dead_volume"]) for _ in range(count)}
+    return plan
+
+
+def fill_volumes(volumes, reservoir):
+    # Rows of what to load: reagent, location and uL with dead volume
+    rows = []
+    for reagent, volume in volumes.items():
+        if reagent in reservoir:
+            location = "Reservoir " + ", ".join(reservoir[reagent])
+            fill = sum(reservoir[reagent].values())
+        else:
+            location = "Tube"
+            fill = round(volume + TUBE["dead_volume"])
+        rows.append({
+            "Reagent": reagent,
+            "Location": location,
+            "Volume (uL)": fill,
+            "Fits": reagent in reservoir or fill <= TUBE["capacity"],
+        })
+    return rows
@@ -0,0 +1,70 @@
+"""
+Background simulation of rendered protocols.
+
+Protocols are simulated by a small thread pool shared by all sessions of the
+app (each simulation runs opentrons in its own process, see render.py), so
+Make Protocol returns at once and the page polls the status. Jobs are keyed by
+the render key (hash of template and export JSON): an export which was
+submitted before is not simulated again, and finished results are kept on disk
+by render.simulate.
+
+    from data.ot2_cloning.simulation_pool import status, submit
+    submit(key)
+    status(key)  # {"status": "queued" | "running" | "passed" | "failed" | "unavailable", ...}
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from data.ot2_cloning.render import simulate
+
+WORKERS = 2
+# Finished jobs kept in memory, older ones are submitted again when asked for
+# (render.simulate returns their results from disk at once)
+MAX_JOBS = 64
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="simulation")
+# render key -> Future of simulate(key), least recently used first
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+def run(key):
+    # Errors of the worker are a failed simulation, not an exception of the page
+    try:
+        return simulate(key)
+    except Exception as e:
+        return {"status": "failed", "returncode": None, "seconds": 0, "tips": {},
+                "error": f"{type(e).__name__}: {e}", "log": ""}
+
+
+def submit(key):
+    # Queue a simulation unless the protocol is queued, running or done
+    with _lock:
+        future = _jobs.get(key)
+        # "unavailable" is not cached by render.simulate, opentrons may be installed later
+        if future is None or (future.done() and future.result()["status"] == "unavailable"):
+            _jobs[key] = _executor.submit(run, key)
+        _jobs.move_to_end(key)
+        # Queued and running jobs are kept
+        finished = [k for k, f in _jobs.items() if f.done()]
+        for k in finished[:max(len(_jobs) - MAX_JOBS, 0)]:
+            del _jobs[k]
+        return _jobs[key]
+
+
+def status(key):
+    with _lock:
+        future = _jobs.get(key)
+        if future is not None:
+            _jobs.move_to_end(key)
+    if future is None:
+        # Evicted, or made by another process
+        future = submit(key)
+    if not future.done():
+        return {"status": "running" if future.running() else "queued"}
+    return future.result()
+
+
+def pending(key):
+    return status(key)["status"] in ["queued", "running"]
@@ -0,0 +1,132 @@
+"""
+Persistent tip-rack inventory across runs.
+
+Racks are labelled with an ID (e.g. `p20-0003`) and `tip_inventory.json` records
+which tips of each rack are used, as reported by the trace of each run (the
+tips it picked up, see protocol_v2 Tracer). A protocol starts from the first
+free tip of a partially used rack (`starting_tip`) and new racks are planned
+only when needed. Tips are picked in column order (A1, B1, ..., H1, A2, ...)
+like the OT-2 does. The 8-channel picks only full columns and single tips fill
+the columns it skipped, so runs with the 8-channel plan tips in whole columns.
+"""
+import json
+from pathlib import Path
+
+from data.ot2_cloning.plate_layout import well_names
+from data.ot2_cloning.render import template_model
+
+INVENTORY_PATH = Path(__file__).parent / "tip_inventory.json"
+
+TIP_RACKS = {
+    "p20": "opentrons_96_tiprack_20ul",
+    "p300": "opentrons_96_tiprack_300ul",
+}
+TIP_WELLS = well_names("96well")
+
+
+def load_inventory(path=INVENTORY_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {"racks": {}, "committed": []}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_inventory(inventory, path=INVENTORY_PATH):
+    with open(path, "w") as f:
+        json.dump(inventory, f, indent=2)
+
+
+def free_tips(rack):
+    # Free tips after the last used one (tips are used in order)
+    used = [TIP_WELLS.index(well) for well in rack["used"]]
+    start = max(used) + 1 if used else 0
+    return TIP_WELLS[start:]
+
+
+def tip_pickups(export_json):
+    """Tip pickups of protocol_v2 for an export JSON.
+
+    {"p20": {channels: pickups}, "p300": {...}}, channels 1 for a single-channel
+    pickup and 8 for a column of the 8-channel pipette. Counted by the tip model
+    of the protocol template itself (see render.template_model).
+    """
+    return template_model(export_json)["tip_pickups"]()
+
+
+def count_tips(export_json):
+    # Tips needed by protocol_v2 for export JSON {"p20": n, "p300": n}
+    return {
+        pipette: sum(channels * count for channels, count in counts.items())
+        for pipette, counts in tip_pickups(export_json).items()
+    }
+
+
+def new_rack_id(inventory, pipette):
+    numbers = [int(i.split("-")[1]) for i in inventory["racks"] if i.startswith(f"{pipette}-")]
+    return f"{pipette}-{max(numbers, default=0) + 1:04d}"
+
+
+def plan_tip_racks(pickups, inventory=None):
+    # Racks and starting tip for each pipette of pickups (see tip_pickups).
+    # Partially used racks go first (fullest first), new racks only when needed.
+    # Keys follow Deck_position: p20_tip, p20_tip_2, ...
+    if inventory is None:
+        inventory = load_inventory()
+    inventory = json.loads(json.dumps(inventory))
+    plan = {}
+    for pipette, counts in pickups.items():
+        singles, columns = counts.get(1, 0), counts.get(8, 0)
+        partial = [
+            (rack_id, free_tips(rack))
+            for rack_id, rack in inventory["racks"].items()
+            if rack["type"] == TIP_RACKS[pipette] and 0 < len(free_tips(rack)) < len(TIP_WELLS)
+        ]
+        partial.sort(key=lambda item: len(item[1]))
+        need = singles
+        if columns:
+            # Whole columns from the starting one, in any order of pickups:
+            # 8-channel columns and the columns filled by single tips
+            offset = TIP_WELLS.index(partial[0][1][0]) % 8 if partial else 0
+            need = 8 * (columns + -(-(singles + offset) // 8)) - offset
+        racks = []
+        # Opentrons only supports starting tip on the first rack of a pipette
+        if partial and need > 0:
+            rack_id, free = partial[0]
+            racks.append({"rack_id": rack_id, "starting_tip": free[0], "tips": min(need, len(free))})
+            need -= racks[-1]["tips"]
+        while need > 0 or not racks:
+            rack_id = new_rack_id(inventory, pipette)
+            inventory["racks"][rack_id] = {"type": TIP_RACKS[pipette], "used": []}
+            racks.append({"rack_id": rack_id, "starting_tip": "A1", "tips": min(need, len(TIP_WELLS))})
+            need -= racks[-1]["tips"]
+
+        for n, rack in enumerate(racks, 1):
+            plan[f"{pipette}_tip" if n == 1 else f"{pipette}_tip_{n}"] = dict(rack, type=TIP_RACKS[pipette])
+    return plan
+
+
+def run_tips(trace):
+    # {rack_id: [wells]} picked up by a run, from its trace (protocol_v2 Tracer)
+    other = trace.get("otherData", {})
+    if other.get("simulation"):
+        raise ValueError("Trace of a simulation, only runs on the robot use tips")
+    if "tips" not in other:
+        raise ValueError("Trace has no tip usage, the protocol was made before the tip inventory")
+    return other["tips"]
+
+
+def commit_run(trace, path=INVENTORY_PATH):
+    # Record tips picked up by a run as used, each run (trace) is recorded once.
+    # Runs which stopped early record only the tips they used.
+    tips = run_tips(trace)
+    run = trace["otherData"].get("run")
+    inventory = load_inventory(path)
+    if run in inventory["committed"]:
+        return inventory
+    for rack_id, wells in tips.items():
+        stored = inventory["racks"].setdefault(rack_id, {"type": TIP_RACKS[rack_id.split("-")[0]], "used": []})
+        stored["used"] = sorted(set(stored["used"]) | set(wells), key=TIP_WELLS.index)
+    inventory["committed"].append(run)
+    save_inventory(inventory, path)
+    return inventory
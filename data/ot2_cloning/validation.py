@@ -0,0 +1,151 @@
+"""
+Validation of export JSON before protocol generation.
+
+Plate contents, products, enzymes and TF targets are indexed once (sets and
+dicts, one index per entry merged for the export), then every rule runs in
+one pass. All errors are returned together as
+{"code", "item", "message"} so large libraries are fixed in one go instead of
+fix-one-rerun-repeat.
+
+    ERROR3  duplicated product
+    ERROR4  product not in Destination plate
+    ERROR5  source DNA not in Source or Destination plate
+    ERROR6  TF target not in Destination plate
+    ERROR7  right well (8-channel: column) of TF target is not empty
+    ERROR8  Source DNA with the name of a product
+    ERROR9  more enzymes than tubes of the rack
+    ERROR14 plates, deck or reservoir can not be planned (reported by the app)
+    ERROR15 workflow table without A_enzyme or DW column
+    ERROR16 plate well outside the 96-well labware of protocol_v2
+"""
+from collections import Counter
+
+from data.ot2_cloning.plate_layout import DECK_FORMAT, LAYOUTS
+from data.ot2_cloning.reagent_plan import is_cold
+
+EMPTY = ["", "None", "nan", None]
+RACK_TUBES = 24  # opentrons_24_tuberack / 24 aluminum block
+
+
+def empty_index():
+    return {
+        "products": [],
+        "dnas": set(),
+        "enzymes": set(),
+        "source": {},
+        "destination": {},
+        "tf_targets": set(),
+    }
+
+
+def index_entry(section, entry):
+    # Index of one Workflow or Plate entry of the export
+    index = empty_index()
+    if section == "Workflow":
+        data = entry["data"]
+        index["products"] += [v for v in data.get("Name", []) if v not in EMPTY]
+        for column, values in data.items():
+            if column == "Name":
+                continue
+            for value in values:
+                if value in EMPTY:
+                    continue
+                index["enzymes" if str(value).startswith("[E]") else "dnas"].add(value)
+        return index
+    key, plate = entry
+    contents = {well: v for well, v in plate["data"].items() if v not in EMPTY}
+    if plate["type"] == "Source":
+        for well, value in contents.items():
+            index["source"].setdefault(value, (key, well))
+    elif plate["type"] == "Destination":
+        for well, value in contents.items():
+            index["destination"].setdefault(value, (key, well))
+    elif plate["type"] == "Transformation":
+        index["tf_targets"] |= set(contents.values())
+    return index
+
+
+def merge_indexes(parts):
+    index = empty_index()
+    for part in parts:
+        index["products"] += part["products"]
+        for name in ["dnas", "enzymes", "tf_targets"]:
+            index[name] |= part[name]
+        for name in ["source", "destination"]:
+            for value, location in part[name].items():
+                index[name].setdefault(value, location)
+    return index
+
+
+def index_export(export_json):
+    # Hashed indexes of what the rules look up
+    return merge_indexes(
+        [index_entry("Workflow", table) for table in export_json["Workflow"].values()]
+        + [index_entry("Plate", item) for item in export_json["Plate"].items()]
+    )
+
+
+def error(code, item, message):
+    return {"code": code, "item": item, "message": f"{code}: {message}"}
+
+
+def validate(export_json, multichannel=False, index=None):
+    # Every error of the export, empty list when it is valid
+    # `index` of the export can be merged from cached entry indexes
+    if index is None:
+        index = index_export(export_json)
+    errors = []
+    products = set(index["products"])
+
+    for product, count in Counter(index["products"]).items():
+        if count > 1:
+            errors.append(error("ERROR3", product, f"Duplicated Product `{product}` ({count} times)!"))
+    for product in products - set(index["destination"]):
+        errors.append(error("ERROR4", product, f"Product `{product}` not in Destination Plate!"))
+    for dna in index["dnas"] - set(index["source"]) - set(index["destination"]):
+        errors.append(error("ERROR5", dna, f"source `{dna}` not in Plate"))
+    for target in index["tf_targets"] - set(index["destination"]):
+        errors.append(error("ERROR6", target, f"TF_product `{target}` not in Destination Plate!"))
+
+    # CP cells go to the right well (8-channel: right column) of TF targets
+    rows = LAYOUTS[DECK_FORMAT]["rows"]
+    for target in index["tf_targets"] & set(index["destination"]):
+        key, well = index["destination"][target]
+        data = export_json["Plate"][key]["data"]
+        column = int(well[1:]) + 1
+        right = [f"{row}{column}" for row in (rows if multichannel else [well[0]])]
+        if column > 12 or any(data.get(i) not in EMPTY for i in right):
+            errors.append(error(
+                "ERROR7", target,
+                f"Right {'column' if multichannel else 'well'} of TF_product `{target}` is not empty!",
+            ))
+
+    # protocol_v2 distributes A_enzyme and DW of every reaction table (empty cells are skipped)
+    for workflow, table in export_json["Workflow"].items():
+        missing = [column for column in ["A_enzyme", "DW"] if column not in table["data"]]
+        if missing:
+            errors.append(error("ERROR15", workflow, f"Workflow `{workflow}` has no {' and '.join(missing)} column!"))
+
+    # Plates are loaded as 96-well labware (Destination plates in the thermocycler)
+    wells = LAYOUTS[DECK_FORMAT]["index"]
+    for key, plate in export_json["Plate"].items():
+        for well in plate["data"]:
+            if well not in wells:
+                errors.append(error(
+                    "ERROR16", f"{key}:{well}", f"Well `{well}` of `{key}` is not in a {DECK_FORMAT} plate!",
+                ))
+
+    for name in set(index["source"]) & products:
+        errors.append(error("ERROR8", name, f"Source `{name}` has the name of a product"))
+
+    # Enzymes which are not on the cold block or in the reservoir go to the tube rack
+    deck = export_json.get("Deck", {})
+    enzymes = set(index["enzymes"])
+    if index["tf_targets"]:
+        enzymes |= {"[E]CPcell", "[E]SOC"}
+    enzymes -= set(deck.get("Reservoir_position", {}))
+    cold = {e for e in enzymes if is_cold(e)} if deck.get("Cold_position") else set()
+    for rack, count in [("Enzyme_position", len(enzymes - cold)), ("Cold_position", len(cold))]:
+        if count > RACK_TUBES:
+            errors.append(error("ERROR9", rack, f"{count} enzymes, only {RACK_TUBES} tubes in the rack"))
+    return errors
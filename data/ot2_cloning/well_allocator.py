@@ -0,0 +1,74 @@
+"""
+Well allocator for Destination and Source plates.
+
+Products of each workflow fill whole columns from a new column (A1, B1, ...,
+H1, A2, ...), so reactions of a workflow are a few 8-channel columns. When a
+Transformation follows, the column right of each final product is kept empty
+for CP cells. Intermediates reused by later workflows are grouped by the
+reaction which uses them first, so the inputs of a reaction sit side by side.
+Sources are placed in order of first use over as many plates as needed.
+"""
+
+from data.ot2_cloning.plate_layout import LAYOUTS
+
+EMPTY = ["", "None", "nan", None]
+ROWS = LAYOUTS["96well"]["rows"]
+COLUMNS = len(LAYOUTS["96well"]["columns"])
+
+
+def materials_of(build):
+    # [(workflow, product, [materials])] in order of reactions
+    reactions = []
+    for workflow, products in build.items():
+        for product, materials in products.items():
+            materials = materials.values() if isinstance(materials, dict) else materials
+            reactions.append((workflow, product, [m for m in materials if m not in EMPTY]))
+    return reactions
+
+
+def first_use(build):
+    # material -> index of the first reaction using it
+    use = {}
+    for index, (_, _, materials) in enumerate(materials_of(build)):
+        for material in materials:
+            use.setdefault(material, index)
+    return use
+
+
+def allocate_destination(build, tf=False):
+    """Destination wells {well: product}.
+
+    build is {workflow: {product: [materials]}} in order of workflows. With
+    `tf`, final products (not reused later) skip the right column.
+    """
+    use = first_use(build)
+    layout = {}
+    column = 1
+    for workflow, products in build.items():
+        intermediates = sorted([p for p in products if p in use], key=use.get)
+        finals = [p for p in products if p not in use]
+        for group, skip in [(intermediates, False), (finals, tf)]:
+            for n in range(0, len(group), len(ROWS)):
+                if column > COLUMNS or (skip and column + 1 > COLUMNS):
+                    raise ValueError("Destination plate is full. Reduce reactions")
+                for row, product in zip(ROWS, group[n:n + len(ROWS)]):
+                    layout[f"{row}{column}"] = product
+                column += 2 if skip else 1
+    return layout
+
+
+def allocate_sources(build):
+    # Source plates [{well: material}], materials in order of first use
+    # DNA only: reagents ([E]) are in tubes and products on Destination plate
+    products = {product for _, product, _ in materials_of(build)}
+    use = first_use(build)
+    sources = [m for m in sorted(use, key=use.get) if not str(m).startswith("[E]") and m not in products]
+    wells = list(LAYOUTS["96well"]["wells"])
+    return [
+        dict(zip(wells, sources[n:n + len(wells)]))
+        for n in range(0, len(sources), len(wells))
+    ]
+
+
+def allocate(build, tf=False):
+    return {"Destination": allocate_destination(build, tf), "Source": allocate_sources(build)}
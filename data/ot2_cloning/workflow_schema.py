@@ -0,0 +1,79 @@
+"""
+Columnar schema of Workflow and Workflow_volume in export JSON.
+
+Schema 2 (Meta "schema": 2) keeps a workflow table as one list per column,
+rows in order, with None for empty cells, and volumes as numbers:
+
+    "Workflow": {"PCR_1": {"type": "PCR", "data": {"Name": ["f1", "f2"], "0": ["t1", None], ...}}}
+    "Workflow_volume": {"PCR_1": {"0": 1.0, "A_enzyme": 12.5, "DW": 10.5}}
+
+Schema 1 was pandas `to_dict()` of stringified tables,
+{"column": {"row": "value"}}, with "None" / "nan" for empty cells and
+volumes in a one-row table. `upgrade` converts it. protocol_v2 loads both with
+`load_workflows`.
+"""
+import pandas as pd
+
+SCHEMA_VERSION = 2
+EMPTY = ["", "None", "nan", None]
+
+
+def null(value):
+    # Empty cells (None, NaN, NA, "", "None", "nan") to None, others as text
+    if not isinstance(value, str) and pd.isna(value):
+        return None
+    if value in EMPTY:
+        return None
+    return str(value)
+
+
+def encode_columns(df):
+    # Table to {column: [values]}, also kept by app sessions instead of DataFrames
+    return {str(column): [null(v) for v in df[column].tolist()] for column in df.columns}
+
+
+def encode_workflow(df, workflow):
+    # Workflow table to {"type", "data": {column: [values]}}
+    return {"type": workflow.split("_")[0], "data": encode_columns(df)}
+
+
+def encode_volume(df):
+    # One-row volume table to {column: uL}
+    volumes = {str(column): null(df[column].iloc[0]) for column in df.columns}
+    if None in volumes.values():
+        raise ValueError("ERROR2: Fill, all of Volume tables!")
+    return {column: float(volume) for column, volume in volumes.items()}
+
+
+def is_columnar(data):
+    return all(isinstance(values, list) for values in data.values())
+
+
+def upgrade_workflow(entry):
+    data = entry["data"]
+    if is_columnar(data):
+        return entry
+    # Rows in order of the table (to_dict keeps it)
+    rows = list(dict.fromkeys(row for values in data.values() for row in values))
+    return dict(entry, data={
+        column: [null(values.get(row)) for row in rows] for column, values in data.items()
+    })
+
+
+def upgrade_volume(volumes):
+    return {
+        column: float(next(iter(value.values())) if isinstance(value, dict) else value)
+        for column, value in volumes.items()
+    }
+
+
+def upgrade(export_json):
+    # Export JSON of schema 1 or 2 in schema 2, input is not modified
+    if export_json.get("Meta", {}).get("schema") == SCHEMA_VERSION:
+        return export_json
+    return dict(
+        export_json,
+        Meta=dict(export_json.get("Meta", {}), schema=SCHEMA_VERSION),
+        Workflow={key: upgrade_workflow(entry) for key, entry in export_json.get("Workflow", {}).items()},
+        Workflow_volume={key: upgrade_volume(v) for key, v in export_json.get("Workflow_volume", {}).items()},
+    )
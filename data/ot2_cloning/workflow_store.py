@@ -0,0 +1,94 @@
+"""
+Backing store of workflow tables in the app.
+
+A workflow table is kept as {column: [values]} (see workflow_schema.py) and
+edited a page at a time: the editor gets only the rows of the page, and its
+changes (edited, added and deleted rows of data_editor) are applied to the
+store as a diff. Search and bulk column operations work on the store, so a
+table of thousands of reactions never goes to the browser as a whole.
+"""
+import pandas as pd
+
+from data.ot2_cloning.workflow_schema import null
+
+FIXED_COLUMNS = ["Name", "A_enzyme", "DW"]
+
+
+def row_count(data):
+    return len(data.get("Name", []))
+
+
+def column_order(columns):
+    # Name, materials by number (0, 1, ..., 10), then reagents
+    def key(column):
+        if column == "Name":
+            return (0, 0, "")
+        if column.isdigit():
+            return (1, int(column), "")
+        return (2, 0, column)
+    return sorted(columns, key=key)
+
+
+def material_columns(data):
+    return [column for column in data if column not in FIXED_COLUMNS]
+
+
+def used_columns(data):
+    # Columns with any material, columns of the volume table
+    return tuple(column for column, values in data.items()
+                 if column != "Name" and any(v is not None for v in values))
+
+
+def filter_rows(data, text="", column=None):
+    # Rows with a cell containing `text` (any column, or `column`), all rows without text
+    rows = range(row_count(data))
+    if not text:
+        return list(rows)
+    text = text.lower()
+    columns = [column] if column else list(data)
+    return [row for row in rows if any(text in str(data[c][row]).lower() for c in columns if data[c][row] is not None)]
+
+
+def page_frame(data, rows):
+    # DataFrame of the rows shown by the editor
+    return pd.DataFrame({column: [values[row] for row in rows] for column, values in data.items()},
+                        columns=column_order(data))
+
+
+def apply_edits(data, rows, edits):
+    """Apply changes of a page editor to the store.
+
+    `edits` is the data_editor state {"edited_rows": {position: {column: value}},
+    "added_rows": [{column: value}], "deleted_rows": [position]}, positions are
+    rows of the page, `rows` their rows in the store.
+    """
+    for position, changes in edits.get("edited_rows", {}).items():
+        for column, value in changes.items():
+            data[column][rows[int(position)]] = null(value)
+    for row in sorted((rows[int(position)] for position in edits.get("deleted_rows", [])), reverse=True):
+        for values in data.values():
+            del values[row]
+    for added in edits.get("added_rows", []):
+        for column, values in data.items():
+            values.append(null(added.get(column)))
+
+
+def add_column(data):
+    # Next material column (no limit), empty
+    numbers = [int(column) for column in data if column.isdigit()]
+    column = str(max(numbers) + 1 if numbers else 0)
+    data[column] = [None] * row_count(data)
+    return column
+
+
+def drop_column(data, column):
+    if column in FIXED_COLUMNS:
+        raise ValueError(f"Column `{column}` can not be removed")
+    del data[column]
+
+
+def fill_column(data, column, value, rows):
+    # Set `column` of `rows` to `value` (empty value clears them)
+    value = null(value)
+    for row in rows:
+        data[column][row] = value
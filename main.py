@@ -1,12 +1,13 @@
+from pathlib import Path
+
 import streamlit as st
 from multiapp import MultiApp
-from data.ot2_cloning import app_v2 as ot2_cloning
 st.set_page_config(layout="wide")
 app = MultiApp()
 
-# Add all your application here
-app.add_app("OT-2 Cloning", ot2_cloning.main)
+# Protocol apps of data/* are found here and imported when selected
+app.discover(Path(__file__).parent / "data")
 
 # The main app
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()
@@ -1,5 +1,58 @@
+import ast
+import importlib
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
 import streamlit as st
 
+# "module:function" -> function, modules are imported once per process
+_loaded = {}
+# title -> {"Import (s)", "Render (s)"} of the last selection
+_timings = {}
+# path -> (mtime_ns, TITLE), app modules are parsed again only when changed
+_titles = {}
+
+
+def app_title(path):
+    # TITLE = "..." of an app module, read without importing it
+    mtime = Path(path).stat().st_mtime_ns
+    if _titles.get(path, (None,))[0] != mtime:
+        title = None
+        for node in ast.parse(Path(path).read_text()).body:
+            if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "TITLE" for t in node.targets):
+                if isinstance(node.value, ast.Constant):
+                    title = node.value.value
+        _titles[path] = (mtime, title)
+    return _titles[path][1]
+
+
+def sizeof(value, seen=None):
+    # Bytes of a value and everything it holds, shared objects counted once
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(k, seen) + sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(v, seen) for v in value)
+    return size
+
+
+def session_memory():
+    # Bytes of each session state entry, largest first
+    seen = set()
+    sizes = [(key, type(value).__name__, sizeof(value, seen)) for key, value in st.session_state.items()]
+    return pd.DataFrame(sizes, columns=["Key", "Type", "Bytes"]).sort_values("Bytes", ascending=False)
+
+
 class MultiApp:
     """Framework for combining multiple streamlit applications.
     Usage:
@@ -12,12 +65,13 @@ class MultiApp:
         app.add_app("Bar", bar)
         app.run()
     It is also possible keep each application in a separate file.
-        import foo
-        import bar
+    Apps given by module path are imported only when selected.
         app = MultiApp()
-        app.add_app("Foo", foo.app)
-        app.add_app("Bar", bar.app)
+        app.add_app("Foo", "foo:app")
+        app.add_app("Bar", "bar:app")
         app.run()
+    Protocol apps of folders (data/*/app*.py with `main`) are found by discover.
+        app.discover("data")
     """
     def __init__(self):
         self.apps = []
@@ -27,7 +81,8 @@ class MultiApp:
         Parameters
         ----------
         func:
-            the python function to render this app.
+            the python function to render this app, or "module:function"
+            imported on first selection.
         title:
             title of the app. Appears in the dropdown in the sidebar.
         """
@@ -36,6 +91,32 @@ class MultiApp:
             "function": func
         })
 
+    def discover(self, root="data"):
+        """Adds protocol apps of root/<protocol>/app*.py, the latest by name.
+        Title is TITLE of the module, or the folder name.
+        """
+        root = Path(root)
+        registered = [app["function"] for app in self.apps]
+        for folder in sorted(i for i in root.iterdir() if i.is_dir()):
+            paths = sorted(folder.glob("app*.py"))
+            if not paths:
+                continue
+            module = ".".join(paths[-1].relative_to(root.parent).with_suffix("").parts)
+            if f"{module}:main" in registered:
+                continue
+            self.add_app(app_title(paths[-1]) or folder.name, f"{module}:main")
+
+    def load(self, app):
+        func = app["function"]
+        if callable(func):
+            return func
+        if func not in _loaded:
+            start = time.perf_counter()
+            module, _, name = func.partition(":")
+            _loaded[func] = getattr(importlib.import_module(module), name or "main")
+            _timings.setdefault(app["title"], {})["Import (s)"] = round(time.perf_counter() - start, 3)
+        return _loaded[func]
+
     def run(self):
         st.sidebar.title("Protocol Maker")
         st.sidebar.subheader("by Seong-Kun Bak *sanekun@kribb.re.kr*")
@@ -48,4 +129,13 @@ class MultiApp:
             self.apps,
             format_func=lambda app: app['title'])
 
-        app['function']()
\ No newline at end of file
+        func = self.load(app)
+        start = time.perf_counter()
+        func()
+        _timings.setdefault(app["title"], {})["Render (s)"] = round(time.perf_counter() - start, 3)
+        if st.sidebar.checkbox("Debug timing", key='debug_timing'):
+            st.sidebar.dataframe([{"App": title, **timing} for title, timing in _timings.items()],
+                                 hide_index=True)
+            memory = session_memory()
+            st.sidebar.markdown(f"Session memory: {memory['Bytes'].sum() / 1024:.1f} kB")
+            st.sidebar.dataframe(memory.head(10), hide_index=True)
@@ -0,0 +1,34 @@
+import json
+import sqlite3
+from contextlib import closing
+
+from data.ot2_cloning import catalog
+
+PROJECT = {"Build": {"PCR": {"f1": {"DNA1": "t1", "DNA2": "p1"}}}}
+
+
+def test_refresh_indexes_once(tmp_path):
+    (tmp_path / "demo.json").write_text(json.dumps(PROJECT))
+    catalog.refresh(tmp_path)
+    # A refresh which finds nothing changed does not index the project again
+    catalog.refresh(tmp_path)
+    with closing(sqlite3.connect(tmp_path / catalog.INDEX_NAME)) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM products").fetchone() == (1,)
+        assert connection.execute("SELECT COUNT(*) FROM materials").fetchone() == (2,)
+    assert catalog.search("p1", tmp_path) == [tmp_path / "demo.json"]
+    assert catalog.tasks("demo", tmp_path) == "PCR, Transformation"
+
+
+def test_unreadable_projects(tmp_path):
+    (tmp_path / "demo.json").write_text(json.dumps(PROJECT))
+    (tmp_path / "broken.json").write_text("{")
+    (tmp_path / "other.json").write_text(json.dumps({"Plates": {}}))
+
+    assert catalog.list_projects(tmp_path) == [tmp_path / "demo.json"]
+    errors = catalog.unreadable(tmp_path)
+    assert set(errors) == {"broken", "other"}
+    assert errors["other"].startswith("KeyError")
+
+    (tmp_path / "broken.json").write_text(json.dumps(PROJECT))
+    assert catalog.unreadable(tmp_path) == {"other": errors["other"]}
+    assert catalog.list_projects(tmp_path) == [tmp_path / "broken.json", tmp_path / "demo.json"]
@@ -0,0 +1,27 @@
+from data.ot2_cloning.duration_model import collect, fit
+
+
+def test_collect_positional_temperature():
+    # set_block_temperature(12) after a 95 C hold ramps down from 95, not from 25
+    spans = [
+        ("set_block_temperature", "thermocycler", 0.0, 50.0, {"temperature": 95, "hold_time_seconds": 10}),
+        ("set_block_temperature", "thermocycler", 50.0, 91.5, {"temperature": 12}),
+        # Traces of older versions kept the positional temperature as volume
+        ("set_block_temperature", "thermocycler", 91.5, 103.5, {"volume": 36}),
+    ]
+    stats = {}
+    collect(spans, stats)
+    assert stats["tc_ramp"][0] == 3
+    # changes of 70, 83 and 24 degrees
+    assert stats["tc_ramp"][1] == 70 + 83 + 24
+
+
+def test_collect_profile_temperature():
+    spans = [
+        ("execute_profile", "thermocycler", 0.0, 600.0, {"temperature": 68, "repetitions": 30}),
+        ("set_block_temperature", "thermocycler", 600.0, 628.0, {"temperature": 12}),
+    ]
+    stats = {}
+    collect(spans, stats)
+    assert stats["tc_ramp"][:3] == [1, 56, 28.0]
+    assert fit(stats)["tc_ramp_rate"] == 2.0
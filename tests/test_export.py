@@ -0,0 +1,43 @@
+import pytest
+
+from data.ot2_cloning.export import deck_position
+
+
+def export_json(module="heatershaker", multichannel=False, tf_plates=1):
+    return {
+        "Meta": {"workflow": ["PCR_1", "Transformation_2"]},
+        "Plate": {
+            "Source_1": {"type": "Source", "data": {"A1": "t1", "B1": "p1"}},
+            "Destination_1": {"type": "Destination", "data": {"A1": "f1"}},
+            **{f"Transformation_2_{n}": {"type": "Transformation", "data": {"A1": "f1"}}
+               for n in range(1, tf_plates + 1)},
+        },
+        "Workflow": {"PCR_1": {"type": "PCR", "data": {
+            "Name": ["f1"], "0": ["t1"], "1": ["p1"], "A_enzyme": ["[E]PCRmix"], "DW": ["[E]DW"],
+        }}},
+        "Parameter": {"tf_recovery_module": module, "tf_multichannel": multichannel},
+    }
+
+
+def test_deck_position():
+    deck, sessions = deck_position(export_json(module="thermocycler"), [])
+
+    assert deck == {"Enzyme_tube": 1, "p20_tip": 2, "p300_tip": 3, "Destination_1": 7,
+                    "Transformation_2_1": 4, "Source_1": 5}
+    assert list(sessions) == ["PCR_1", "Transformation_2"]
+
+
+@pytest.mark.parametrize("multichannel", [False, True])
+def test_heater_shaker_slot(multichannel):
+    # Never in slot 4, in front of the thermocycler
+    deck, _ = deck_position(export_json(multichannel=multichannel), ["Recovery", "Reservoir"])
+
+    assert deck["Recovery"] == 6
+    if multichannel:
+        # 8-channel can not reach labware beside the heater-shaker
+        assert deck["Reservoir"] not in [3, 5, 9]
+
+
+def test_deck_full():
+    with pytest.raises(ValueError, match="Deck is already Full"):
+        deck_position(export_json(module="thermocycler", tf_plates=5), [])
@@ -0,0 +1,63 @@
+import io
+
+import pytest
+
+from data.ot2_cloning.importer import import_plate, import_workflow, read_chunks
+
+
+def chunks(text, chunk_rows=2):
+    return read_chunks(io.StringIO(text), "x.csv", chunk_rows)
+
+
+def test_import_workflow():
+    text = (
+        "Product,Template,Primer F,Water\n"
+        "f1,t1,p1,DW\n"
+        ",,,\n"
+        ",t2,p2,\n"
+        "f1,t3,p3,\n"
+        "f2,,,\n"
+        "f3,t4,,\n"
+    )
+    data, errors = import_workflow(chunks(text), defaults={"A_enzyme": "[E]PCRmix"})
+
+    assert data == {
+        "Name": ["f1", "f3"],
+        "0": ["t1", "t4"],
+        "1": ["p1", None],
+        "A_enzyme": ["[E]PCRmix", "[E]PCRmix"],
+        "DW": ["DW", None],
+    }
+    assert [(e["code"], e["item"]) for e in errors] == [("ERROR10", "row 4"), ("ERROR3", "f1"), ("ERROR11", "f2")]
+
+
+def test_import_workflow_header_only():
+    data, errors = import_workflow(chunks("Name,Template\n"))
+    assert data == {"Name": [], "0": [], "A_enzyme": [], "DW": []}
+    assert errors == []
+
+
+def test_import_plate_long():
+    text = "Well,DNA\nA01,t1\nb2,p1\nI1,p2\nA1,t2\nC3,\n"
+    wells, errors = import_plate(chunks(text))
+
+    assert wells == {"A1": "t1", "B2": "p1"}
+    assert [(e["code"], e["item"]) for e in errors] == [("ERROR12", "I1"), ("ERROR13", "A1")]
+
+
+def test_import_plate_wide():
+    text = "Row,1,2,13\nA,t1,,x\nB,,p1,\n"
+    wells, errors = import_plate(chunks(text))
+
+    assert wells == {"A1": "t1", "B2": "p1"}
+    assert [(e["code"], e["item"]) for e in errors] == [("ERROR12", "A13")]
+
+
+def test_import_plate_without_wells():
+    with pytest.raises(ValueError, match="ERROR12"):
+        import_plate(chunks("Name,DNA\nt1,x\n"))
+
+
+def test_read_chunks_suffix():
+    with pytest.raises(ValueError, match="Only .csv and .xlsx"):
+        list(read_chunks(io.StringIO(""), "x.txt"))
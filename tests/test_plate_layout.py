@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+from data.ot2_cloning.importer import import_plate, read_chunks
+from data.ot2_cloning.plate_layout import LAYOUTS, from_wells, to_long, to_wells, to_wide
+from data.ot2_cloning.validation import validate
+
+
+@pytest.mark.parametrize("plate_type, rows, last", [
+    ("96well", 8, "H12"), ("384well", 16, "P24"), ("1536well", 32, "AF48"),
+])
+def test_layouts(plate_type, rows, last):
+    layout = LAYOUTS[plate_type]
+    assert len(layout["rows"]) == rows
+    assert layout["wells"][-1] == last
+    assert layout["position"][last] == (rows - 1, len(layout["columns"]) - 1)
+
+
+@pytest.mark.parametrize("plate_type", ["96well", "384well", "1536well"])
+def test_long_wide_round_trip(plate_type):
+    wells = {"A1": "t1", "B2": "p1", LAYOUTS[plate_type]["wells"][-1]: "p2"}
+    wide = from_wells(wells, plate_type, wide=True)
+
+    assert wide.shape == (len(LAYOUTS[plate_type]["rows"]), len(LAYOUTS[plate_type]["columns"]))
+    assert wide.loc["B", 2] == "p1"
+    assert to_wells(to_long(wide)) == wells
+    assert to_wells(wide) == wells
+    assert to_wide(from_wells(wells, plate_type)).equals(wide)
+
+
+def test_import_384_plate():
+    chunks = read_chunks(io.StringIO("Well,DNA\nP24,t1\nQ1,t2\n"), "x.csv")
+    wells, errors = import_plate(chunks, plate_type="384well")
+
+    assert wells == {"P24": "t1"}
+    assert [(e["code"], e["item"]) for e in errors] == [("ERROR12", "Q1")]
+
+
+def test_deck_plates_are_96_well():
+    export_json = {"Meta": {"workflow": []}, "Workflow": {},
+                   "Plate": {"Source_1": {"type": "Source", "data": {"A1": "t1", "P24": "t2"}}}}
+    assert [(e["code"], e["item"]) for e in validate(export_json)] == [("ERROR16", "Source_1:P24")]
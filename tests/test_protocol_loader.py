@@ -0,0 +1,89 @@
+import pytest
+
+from data.ot2_cloning.protocol_loader import index_archive, load_protocol, migrate, migrate_v1
+
+V1_EXPORT = {
+    "Plates": {
+        "source_0": {"name": "DNA", "type": "source", "data": {"A1": "t1", "B1": "p1", "C1": "p2"}},
+        "Reaction_0": {"name": "Reactions", "type": "Reaction", "data": {"A1": "f1", "A2": "g1"}},
+        "TF_0": {"name": "Agar", "type": "TF", "data": {"A1": "g1"}},
+        "TF_1": {"name": "Unused", "type": "TF", "data": {}},
+    },
+    "Reactions": {
+        "PCR_0": {"name": "PCR_0", "type": "PCR", "data": {
+            "Name": {"0": "f1"}, "DNA1": {"0": "t1"}, "DNA2": {"0": "p1"}, "DNA3": {"0": "p2"},
+            "Enzyme1": {"0": "PCRmix"}, "DW": {"0": "DW"},
+        }},
+        "Assembly_1": {"name": "Assembly_1", "type": "Assembly", "data": {
+            "Name": {"0": "g1"}, "DNA1": {"0": "f1"}, "Enzyme1": {"0": "[E]Gibsonmix"}, "DW": {"0": "nan"},
+        }},
+        "Assembly_2": {"name": "Assembly_2", "type": "Assembly", "data": {"Name": {"0": "nan"}}},
+    },
+    "Reaction_volume": {
+        "PCR": {"DNA1": 1, "DNA2": 0.5, "DNA3": 0.5, "Enzyme1": 12.5, "DW": 10.5},
+        "Assembly": {"DNA1": 2, "Enzyme1": 5, "DW": 1},
+    },
+    "Deck": {},
+    "Parameters": {"protocol": "OT-2 cloning", "Stop_between_reactions": False, "TF_recovery_time": 60},
+}
+
+
+def test_migrate_v1():
+    export_json = migrate_v1(V1_EXPORT)
+
+    assert export_json["Meta"]["workflow"] == ["PCR_1", "Gibson_2", "Transformation_3"]
+    assert export_json["Workflow"]["PCR_1"]["data"] == {
+        "Name": ["f1"], "0": ["t1"], "1": ["p1"], "2": ["p2"], "A_enzyme": ["[E]PCRmix"], "DW": ["[E]DW"],
+    }
+    assert export_json["Workflow"]["Gibson_2"]["data"] == {
+        "Name": ["g1"], "0": ["f1"], "A_enzyme": ["[E]Gibsonmix"], "DW": [None],
+    }
+    assert export_json["Workflow_volume"]["PCR_1"] == {"0": 1.0, "1": 0.5, "2": 0.5, "A_enzyme": 12.5, "DW": 10.5}
+    # Empty TF plates are dropped, the others belong to the Transformation workflow
+    assert set(export_json["Plate"]) == {"Source_1", "Destination_1", "Transformation_3_1"}
+    assert export_json["Plate"]["Transformation_3_1"]["data"] == {"A1": "g1"}
+    assert export_json["Parameter"]["stop_reaction"] is False
+    assert export_json["Parameter"]["tf_recovery"] == 60
+
+
+def test_migrate_other_task():
+    with pytest.raises(ValueError, match="OT-2 cloning"):
+        migrate(dict(V1_EXPORT, Parameters={"protocol": "Nanopore"}))
+
+
+def test_load_protocol_is_not_run(tmp_path):
+    marker = tmp_path / "ran"
+    text = (
+        f"open({str(marker)!r}, 'w').write('ran')\n"
+        f"PARAMETERS = {V1_EXPORT!r}\n"
+        "PARAMETERS['Reactions']['PCR_0']['data']['DNA3'] = {'0': nan}\n"
+    )
+    export_json = load_protocol(text)
+    assert export_json["Workflow"]["PCR_1"]["data"]["2"] == ["p2"]
+    assert not marker.exists()
+
+
+def test_load_protocol_errors():
+    with pytest.raises(ValueError, match="No PARAMETERS"):
+        load_protocol("metadata = {}\n")
+    with pytest.raises(ValueError, match="not a literal"):
+        load_protocol("PARAMETERS = dict(a=1)\n")
+    with pytest.raises(ValueError, match="not a literal"):
+        load_protocol("PARAMETERS = {[1]: 2}\n")
+    with pytest.raises(ValueError, match="can not be parsed"):
+        load_protocol("PARAMETERS = {\n")
+
+
+def test_index_archive(tmp_path):
+    (tmp_path / "v1.py").write_text(f"metadata = {{'protocolName': 'Old run'}}\nPARAMETERS = {V1_EXPORT!r}\n")
+    (tmp_path / "broken.py").write_text("PARAMETERS = {\n")
+
+    index = index_archive(tmp_path, workers=1)
+    assert index["v1.py"]["name"] == "Old run"
+    assert index["v1.py"]["products"] == ["f1", "g1"]
+    assert index["broken.py"]["error"]
+    assert (tmp_path / ".protocols.json").exists()
+    assert not list(tmp_path.glob("*.tmp"))
+
+    (tmp_path / "broken.py").unlink()
+    assert list(index_archive(tmp_path, workers=1)) == ["v1.py"]
@@ -0,0 +1,32 @@
+from data.ot2_cloning.reagent_plan import count_pauses, plan_reagents
+
+EXPORT_JSON = {
+    "Meta": {"workflow": ["PCR_1", "PCR_2", "Transformation_3"]},
+    "Workflow": {
+        "PCR_1": {"type": "PCR", "data": {"Name": ["f1"], "0": ["t1"], "A_enzyme": ["[E]PCRmix"], "DW": ["[E]DW"]}},
+        "PCR_2": {"type": "PCR", "data": {"Name": ["f2"], "0": ["f1"], "A_enzyme": ["[E]PCRmix"], "DW": ["[E]DW"]}},
+    },
+}
+# {workflow: (pipetting, total)} seconds
+DURATIONS = {"PCR_1": (600, 3600), "PCR_2": (600, 3600), "Transformation_3": (900, 1800)}
+
+
+def test_plan_reagents():
+    plan = plan_reagents(EXPORT_JSON, durations=DURATIONS)
+
+    assert plan["PCR_1"] == {"pause": False, "load": ["[E]PCRmix", "[E]DW", "[E]SOC"], "remove": [], "expires": []}
+    # PCRmix (60 min) does not last until PCR_2 is pipetted
+    assert plan["PCR_2"] == {"pause": True, "load": ["[E]PCRmix"], "remove": [], "expires": []}
+    # CPcell (5 min) expires during the 15 min of pipetting but is kept on deck
+    assert plan["Transformation_3"] == {
+        "pause": True, "load": ["[E]CPcell"], "remove": ["[E]PCRmix", "[E]DW"], "expires": ["[E]CPcell"],
+    }
+    assert count_pauses(plan) == 2
+
+
+def test_plan_reagents_cold_module():
+    plan = plan_reagents(EXPORT_JSON, cold_module=True, durations=DURATIONS)
+
+    assert not plan["PCR_2"]["pause"]
+    assert plan["Transformation_3"]["expires"] == []
+    assert count_pauses(plan) == 1
@@ -0,0 +1,17 @@
+from data.ot2_cloning.render import traced_tips
+
+
+def event(name, pipette):
+    return {"name": name, "ph": "X", "tid": 3, "ts": 0, "dur": 1, "args": {"pipette": pipette}}
+
+
+def test_traced_tips():
+    trace = {"traceEvents": [
+        event("transfer", "p20_single_gen2"),
+        event("pick_up_tip", "p20_single_gen2"),
+        event("pick_up_tip", "p20_single_gen2"),
+        event("pick_up_tip", "p300_multi_gen2"),
+        event("drop_tip", "p300_multi_gen2"),
+        {"name": "thread_name", "ph": "M", "tid": 3, "args": {"name": "p20"}},
+    ]}
+    assert traced_tips(trace) == {"p20": 2, "p300": 8}
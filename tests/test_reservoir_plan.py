@@ -0,0 +1,29 @@
+from data.ot2_cloning.reservoir_plan import tf_wells
+
+
+def export_json(tf_plate):
+    products = [f"pA{n}" for n in range(1, 9)]
+    return {
+        "Meta": {"workflow": ["Gibson_1", "Transformation_2"]},
+        "Plate": {
+            "Destination_1": {"type": "Destination", "data": dict(zip([f"{r}1" for r in "ABCDEFGH"], products))},
+            "Transformation_2_1": {"type": "Transformation", "data": tf_plate},
+        },
+        "Workflow": {},
+        "Workflow_volume": {},
+        "Parameter": {"tf_multichannel": True, "tf_recovery_module": "thermocycler"},
+    }
+
+
+def test_tf_wells_full_column():
+    # 8-channel fills the column right of the products
+    samples, wells = tf_wells(export_json({f"A{n}": f"pA{n}" for n in range(1, 9)}))
+    assert len(samples) == 8
+    assert wells == 8
+
+
+def test_tf_wells_partial_column():
+    # Product column with other products: single-channel, CP cells only for the samples
+    samples, wells = tf_wells(export_json({"A1": "pA1", "B1": "pA3"}))
+    assert samples == {"pA1", "pA3"}
+    assert wells == 2
@@ -0,0 +1,16 @@
+from data.ot2_cloning import simulation_pool
+
+
+def test_finished_jobs_are_evicted(monkeypatch):
+    monkeypatch.setattr(simulation_pool, "simulate", lambda key: {"status": "passed", "tips": {}, "key": key})
+    monkeypatch.setattr(simulation_pool, "MAX_JOBS", 2)
+    monkeypatch.setattr(simulation_pool, "_jobs", simulation_pool.OrderedDict())
+
+    for key in ["a", "b", "c"]:
+        simulation_pool.submit(key).result()
+    simulation_pool.submit("d").result()
+    assert list(simulation_pool._jobs) == ["c", "d"]
+    # The status of an evicted job submits it again
+    simulation_pool.status("a")
+    assert simulation_pool._jobs["a"].result()["key"] == "a"
+    assert list(simulation_pool._jobs) == ["d", "a"]
@@ -0,0 +1,101 @@
+import pytest
+
+from data.ot2_cloning.tip_inventory import TIP_WELLS, commit_run, count_tips, load_inventory, plan_tip_racks
+
+MULTI_TF = {f"{row}{column}": f"pA{n + 1}" for column in (1, 2, 3) for n, row in enumerate("ABCDEFGH")}
+SINGLE_TF = {"A1": "pA1", "B1": "pA1", "C1": "pA2", "D1": "pA3", "E1": "pA3", "F1": "pA3", "G1": "pA8"}
+
+
+def export_json(tf_plate, **parameter):
+    # 4 PCR products assembled into pA1..pA8 in column 2 of the Destination plate
+    products = [f"pA{n}" for n in range(1, 9)]
+    return {
+        "Meta": {"workflow": ["PCR_1", "Gibson_2", "Transformation_3"]},
+        "Plate": {
+            "Destination_1": {"type": "Destination", "data": {
+                "A1": "f2", "B1": "f3", "C1": "f4", "D1": "f1", **{f"{row}2": p for row, p in zip("ABCDEFGH", products)},
+            }},
+            "Transformation_3_1": {"type": "Transformation", "agar": "96well", "data": tf_plate},
+        },
+        "Workflow": {
+            "PCR_1": {"type": "PCR", "data": {
+                "Name": ["f1", "f2", "f3", "f4"], "0": ["t1", "t2", "t0", "t1"],
+                "1": ["p2", "p4", "p6", "p8"], "2": ["p3", "p5", "p7", "p9"],
+                "A_enzyme": ["[E]PCRmix"] * 4, "DW": ["[E]DW"] * 4,
+            }},
+            "Gibson_2": {"type": "Gibson", "data": {
+                "Name": products, "0": [f"f{n % 4 + 1}" for n in range(1, 9)], "1": ["vec"] * 8,
+                "A_enzyme": ["[E]Gibsonmix"] * 8, "DW": ["[E]DW"] * 8,
+            }},
+        },
+        "Workflow_volume": {
+            "PCR_1": {"0": 1.0, "1": 0.5, "2": 0.5, "A_enzyme": 12.5, "DW": 10.5},
+            "Gibson_2": {"0": 2.0, "1": 2.0, "A_enzyme": 5.0, "DW": 1.0},
+        },
+        "Parameter": dict({"tf_recovery_module": "thermocycler", "tf_multichannel": False, "tf_dilution": 0},
+                          **parameter),
+    }
+
+
+# Expected tips of each case, from opentrons_simulate of the rendered protocols
+# (not run by the tests, opentrons is not a dependency of the app)
+@pytest.mark.parametrize("tf_plate, parameter, tips", [
+    (MULTI_TF, {"tf_multichannel": True, "tf_dilution": 2}, {"p20": 88, "p300": 36}),
+    (MULTI_TF, {"tf_multichannel": True, "tf_recovery_module": "temperature"}, {"p20": 56, "p300": 36}),
+    (MULTI_TF, {"tf_multichannel": True, "tf_recovery_module": "heatershaker"}, {"p20": 56, "p300": 28}),
+    (SINGLE_TF, {"tf_dilution": 2, "tf_recovery_module": "temperature"}, {"p20": 55, "p300": 18}),
+    (SINGLE_TF, {"tf_recovery_module": "heatershaker"}, {"p20": 48, "p300": 13}),
+    # Product column 2 is not full of samples, Transformation falls back to single-channel
+    (SINGLE_TF, {"tf_multichannel": True, "tf_dilution": 1}, {"p20": 52, "p300": 14}),
+])
+def test_count_tips(tf_plate, parameter, tips):
+    assert count_tips(export_json(tf_plate, **parameter)) == tips
+
+
+def test_count_tips_split_transfers():
+    # p20 transfers over 20 uL take a tip for each part
+    export = export_json({})
+    export["Workflow_volume"]["PCR_1"]["0"] = 45.0
+    assert count_tips(export)["p20"] == count_tips(export_json({}))["p20"] + 4 * 2
+
+
+def test_plan_tip_racks_partial_rack():
+    inventory = {"racks": {"p20-0001": {"type": "opentrons_96_tiprack_20ul", "used": TIP_WELLS[:19]}},
+                 "committed": []}
+    plan = plan_tip_racks({"p20": {1: 40, 8: 2}}, inventory)
+
+    # Column 3 is started, 2 columns of the 8-channel and 40 single tips end on a column
+    assert plan["p20_tip"] == {"rack_id": "p20-0001", "starting_tip": "D3", "tips": 61,
+                               "type": "opentrons_96_tiprack_20ul"}
+    assert list(plan) == ["p20_tip"]
+
+
+def test_plan_tip_racks_new_racks():
+    plan = plan_tip_racks({"p20": {1: 100}, "p300": {}}, {"racks": {}, "committed": []})
+
+    assert [(rack["rack_id"], rack["tips"]) for rack in plan.values()] == [
+        ("p20-0001", 96), ("p20-0002", 4), ("p300-0001", 0),
+    ]
+
+
+def test_commit_run(tmp_path):
+    path = tmp_path / "tip_inventory.json"
+    trace = {"traceEvents": [], "otherData": {"run": "run_1", "simulation": False, "tips": {
+        "p20-0001": TIP_WELLS[:10], "p300-0001": ["A1", "C1"],
+    }}}
+
+    commit_run(trace, path)
+    inventory = commit_run(trace, path)
+    assert inventory["racks"]["p20-0001"] == {"type": "opentrons_96_tiprack_20ul", "used": TIP_WELLS[:10]}
+    assert inventory["committed"] == ["run_1"]
+
+    # Next run starts after the last used tip
+    plan = plan_tip_racks({"p20": {1: 4}, "p300": {1: 1}}, load_inventory(path))
+    assert plan["p20_tip"]["starting_tip"] == TIP_WELLS[10]
+    assert plan["p300_tip"]["starting_tip"] == "D1"
+
+
+def test_commit_run_of_simulation(tmp_path):
+    trace = {"traceEvents": [], "otherData": {"run": "run_1", "simulation": True, "tips": {}}}
+    with pytest.raises(ValueError, match="simulation"):
+        commit_run(trace, tmp_path / "tip_inventory.json")
@@ -0,0 +1,57 @@
+import copy
+
+import pandas as pd
+import pytest
+
+from data.ot2_cloning.workflow_schema import SCHEMA_VERSION, encode_volume, null, upgrade, upgrade_workflow
+
+SCHEMA_1 = {
+    "Meta": {"Task": "OT-2 cloning", "workflow": ["PCR_1"]},
+    "Workflow": {"PCR_1": {"type": "PCR", "data": {
+        "Name": {"0": "f1", "1": "f2"},
+        "0": {"0": "t1", "1": "t2"},
+        "1": {"0": "p1", "1": "None"},
+        "A_enzyme": {"0": "[E]PCRmix", "1": "[E]PCRmix"},
+        "DW": {"0": "[E]DW", "1": "nan"},
+    }}},
+    "Workflow_volume": {"PCR_1": {"0": {"0": "1"}, "1": {"0": "0.5"}, "A_enzyme": {"0": "12.5"}, "DW": {"0": "10.5"}}},
+}
+
+
+def test_upgrade_schema_1():
+    original = copy.deepcopy(SCHEMA_1)
+    export_json = upgrade(SCHEMA_1)
+
+    assert export_json["Meta"]["schema"] == SCHEMA_VERSION
+    assert export_json["Workflow"]["PCR_1"] == {"type": "PCR", "data": {
+        "Name": ["f1", "f2"],
+        "0": ["t1", "t2"],
+        "1": ["p1", None],
+        "A_enzyme": ["[E]PCRmix", "[E]PCRmix"],
+        "DW": ["[E]DW", None],
+    }}
+    assert export_json["Workflow_volume"]["PCR_1"] == {"0": 1.0, "1": 0.5, "A_enzyme": 12.5, "DW": 10.5}
+    assert SCHEMA_1 == original
+
+
+def test_upgrade_schema_2_unchanged():
+    export_json = upgrade(SCHEMA_1)
+    assert upgrade(export_json) is export_json
+    entry = export_json["Workflow"]["PCR_1"]
+    assert upgrade_workflow(entry) is entry
+
+
+def test_upgrade_workflow_keeps_row_order():
+    entry = {"data": {"Name": {"2": "c", "0": "a", "1": "b"}, "0": {"0": "x", "2": "z"}}}
+    assert upgrade_workflow(entry)["data"] == {"Name": ["c", "a", "b"], "0": ["z", "x", None]}
+
+
+@pytest.mark.parametrize("value", [None, float("nan"), pd.NA, "", "None", "nan"])
+def test_null(value):
+    assert null(value) is None
+
+
+def test_encode_volume():
+    assert encode_volume(pd.DataFrame({"0": ["1"], "DW": [10.5]})) == {"0": 1.0, "DW": 10.5}
+    with pytest.raises(ValueError, match="ERROR2"):
+        encode_volume(pd.DataFrame({"0": ["1"], "DW": [None]}))
@@ -0,0 +1,48 @@
+import pytest
+
+from data.ot2_cloning.workflow_store import add_column, apply_edits, drop_column, filter_rows
+
+
+def table():
+    return {
+        "Name": ["f1", "f2", "f3", "f4"],
+        "0": ["t1", "t2", "t3", "t4"],
+        "A_enzyme": ["[E]PCRmix"] * 4,
+        "DW": ["[E]DW"] * 4,
+    }
+
+
+def test_apply_edits():
+    data = table()
+    # Page of f2..f4, positions are rows of the page
+    rows = [1, 2, 3]
+    edits = {
+        "edited_rows": {"0": {"0": "t9"}, "2": {"DW": ""}},
+        "deleted_rows": [1, 0],
+        "added_rows": [{"Name": "f5", "0": "t5"}],
+    }
+    apply_edits(data, rows, edits)
+
+    assert data == {
+        "Name": ["f1", "f4", "f5"],
+        "0": ["t1", "t4", "t5"],
+        "A_enzyme": ["[E]PCRmix", "[E]PCRmix", None],
+        "DW": ["[E]DW", None, None],
+    }
+
+
+def test_filter_rows():
+    data = table()
+    assert filter_rows(data) == [0, 1, 2, 3]
+    assert filter_rows(data, "T3") == [2]
+    assert filter_rows(data, "f", "0") == []
+
+
+def test_columns():
+    data = table()
+    assert add_column(data) == "1"
+    assert data["1"] == [None] * 4
+    drop_column(data, "0")
+    assert add_column(data) == "2"
+    with pytest.raises(ValueError, match="can not be removed"):
+        drop_column(data, "DW")